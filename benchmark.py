@@ -0,0 +1,899 @@
+"""
+效能基準測試
+
+子命令:
+    scrape        以 HAR 重播運行完整的股票循環，報告每個股票的耗時
+    parse-args    比較 Plotly.newPlot 參數解析的新舊實作 (預設使用最大的 SPX 匯出文件)
+    extract-html  比較 BeautifulSoup、位元組搜尋與 ijson 串流解碼取得 Plotly 數據的耗時與記憶體峰值
+    ladder        比較 Gamma 加總與前 N% 選取的 Python 與 NumPy 實作 (產生的 1k-100k 履約價)
+    fixtures      產生結構與平台匯出相同的 Gamma_<股票>_<日期>.html (內嵌 plotly.js、N 個 bar trace、M 個履約價、各水平標註)
+    pipeline      逐個階段 (locate/parse/extract/stream/soup/process) 測量 files/s、MB/s 與 RSS 峰值
+    tokenizer     比較 TV Code 水平格式 (長轉短、短轉長、put_dom_trade 讀取) 的新舊解析，預設使用一年的 tvcode 文件
+    compare       比較兩次 --output 保存的結果
+
+範例:
+    python benchmark.py scrape --har har/platform.zip --runs 3 --workers 2
+    python benchmark.py scrape --har har/platform.zip --server --latency-ms 50 --output bench.json
+    python benchmark.py parse-args --ticker SPX --top 3
+    python benchmark.py parse-args --synthetic 20000
+    python benchmark.py extract-html --ticker SPX --top 3
+    python benchmark.py ladder --sizes 1000 10000 100000
+    python benchmark.py fixtures --out-dir /tmp/gex_fixtures --tickers SPX QQQ --days 10 --strikes 5000
+    python benchmark.py pipeline --output bench/pipeline_before.json
+    python benchmark.py pipeline --dir /tmp/gex_fixtures --stages locate extract stream --output bench/after.json
+    python benchmark.py tokenizer --days 252
+    python benchmark.py compare bench/pipeline_before.json bench/pipeline_after.json
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import math
+import random
+import tracemalloc
+import argparse
+import statistics
+import tempfile
+from datetime import datetime, timedelta
+
+DEFAULT_GEX_DIR = "/home/ben/pCloudDrive/stock/GEX/GEX_file"
+
+def load_config(config_file):
+    """載入配置文件，失敗時返回空字典"""
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"載入配置文件失敗: {str(e)}")
+        return {}
+
+def write_results(output, results):
+    """將測試結果寫入 JSON 文件"""
+    if not output:
+        return
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n測試結果已保存到 {output}")
+
+def best_time(func, repeat):
+    """執行 repeat 次，返回最短耗時 (秒) 與最後一次的結果"""
+    best = None
+    result = None
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def legacy_parse_arguments(args_string):
+    """原本逐字元累加字串的 parse_arguments，僅供比較"""
+    args = []
+    bracket_count = 0
+    in_quotes = False
+    current = ""
+    
+    for i, char in enumerate(args_string):
+        if char == '"' and args_string[i-1:i] != '\\':
+            in_quotes = not in_quotes
+        
+        if not in_quotes:
+            if char in "{[":
+                bracket_count += 1
+            if char in "]}":
+                bracket_count -= 1
+        
+        if char == "," and bracket_count == 0 and not in_quotes:
+            try:
+                args.append(json.loads(current.strip()))
+            except json.JSONDecodeError:
+                print(f"無法解析為 JSON: {current.strip()}")
+            current = ""
+        else:
+            current += char
+    
+    if current.strip():
+        try:
+            args.append(json.loads(current.strip()))
+        except json.JSONDecodeError:
+            print(f"無法解析為 JSON: {current.strip()}")
+    
+    return args
+
+def legacy_convert_to_short(input_text):
+    """原本 gamma_converter 以子字串逐個比對 level_mapping 的 convert_to_short，僅供比較"""
+    import re
+    from level_codes import LEVEL_CODES as level_mapping
+    
+    stocks = [s.strip() for s in input_text.strip().split('\n\n') if s.strip()]
+    result = []
+    for stock in stocks:
+        symbol = stock.split(':')[0].strip()
+        price_levels = {}
+        pairs = re.findall(r'([^,]+),\s*([\d.]+)', stock)
+        for level, price in pairs:
+            price = float(price)
+            level = level.strip()
+            has_ce = ' CE' in level
+            sub_levels = [l.strip() for l in level.replace(' CE', '').split('&')]
+            for sub_level in sub_levels:
+                for full_name, code in level_mapping.items():
+                    if full_name in sub_level:
+                        if price not in price_levels:
+                            price_levels[price] = set()
+                        price_levels[price].add(code + 'CE' if has_ce else code)
+                        break
+        output_parts = [symbol + ':']
+        for price, codes in sorted(price_levels.items()):
+            output_parts.append(f"{','.join(sorted(list(codes)))}={price}")
+        result.append(''.join(output_parts))
+    return '\n'.join(result)
+
+def legacy_convert_to_long(input_text):
+    """原本 gamma_converter 的 convert_to_long，僅供比較"""
+    import re
+    from level_codes import LEVEL_NAMES as reverse_mapping
+    
+    result = []
+    lines = [l.strip() for l in input_text.strip().split('\n') if l.strip()]
+    for line in lines:
+        if re.match(r'^=+\s+\w+\s+=+$', line) or ':' not in line:
+            continue
+        symbol, data = line.split(':', 1)
+        symbol = symbol.strip()
+        levels = []
+        for codes, price in re.findall(r'([^=]+)=(\d+\.?\d*)', data):
+            price = float(price)
+            codes = [c.strip() for c in codes.split(',') if c.strip()]
+            full_names = []
+            for code in codes:
+                if code.endswith('CE'):
+                    base_code = code[:-2]
+                    if base_code in reverse_mapping:
+                        full_names.append(reverse_mapping[base_code] + ' CE')
+                elif code in reverse_mapping:
+                    full_names.append(reverse_mapping[code])
+            if full_names:
+                levels.append(f"{' & '.join(full_names)}, {price}")
+        if levels:
+            result.append(f"{symbol}: {', '.join(levels)}")
+    return '\n\n'.join(result)
+
+def legacy_short_levels(line):
+    """原本 put_dom_trade.parse_price_levels 逐字元累加數字的解析，僅供比較"""
+    parts = line.split(':')
+    if len(parts) < 2:
+        return None
+    levels = {}
+    items = parts[1].split('=')
+    for i in range(len(items) - 1):
+        current_item = items[i]
+        value = ""
+        for char in items[i + 1]:
+            if char.isdigit() or char == '.':
+                value += char
+            else:
+                break
+        if value:
+            value = float(value)
+            if i == 0:
+                labels = current_item.split(',')
+            else:
+                prev_value = ""
+                for char in current_item:
+                    if char.isdigit() or char == '.':
+                        prev_value += char
+                    else:
+                        break
+                labels = current_item[len(prev_value):].split(',')
+            for label in labels:
+                label = label.strip()
+                if label:
+                    levels[label] = value
+    return parts[0], levels
+
+def synthetic_tvcode(tickers, seed=0):
+    """產生一天的長格式 TV Code 文字，每個股票約 10 個水平，包含以 & 合併與 CE 後綴的標籤"""
+    from level_codes import LEVEL_CODES
+    
+    rng = random.Random(seed)
+    names = list(LEVEL_CODES)
+    blocks = []
+    for ticker in tickers:
+        base = rng.uniform(20, 6000)
+        levels = []
+        for _ in range(rng.randint(6, 14)):
+            label = ' & '.join(rng.sample(names, rng.choice((1, 1, 1, 2))))
+            if rng.random() < 0.3:
+                label += ' CE'
+            levels.append(f"{label}, {round(base * rng.uniform(0.9, 1.1), rng.choice((0, 1, 2)))}")
+        blocks.append(f"{ticker.upper()}: {', '.join(levels)}")
+    return '\n\n'.join(blocks)
+
+def synthetic_figure(strikes, seed=0, traces=2):
+    """產生與 Gamma 匯出頁面結構相同的 Plotly.newPlot 參數 [div id, data, layout]
+
+    Gamma 取整到千位，讓前 N% 選取時出現相同的數值；layout 含 Δ 25、Γ Field、Γ Flip、Call Wall、Put Wall 標註。
+    """
+    rng = random.Random(seed)
+    prices = [round(4000 + i * 0.5, 1) for i in range(strikes)]
+    names = ["Calls", "Puts"][:traces] + [f"Expiry {i}" for i in range(3, traces + 1)]
+    data = [
+        {"type": "bar", "orientation": "h", "name": name, "y": prices,
+         "x": [round(rng.uniform(-1e6, 1e6), -3) for _ in prices],
+         "hovertemplate": "Strike: %{y}<br>Gamma: %{x:.2f}<extra>\"" + name + "\"</extra>"}
+        for name in names
+    ]
+    levels = {
+        "\u0393 Field": prices[strikes // 2], "\u0393 Flip": prices[strikes * 2 // 5],
+        "Call Wall": prices[strikes * 3 // 5], "Put Wall": prices[strikes // 3]
+    }
+    layout = {
+        "title": {"text": "Gamma Exposure"},
+        "annotations": [{"text": f"Level {i}", "y": prices[i * strikes // 6], "x": 0} for i in range(6)] +
+                       [{"text": "\u0394 25", "xanchor": "right", "x": 1.2e6 * max(1, traces // 2), "y": 0}] +
+                       [{"text": text, "xanchor": "right", "y": price, "x": 0} for text, price in levels.items()],
+        "shapes": [{"type": "line", "y0": prices[strikes // 2], "y1": prices[strikes // 2]}]
+    }
+    return ["gamma-plot", data, layout]
+
+def synthetic_newplot_arguments(strikes, seed=0):
+    """產生與 Gamma 匯出頁面結構相同的 Plotly.newPlot 參數字串"""
+    div_id, data, layout = synthetic_figure(strikes, seed)
+    return (f' {json.dumps(div_id)}, {json.dumps(data)}, {json.dumps(layout)}, '
+            f'{{"responsive": true}} ')
+
+def synthetic_plotly_js(size, seed=0):
+    """產生約 size bytes、類似內嵌 plotly.js 的腳本內容 (含 plotly.js 標頭與 Plotly.newPlot 字樣)"""
+    rng = random.Random(seed)
+    parts = ["/** plotly.js v2.35.2, MIT License */\n!function(t){"]
+    length = len(parts[0])
+    words = ["newPlot", "react", "restyle", "relayout", "extendTraces", "Plotly.newPlot", "_fullLayout",
+             "annotations", "bar", "hovertemplate", "calcdata", "d3.select"]
+    while length < size:
+        part = (f"function {rng.choice(words).replace('.', '_')}{rng.randrange(1 << 20):x}(e,r){{"
+                f"var n=e._{rng.choice(words).replace('.', '_')}||{rng.random():.6f};"
+                f"return r&&r[\"{rng.choice(words)}\"]?n*{rng.randrange(1000)}:n}};")
+        parts.append(part)
+        length += len(part)
+    parts.append("}(window);")
+    return ''.join(parts)
+
+def synthetic_export_html(strikes, seed=0, traces=2, plotly_js=None):
+    """產生與平台匯出相同結構的 Gamma_<股票>_<日期>.html 內容: 內嵌 plotly.js 後接 Plotly.newPlot 呼叫"""
+    div_id, data, layout = synthetic_figure(strikes, seed, traces)
+    if plotly_js is None:
+        plotly_js = synthetic_plotly_js(3_500_000, seed)
+    return ('<html>\n<head><meta charset="utf-8" /></head>\n<body>\n'
+            '<div>\n<script type="text/javascript">window.PlotlyConfig = {MathJaxConfig: \'local\'};</script>\n'
+            f'<script charset="utf-8" type="text/javascript">{plotly_js}</script>\n'
+            f'<div id="{div_id}" class="plotly-graph-div" style="height:100%; width:100%;"></div>\n'
+            '<script type="text/javascript">\n'
+            '    window.PLOTLYENV=window.PLOTLYENV || {};\n'
+            f'    if (document.getElementById("{div_id}")) {{'
+            f'        Plotly.newPlot(                        "{div_id}",                        '
+            f'{json.dumps(data)},                        {json.dumps(layout)},                        '
+            '{"responsive": true}                    )                };\n'
+            '</script>\n</div>\n</body>\n</html>\n')
+
+def business_days(start, count):
+    """從 start (YYYYMMDD) 起的 count 個工作日"""
+    day = datetime.strptime(start, '%Y%m%d')
+    days = []
+    while len(days) < count:
+        if day.weekday() < 5:
+            days.append(day.strftime('%Y%m%d'))
+        day += timedelta(days=1)
+    return days
+
+def write_fixtures(out_dir, tickers, days, start, strikes, traces, plotly_mb, seed=0):
+    """在 out_dir/<股票>/html/ 產生 Gamma_<股票>_<日期>.html，返回文件路徑列表"""
+    plotly_js = synthetic_plotly_js(int(plotly_mb * 1024 * 1024), seed)
+    files = []
+    for n, ticker in enumerate(tickers):
+        html_dir = os.path.join(out_dir, ticker.upper(), "html")
+        os.makedirs(html_dir, exist_ok=True)
+        for m, date_str in enumerate(business_days(start, days)):
+            path = os.path.join(html_dir, f"Gamma_{ticker.upper()}_{date_str}.html")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(synthetic_export_html(strikes, seed + n * 1000 + m, traces, plotly_js))
+            files.append(path)
+    return files
+
+def largest_exports(gex_dir, ticker, top):
+    """找出指定股票最大的幾個 Gamma HTML 匯出文件"""
+    pattern = os.path.join(gex_dir, ticker.upper(), "html", f"Gamma_{ticker.upper()}_*.html")
+    files = sorted(glob.glob(pattern), key=os.path.getsize, reverse=True)
+    return files[:top]
+
+def measure(func):
+    """執行一次，返回耗時 (秒)、Python 記憶體配置峰值 (bytes) 與結果"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = func()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+def bench_parse_args(args):
+    """比較 parse_arguments 新舊實作在每個文件上的耗時"""
+    from extract_gamma_from_html import parse_arguments
+
+    inputs = []
+    if args.synthetic:
+        inputs.append((f"synthetic ({args.synthetic} strikes)", synthetic_newplot_arguments(args.synthetic)))
+    from extract_gamma_from_html import read_newplot_arguments
+
+    files = args.files or ([] if args.synthetic else largest_exports(args.gex_dir, args.ticker, args.top))
+    for path in files:
+        args_string = read_newplot_arguments(path)
+        if args_string is None:
+            print(f"略過 {path}: 未找到 Plotly.newPlot")
+            continue
+        inputs.append((os.path.basename(path), args_string))
+    if not inputs:
+        print("沒有可測試的文件，請指定 --files 或 --synthetic")
+        return 1
+
+    results = []
+    print(f"  {'file':<36}{'size(MB)':>10}{'legacy(s)':>11}{'new(s)':>9}{'speedup':>9}  same")
+    for name, args_string in inputs:
+        legacy_time, legacy_args = best_time(lambda: legacy_parse_arguments(args_string), args.repeat)
+        new_time, new_args = best_time(lambda: parse_arguments(args_string), args.repeat)
+        same = legacy_args == new_args
+        size_mb = len(args_string) / 1024 / 1024
+        print(f"  {name:<36}{size_mb:>10.2f}{legacy_time:>11.3f}{new_time:>9.3f}"
+              f"{legacy_time / max(new_time, 1e-9):>8.1f}x  {'yes' if same else 'NO'}")
+        results.append({'file': name, 'size': len(args_string), 'legacy': round(legacy_time, 4),
+                        'new': round(new_time, 4), 'same': same})
+
+    write_results(args.output, {
+        'benchmark': 'parse-args',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'repeat': args.repeat,
+        'results': results
+    })
+    return 0 if all(result['same'] for result in results) else 1
+
+def bench_extract_html(args):
+    """比較 BeautifulSoup、位元組搜尋 + json 完整解碼與 ijson 串流解碼的耗時與記憶體"""
+    from extract_gamma_from_html import (extract_plotly_data_from_html, extract_plotly_data_from_arguments,
+                                         extract_gamma_levels, read_newplot_arguments, stream_plotly_args,
+                                         HAS_IJSON)
+
+    def soup_path(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return extract_plotly_data_from_html(f.read())
+
+    def scan_path(path):
+        args_string = read_newplot_arguments(path)
+        if args_string is None:
+            return None
+        return extract_plotly_data_from_arguments(args_string)
+
+    def stream_path(path):
+        return extract_gamma_levels(stream_plotly_args(path))
+
+    methods = [('soup', soup_path), ('scan', scan_path)]
+    if HAS_IJSON:
+        methods.append(('stream', stream_path))
+    else:
+        print("未安裝 ijson，略過串流解碼")
+
+    files = args.files or largest_exports(args.gex_dir, args.ticker, args.top)
+    if not files:
+        print("沒有可測試的文件，請指定 --files 或 --gex-dir")
+        return 1
+
+    results = []
+    header = ''.join(f"{name + '(s)':>10}{name + '(MB)':>11}" for name, _ in methods)
+    print(f"  {'file':<30}{'size(MB)':>9}{header}  same")
+    for path in files:
+        result = {'file': os.path.basename(path), 'size': os.path.getsize(path)}
+        row = ''
+        outputs = []
+        for name, method in methods:
+            elapsed, peak, output = measure(lambda: method(path))
+            result[name] = round(elapsed, 4)
+            result[f'{name}_peak'] = peak
+            outputs.append(output)
+            row += f"{elapsed:>10.3f}{peak / 1024 / 1024:>11.1f}"
+        result['same'] = all(output == outputs[0] for output in outputs)
+        print(f"  {result['file']:<30}{result['size'] / 1024 / 1024:>9.2f}{row}  {'yes' if result['same'] else 'NO'}")
+        results.append(result)
+
+    write_results(args.output, {
+        'benchmark': 'extract-html',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'results': results
+    })
+    return 0 if all(result['same'] for result in results) else 1
+
+def legacy_select_ladder(data, top_percentage, delta25):
+    """原本以 dict 加總、完整排序與 set 合併的流程，僅供比較"""
+    totals = {}
+    for item in [item for item in data[1] if item.get('type') == 'bar']:
+        for j, price in enumerate(item.get('y', [])):
+            gamma = item.get('x', [])[j]
+            if price in totals:
+                totals[price] += gamma
+            else:
+                totals[price] = gamma
+    sorted_by_price = sorted([(float(key), value) for key, value in totals.items()], key=lambda x: x[0])
+
+    changes = [{'index': i, 'gamma': abs(sorted_by_price[i][1])} for i in range(len(sorted_by_price))]
+    changes.sort(key=lambda x: x['gamma'], reverse=True)
+    top_count = int(math.ceil(len(changes) * (top_percentage / 100.0)))
+    index_of_data_to_show = [obj['index'] for obj in changes[:top_count]]
+
+    if delta25:
+        over_delta25_data = [i for i, (price, gamma) in enumerate(sorted_by_price) if abs(gamma) >= delta25]
+        index_of_data_to_show = list(set(index_of_data_to_show + over_delta25_data))
+    return sorted_by_price, index_of_data_to_show
+
+def bench_ladder(args):
+    """比較 Gamma 加總與前 N% 選取的新舊實作，並確認產生的 TV 代碼相同"""
+    import numpy as np
+    import extract_gamma_from_html as extractor
+    from gamma_profile import GammaProfile
+
+    def numpy_select_ladder(data, top_percentage, delta25):
+        profile = GammaProfile(*extractor.get_gamma_data(data))
+        changes = extractor.calculate_abs_gamma(profile)
+        index_of_data_to_show = extractor.get_top_changes(changes, profile, top_percentage)
+        if delta25:
+            index_of_data_to_show = extractor.union(index_of_data_to_show, np.flatnonzero(changes >= delta25))
+        return profile, index_of_data_to_show
+
+    results = []
+    print(f"  {'strikes':>8}{'delta25':>10}{'legacy(ms)':>12}{'numpy(ms)':>11}{'speedup':>9}  same")
+    for strikes in args.sizes:
+        data = synthetic_figure(strikes)
+        # Delta 25 不存在時為 -1，所有價格都會顯示
+        for delta25 in (args.delta25, -1):
+            legacy_time, legacy_result = best_time(
+                lambda: legacy_select_ladder(data, args.top_percentage, delta25), args.repeat)
+            numpy_time, numpy_result = best_time(
+                lambda: numpy_select_ladder(data, args.top_percentage, delta25), args.repeat)
+            legacy_profile = GammaProfile([price for price, _ in legacy_result[0]],
+                                          [gamma for _, gamma in legacy_result[0]])
+            same = (extractor.generate_tv_code(legacy_result[1], legacy_profile) ==
+                    extractor.generate_tv_code(numpy_result[1], numpy_result[0]))
+            print(f"  {strikes:>8}{delta25:>10g}{legacy_time * 1000:>12.2f}{numpy_time * 1000:>11.2f}"
+                  f"{legacy_time / max(numpy_time, 1e-9):>8.1f}x  {'yes' if same else 'NO'}")
+            results.append({'strikes': strikes, 'delta25': delta25, 'legacy': round(legacy_time, 6),
+                            'numpy': round(numpy_time, 6), 'same': same})
+
+    write_results(args.output, {
+        'benchmark': 'ladder',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'top_percentage': args.top_percentage,
+        'repeat': args.repeat,
+        'results': results
+    })
+    return 0 if all(result['same'] for result in results) else 1
+
+# 流程各階段，每個階段都從文件路徑開始處理到該階段為止
+PIPELINE_STAGES = ('locate', 'parse', 'extract', 'stream', 'soup', 'process')
+
+def pipeline_stage(stage):
+    """返回處理單個文件的階段函數"""
+    import extract_gamma_from_html as extractor
+
+    def soup(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return extractor.extract_plotly_data_from_html(f.read())
+
+    stages = {
+        # 位元組搜尋取得 Plotly.newPlot 參數字串
+        'locate': extractor.read_newplot_arguments,
+        # 加上 json 解碼參數
+        'parse': lambda path: extractor.parse_arguments(extractor.read_newplot_arguments(path)),
+        # 完整解碼並提取 Gamma 數據與水平
+        'extract': extractor.decode_file,
+        # ijson 串流解碼並提取 Gamma 數據與水平
+        'stream': lambda path: extractor.extract_gamma_levels(extractor.stream_plotly_args(path)),
+        # BeautifulSoup 解析整頁並提取 Gamma 數據與水平
+        'soup': soup,
+        # process_html_file 的完整流程，包括產生 TV 代碼 (不使用快取與欄式儲存)
+        'process': extractor.process_html_file,
+    }
+    return stages[stage]
+
+def peak_rss():
+    """返回本行程的 RSS 峰值 (bytes)"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 為單位，macOS 以 bytes 為單位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def run_pipeline_stage(stage, files, repeat):
+    """在獨立的行程中執行一個階段，返回最短耗時、成功的文件數與 RSS 峰值"""
+    import io
+    import contextlib
+
+    func = pipeline_stage(stage)
+    if stage == 'soup':
+        import bs4  # noqa: F401  匯入的記憶體計入基準
+    baseline = peak_rss()
+
+    best = None
+    ok = 0
+    for _ in range(max(1, repeat)):
+        ok = 0
+        elapsed = 0.0
+        for path in files:
+            with contextlib.redirect_stdout(io.StringIO()):
+                started = time.perf_counter()
+                result = func(path)
+                elapsed += time.perf_counter() - started
+            if result is not None:
+                ok += 1
+        best = elapsed if best is None else min(best, elapsed)
+    return {'seconds': best, 'ok': ok, 'baseline_rss': baseline, 'peak_rss': peak_rss()}
+
+def bench_pipeline(args):
+    """逐個階段測量提取流程的吞吐量 (files/s, MB/s) 與 RSS 峰值"""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from gamma_stream import HAS_IJSON
+
+    stages = [stage for stage in args.stages if stage != 'stream' or HAS_IJSON]
+    if 'stream' in args.stages and not HAS_IJSON:
+        print("未安裝 ijson，略過 stream 階段")
+
+    with tempfile.TemporaryDirectory(prefix="gex_fixtures_") as fixture_dir:
+        if args.files:
+            files = args.files
+            source = 'files'
+        elif args.dir:
+            files = sorted(glob.glob(os.path.join(args.dir, "*", "html", "Gamma_*_*.html")))
+            source = args.dir
+        else:
+            print(f"產生 {args.count} 個測試文件 ({args.strikes} 個履約價, {args.traces} 個 trace, "
+                  f"plotly.js {args.plotly_mb}MB)...")
+            files = write_fixtures(fixture_dir, ["SYN"], args.count, "20250102", args.strikes, args.traces,
+                                   args.plotly_mb, args.seed)
+            source = 'synthetic'
+        if not files:
+            print("沒有可測試的文件，請指定 --files、--dir 或使用產生的文件")
+            return 1
+        total_bytes = sum(os.path.getsize(path) for path in files)
+        print(f"{len(files)} 個文件，共 {total_bytes / 1024 / 1024:.1f}MB，每個階段重複 {args.repeat} 次取最短耗時\n")
+
+        results = []
+        print(f"  {'stage':<10}{'seconds':>9}{'files/s':>10}{'MB/s':>9}{'peak RSS(MB)':>14}{'+RSS(MB)':>10}{'ok':>8}")
+        # 每個階段在新的行程中運行，RSS 峰值不受其他階段影響
+        context = multiprocessing.get_context('spawn')
+        for stage in stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                measured = executor.submit(run_pipeline_stage, stage, files, args.repeat).result()
+            seconds = max(measured['seconds'], 1e-9)
+            result = {
+                'stage': stage,
+                'seconds': round(measured['seconds'], 4),
+                'files_per_s': round(len(files) / seconds, 2),
+                'mb_per_s': round(total_bytes / 1024 / 1024 / seconds, 2),
+                'peak_rss_mb': round(measured['peak_rss'] / 1024 / 1024, 1),
+                'rss_growth_mb': round((measured['peak_rss'] - measured['baseline_rss']) / 1024 / 1024, 1),
+                'ok': measured['ok']
+            }
+            print(f"  {stage:<10}{result['seconds']:>9.3f}{result['files_per_s']:>10.1f}{result['mb_per_s']:>9.1f}"
+                  f"{result['peak_rss_mb']:>14.1f}{result['rss_growth_mb']:>10.1f}{measured['ok']:>5}/{len(files)}")
+            results.append(result)
+
+    write_results(args.output, {
+        'benchmark': 'pipeline',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'source': source,
+        'files': len(files),
+        'bytes': total_bytes,
+        'strikes': args.strikes if source == 'synthetic' else None,
+        'traces': args.traces if source == 'synthetic' else None,
+        'repeat': args.repeat,
+        'results': results
+    })
+    return 0 if all(result['ok'] == len(files) for result in results) else 1
+
+def bench_fixtures(args):
+    """產生測試用的 Gamma HTML 匯出文件"""
+    files = write_fixtures(args.out_dir, args.tickers, args.days, args.start, args.strikes, args.traces,
+                           args.plotly_mb, args.seed)
+    total_bytes = sum(os.path.getsize(path) for path in files)
+    print(f"已在 {args.out_dir} 產生 {len(files)} 個文件，共 {total_bytes / 1024 / 1024:.1f}MB")
+    return 0
+
+# 比較兩次結果時用來對應每一列的欄位
+RESULT_KEYS = {
+    'pipeline': ('stage',),
+    'parse-args': ('file',),
+    'extract-html': ('file',),
+    'ladder': ('strikes', 'delta25'),
+    'tokenizer': ('parser',),
+}
+# 不是測量值的欄位
+RESULT_INFO_FIELDS = ('ok', 'size')
+
+def bench_compare(args):
+    """比較兩個 --output 保存的結果文件，列出每個數值欄位的新舊值與比例"""
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r', encoding='utf-8') as f:
+        current = json.load(f)
+
+    kind = current.get('benchmark')
+    if kind != baseline.get('benchmark') or kind not in RESULT_KEYS:
+        print(f"無法比較: {baseline.get('benchmark')} 與 {kind}")
+        return 1
+
+    keys = RESULT_KEYS[kind]
+    old_rows = {tuple(row.get(key) for key in keys): row for row in baseline.get('results', [])}
+    print(f"{kind}: {args.baseline} ({baseline.get('timestamp')}) -> {args.current} ({current.get('timestamp')})")
+    print(f"  {'/'.join(keys):<24}{'field':<16}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for row in current.get('results', []):
+        key = tuple(row.get(name) for name in keys)
+        old = old_rows.get(key)
+        if old is None:
+            continue
+        label = '/'.join(str(value) for value in key)
+        for field, value in row.items():
+            if field in keys or field in RESULT_INFO_FIELDS or isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            old_value = old.get(field)
+            if not isinstance(old_value, (int, float)) or isinstance(old_value, bool):
+                continue
+            ratio = f"{value / old_value:.2f}x" if old_value else '-'
+            print(f"  {label:<24}{field:<16}{old_value:>12g}{value:>12g}{ratio:>8}")
+            label = ''
+    return 0
+
+def bench_tokenizer(args):
+    """比較 TV Code 水平格式的新舊解析 (長轉短、短轉長、put_dom_trade 讀取短格式) 的吞吐量"""
+    from gamma_converter import convert_to_short, convert_to_long
+    from level_codes import short_levels
+
+    # 每天一對 (長格式, 短格式) 文字
+    days = []
+    files = sorted(glob.glob(os.path.join(args.tvcode_dir, "tvcode_*.txt")))[-args.days:] if not args.synthetic else []
+    for path in files:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if '=' in text:
+            days.append((legacy_convert_to_long(text), text))
+        else:
+            days.append((text, legacy_convert_to_short(text)))
+    if files:
+        source = args.tvcode_dir
+        print(f"使用 {args.tvcode_dir} 中最新的 {len(files)} 個 tvcode 文件")
+    else:
+        config = load_config(args.config)
+        tickers = config.get('tickers') or ['spx', 'qqq', 'iwm', 'smh', 'vix']
+        for n in range(args.days):
+            long_text = synthetic_tvcode(tickers, args.seed + n)
+            days.append((long_text, legacy_convert_to_short(long_text)))
+        source = 'synthetic'
+        print(f"使用產生的 {args.days} 天 TV Code ({len(tickers)} 個股票)")
+
+    short_lines = [line.strip() for _, short_text in days for line in short_text.splitlines()]
+    parsers = [
+        ('to-short', lambda: [legacy_convert_to_short(long_text) for long_text, _ in days],
+         lambda: [convert_to_short(long_text) for long_text, _ in days],
+         sum(len(long_text) for long_text, _ in days)),
+        ('to-long', lambda: [legacy_convert_to_long(short_text) for _, short_text in days],
+         lambda: [convert_to_long(short_text) for _, short_text in days],
+         sum(len(short_text) for _, short_text in days)),
+        ('levels', lambda: [legacy_short_levels(line) for line in short_lines],
+         lambda: [short_levels(line) for line in short_lines],
+         sum(len(line) for line in short_lines)),
+    ]
+
+    results = []
+    print(f"\n  {'parser':<10}{'legacy(ms)':>12}{'new(ms)':>10}{'speedup':>9}{'files/s':>10}{'MB/s':>8}  same")
+    for name, legacy, new, size in parsers:
+        legacy_time, legacy_output = best_time(legacy, args.repeat)
+        new_time, new_output = best_time(new, args.repeat)
+        same = legacy_output == new_output
+        files_per_s = len(days) / max(new_time, 1e-9)
+        mb_per_s = size / 1024 / 1024 / max(new_time, 1e-9)
+        print(f"  {name:<10}{legacy_time * 1000:>12.2f}{new_time * 1000:>10.2f}"
+              f"{legacy_time / max(new_time, 1e-9):>8.1f}x{files_per_s:>10.0f}{mb_per_s:>8.1f}  {'yes' if same else 'NO'}")
+        results.append({'parser': name, 'legacy': round(legacy_time, 6), 'new': round(new_time, 6),
+                        'files_per_s': round(files_per_s, 1), 'mb_per_s': round(mb_per_s, 2), 'same': same})
+
+    write_results(args.output, {
+        'benchmark': 'tokenizer',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'source': source,
+        'days': len(days),
+        'repeat': args.repeat,
+        'results': results
+    })
+    return 0 if all(result['same'] for result in results) else 1
+
+def bench_scrape(args):
+    """以 HAR 重播運行 playwright_record 的股票循環"""
+    from playwright.sync_api import sync_playwright
+    import playwright_record
+    from scrape_trace import StepTracer, print_summary
+    from scrape_manifest import ScrapeManifest
+    from scrape_replay import HarServer
+
+    config = load_config(args.config)
+    tickers = args.tickers or config.get('tickers', [])
+    if not tickers:
+        print("沒有需要處理的股票")
+        return 1
+
+    settings = dict(config.get('download_settings', {}))
+    settings['headless'] = not args.headed
+    if args.keep_alive:
+        settings['keep_alive'] = True
+    workers = args.workers if args.workers is not None else settings.get('workers', 1)
+
+    server = None
+    if args.server:
+        server = HarServer(args.har, latency_ms=args.latency_ms).start()
+        print(f"替身伺服器運行於 {server.url} (延遲 {args.latency_ms}ms)")
+    settings['har'] = {'mode': 'replay', 'path': args.har, 'server': server.url if server else None}
+
+    runs = []
+    all_records = []
+    try:
+        for run_index in range(1, args.runs + 1):
+            print(f"\n===== 第 {run_index}/{args.runs} 次運行 ({len(tickers)} 個股票, workers={workers}) =====")
+            tracer = StepTracer(run_id=f"bench_{run_index}")
+            with tempfile.TemporaryDirectory(prefix="gex_bench_") as download_dir:
+                manifest = ScrapeManifest.for_date(download_dir)
+                started = time.monotonic()
+                if workers > 1:
+                    playwright_record.run_parallel(None, tickers, download_dir, args.capture, workers=workers,
+                                                   retries=1, settings=settings, tracer=tracer,
+                                                   manifest=manifest)
+                else:
+                    with sync_playwright() as playwright:
+                        playwright_record.run(playwright, None, tickers, download_dir, args.capture, settings,
+                                              tracer, manifest)
+                wall = time.monotonic() - started
+
+            ticker_records = {record['ticker']: record for record in tracer.records if record['step'] == 'ticker'}
+            runs.append({
+                'wall': round(wall, 3),
+                'tickers': {ticker: {'duration': record['duration'], 'outcome': record['outcome']}
+                            for ticker, record in ticker_records.items()}
+            })
+            all_records.extend(tracer.records)
+            print(f"第 {run_index} 次運行總耗時 {wall:.1f}s")
+    finally:
+        if server:
+            server.stop()
+            print(f"替身伺服器命中 {server.hits} 次，未命中 {server.misses} 次")
+
+    print(f"\n每個股票耗時 ({args.runs} 次運行):")
+    print(f"  {'ticker':<10}{'median(s)':>11}{'min(s)':>9}{'max(s)':>9}{'ok':>6}")
+    for ticker in tickers:
+        results = [run['tickers'][ticker] for run in runs if ticker in run['tickers']]
+        durations = [result['duration'] for result in results]
+        if not durations:
+            print(f"  {ticker:<10}{'-':>11}")
+            continue
+        ok = sum(1 for result in results if result['outcome'] == 'ok')
+        print(f"  {ticker:<10}{statistics.median(durations):>11.2f}{min(durations):>9.2f}"
+              f"{max(durations):>9.2f}{ok:>4}/{len(results)}")
+    walls = [run['wall'] for run in runs]
+    print(f"  {'total':<10}{statistics.median(walls):>11.2f}{min(walls):>9.2f}{max(walls):>9.2f}")
+    print_summary(all_records, title="步驟耗時統計")
+
+    write_results(args.output, {
+        'benchmark': 'scrape',
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'har': args.har,
+        'server': bool(server),
+        'latency_ms': args.latency_ms,
+        'workers': workers,
+        'capture': args.capture,
+        'keep_alive': bool(settings.get('keep_alive')),
+        'runs': runs
+    })
+    return 0
+
+def add_fixture_arguments(parser):
+    """產生測試文件的共用參數"""
+    parser.add_argument('--strikes', type=int, default=3000, help='每個文件的履約價數量 (default: 3000)')
+    parser.add_argument('--traces', type=int, default=2, help='每個文件的 bar trace 數量 (default: 2)')
+    parser.add_argument('--plotly-mb', type=float, default=3.5, help='內嵌 plotly.js 的大小 MB (default: 3.5)')
+    parser.add_argument('--seed', type=int, default=0, help='隨機種子 (default: 0)')
+
+def main():
+    parser = argparse.ArgumentParser(description='GEX 流程效能基準測試')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scrape = subparsers.add_parser('scrape', help='以 HAR 重播運行爬蟲，報告每個股票的耗時')
+    scrape.add_argument('--har', required=True, help='playwright_record --record-har 記錄的 HAR 文件')
+    scrape.add_argument('--config', default='config.json', help='配置文件路徑 (default: config.json)')
+    scrape.add_argument('--tickers', nargs='+', help='要處理的股票 (default: config.json 的 tickers)')
+    scrape.add_argument('--runs', type=int, default=1, help='運行次數 (default: 1)')
+    scrape.add_argument('--workers', type=int, default=None,
+                        help='並行的瀏覽器上下文數量 (default: config.json 的 download_settings.workers 或 1)')
+    scrape.add_argument('--capture', choices=['network', 'html'], default='network',
+                        help='Gamma 數據擷取方式 (default: network)')
+    scrape.add_argument('--keep-alive', action='store_true', help='股票之間不重新加載頁面')
+    scrape.add_argument('--server', action='store_true', help='經由本機替身伺服器回應請求，而非 HAR 路由')
+    scrape.add_argument('--latency-ms', type=float, default=0, help='替身伺服器每個回應的延遲 (default: 0)')
+    scrape.add_argument('--headed', action='store_true', help='顯示瀏覽器視窗')
+    scrape.add_argument('--output', help='將結果保存為 JSON 文件')
+    scrape.set_defaults(func=bench_scrape)
+
+    parse_args = subparsers.add_parser('parse-args', help='比較 Plotly.newPlot 參數解析的新舊實作')
+    parse_args.add_argument('--files', nargs='+', help='要測試的 Gamma HTML 文件 (default: 最大的幾個匯出文件)')
+    parse_args.add_argument('--gex-dir', default=DEFAULT_GEX_DIR, help='GEX 文件目錄')
+    parse_args.add_argument('--ticker', default='SPX', help='選取最大匯出文件的股票 (default: SPX)')
+    parse_args.add_argument('--top', type=int, default=3, help='測試最大的幾個文件 (default: 3)')
+    parse_args.add_argument('--synthetic', type=int, default=0, metavar='STRIKES',
+                            help='改用產生的參數字串，指定履約價數量')
+    parse_args.add_argument('--repeat', type=int, default=3, help='每個實作重複次數，取最短耗時 (default: 3)')
+    parse_args.add_argument('--output', help='將結果保存為 JSON 文件')
+    parse_args.set_defaults(func=bench_parse_args)
+
+    extract_html = subparsers.add_parser('extract-html', help='比較 BeautifulSoup 與位元組搜尋的耗時與記憶體峰值')
+    extract_html.add_argument('--files', nargs='+', help='要測試的 Gamma HTML 文件 (default: 最大的幾個匯出文件)')
+    extract_html.add_argument('--gex-dir', default=DEFAULT_GEX_DIR, help='GEX 文件目錄')
+    extract_html.add_argument('--ticker', default='SPX', help='選取最大匯出文件的股票 (default: SPX)')
+    extract_html.add_argument('--top', type=int, default=3, help='測試最大的幾個文件 (default: 3)')
+    extract_html.add_argument('--output', help='將結果保存為 JSON 文件')
+    extract_html.set_defaults(func=bench_extract_html)
+
+    ladder = subparsers.add_parser('ladder', help='比較 Gamma 加總與前 N%% 選取的 Python 與 NumPy 實作')
+    ladder.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000],
+                        help='履約價數量 (default: 1000 10000 100000)')
+    ladder.add_argument('--top-percentage', type=float, default=10, help='選取的百分比 (default: 10)')
+    ladder.add_argument('--delta25', type=float, default=1.5e6, help='Delta 25 門檻 (default: 1.5e6)')
+    ladder.add_argument('--repeat', type=int, default=5, help='每個實作重複次數，取最短耗時 (default: 5)')
+    ladder.add_argument('--output', help='將結果保存為 JSON 文件')
+    ladder.set_defaults(func=bench_ladder)
+
+    fixtures = subparsers.add_parser('fixtures', help='產生測試用的 Gamma HTML 匯出文件')
+    fixtures.add_argument('--out-dir', required=True, help='輸出目錄，文件寫入 <目錄>/<股票>/html/')
+    fixtures.add_argument('--tickers', nargs='+', default=['SPX'], help='股票 (default: SPX)')
+    fixtures.add_argument('--days', type=int, default=5, help='每個股票的工作日數量 (default: 5)')
+    fixtures.add_argument('--start', default='20250102', help='第一個日期 YYYYMMDD (default: 20250102)')
+    add_fixture_arguments(fixtures)
+    fixtures.set_defaults(func=bench_fixtures)
+
+    pipeline = subparsers.add_parser('pipeline', help='逐個階段測量提取流程的吞吐量與 RSS 峰值')
+    pipeline.add_argument('--files', nargs='+', help='要測試的 Gamma HTML 文件')
+    pipeline.add_argument('--dir', help='測試目錄中所有的 <股票>/html/Gamma_*.html (例如 fixtures 的輸出目錄)')
+    pipeline.add_argument('--count', type=int, default=20, help='未指定文件時產生的文件數量 (default: 20)')
+    add_fixture_arguments(pipeline)
+    pipeline.add_argument('--stages', nargs='+', choices=PIPELINE_STAGES, default=list(PIPELINE_STAGES),
+                          help='要測量的階段 (default: 全部)')
+    pipeline.add_argument('--repeat', type=int, default=3, help='每個階段重複次數，取最短耗時 (default: 3)')
+    pipeline.add_argument('--output', help='將結果保存為 JSON 文件')
+    pipeline.set_defaults(func=bench_pipeline)
+
+    tokenizer = subparsers.add_parser('tokenizer', help='比較 TV Code 水平格式的新舊解析')
+    tokenizer.add_argument('--tvcode-dir', default=os.path.join(DEFAULT_GEX_DIR, "tvcode"),
+                           help='tvcode_*.txt 所在目錄，沒有文件時改用產生的數據')
+    tokenizer.add_argument('--days', type=int, default=252, help='使用最新的幾天 (default: 252，約一年)')
+    tokenizer.add_argument('--synthetic', action='store_true', help='使用產生的數據')
+    tokenizer.add_argument('--config', default='config.json', help='產生數據時使用的股票列表 (default: config.json)')
+    tokenizer.add_argument('--seed', type=int, default=0, help='隨機種子 (default: 0)')
+    tokenizer.add_argument('--repeat', type=int, default=5, help='每個實作重複次數，取最短耗時 (default: 5)')
+    tokenizer.add_argument('--output', help='將結果保存為 JSON 文件')
+    tokenizer.set_defaults(func=bench_tokenizer)
+
+    compare = subparsers.add_parser('compare', help='比較兩個 --output 保存的結果文件')
+    compare.add_argument('baseline', help='基準結果文件')
+    compare.add_argument('current', help='新的結果文件')
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
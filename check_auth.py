@@ -13,6 +13,7 @@ import time
 import argparse
 import requests
 from dotenv import load_dotenv
+from request_filter import SIZE_TABLE_FILE, RequestFilter
 
 # 載入環境變數
 
@@ -79,12 +80,13 @@ def send_pushover_notification(message, priority=0, sound=None, repeat=1):
         print(f"發送 Pushover 通知時發生錯誤: {e}")
         return False
 
-async def check_login(auth_json_path, headless=True):
+async def check_login(auth_json_path, headless=True, request_filter=None):
     """
     使用 auth.json 檢查是否可以登入 https://www.lietaresearch.com/platform
     
     Args:
         auth_json_path: auth.json 的路徑
+        request_filter: RequestFilter，不為 None 時攔截字型、圖片與追蹤服務等請求
     
     Returns:
         bool: 是否成功登入
@@ -121,6 +123,8 @@ async def check_login(auth_json_path, headless=True):
         
         # 直接使用 auth.json 作為 storage_state 創建上下文
         context = await browser.new_context(storage_state=auth_json_path)
+        if request_filter is not None:
+            await request_filter.install_async(context)
         
         try:
             # 建立新頁面
@@ -312,6 +316,11 @@ async def main():
     parser.add_argument('--headless', '-H', action='store_true', default=True, help='使用無頭模式 (預設: True)')
     parser.add_argument('--no-headless', dest='headless', action='store_false', help='不使用無頭模式')
     parser.add_argument('--no-notify', dest='notify', action='store_false', default=True, help='不發送 Pushover 通知')
+    parser.add_argument('--config', default='config.json', help='配置文件路徑，讀取其中的 request_filter 設定 (預設: config.json)')
+    parser.add_argument('--no-block-requests', dest='block_requests', action='store_false', default=True,
+                        help='不攔截字型、圖片與追蹤服務等請求 (仍會記錄資源大小，供估計節省的流量)')
+    parser.add_argument('--size-table', default=os.path.join('/home/ben/pCloudDrive/stock/GEX/GEX_file/', 'trace', SIZE_TABLE_FILE),
+                        help='與 playwright_record 共用的資源大小表 (預設: <download-dir>/trace/request_sizes.json)')
     
     args = parser.parse_args()
     auth_json_path = args.auth_path
@@ -321,8 +330,26 @@ async def main():
     print(f"無頭模式: {args.headless}")
     print("-" * 50)
     
+    # 請求過濾設定
+    filter_settings = {}
+    try:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            filter_settings = dict(json.load(f).get('request_filter', {}))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"讀取 {args.config} 的 request_filter 設定失敗: {str(e)}")
+    if not args.block_requests:
+        filter_settings['enabled'] = False
+    request_filter = RequestFilter(filter_settings, args.size_table)
+    
     # 執行登入檢查
-    success = await check_login(auth_json_path, headless=args.headless)
+    success = await check_login(auth_json_path, headless=args.headless, request_filter=request_filter)
+    try:
+        request_filter.save_size_table()
+    except OSError as e:
+        print(f"保存資源大小表失敗: {str(e)}")
+    request_filter.print_summary()
     
     print("-" * 50)
     if success:
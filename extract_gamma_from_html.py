@@ -2,100 +2,154 @@ import os
 import re
 import json
 import glob
-from bs4 import BeautifulSoup
+import mmap
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 import pandas as pd
 from datetime import datetime
+from gamma_cache import ExtractionCache
+from gamma_profile import GammaProfile
+from gamma_store import has_profile, write_profile
+from level_records import records_from_profile, read_records, write_records, merge_records
+from gamma_stream import HAS_IJSON, trace_array, stream_newplot_arguments, stream_figure_json
+
+# 提取邏輯 (解析、Gamma 加總、各水平) 改變時提高版本，使 gamma_cache 中的舊結果失效
+EXTRACTOR_VERSION = 4
+
+# 影響提取結果的模組，任何一個比輸出文件新時該日期需要重新提取
+EXTRACTOR_MODULES = ('extract_gamma_from_html.py', 'gamma_stream.py', 'gamma_profile.py', 'gamma_cache.py',
+                     'level_records.py')
+
+# 非 JSON 參數時尋找下一個頂層逗號所需的字元
+ARGUMENT_TOKEN_PATTERN = re.compile(r'[\\"{}\[\],]')
+WHITESPACE_PATTERN = re.compile(r'\s*')
+JSON_DECODER = json.JSONDecoder()
+NEWPLOT_CALL_PATTERN = re.compile(rb'Plotly\.newPlot\s*\(')
+
+def find_argument_end(args_string, pos):
+    """從 pos 開始尋找下一個不在引號或括號內的逗號，找不到時返回字串長度"""
+    depth = 0
+    in_quotes = False
+    skip_until = pos
+    for match in ARGUMENT_TOKEN_PATTERN.finditer(args_string, pos):
+        i = match.start()
+        if i < skip_until:
+            continue
+        char = match.group()
+        if char == '\\':
+            # 跳過被跳脫的字元
+            skip_until = i + 2
+        elif char == '"':
+            in_quotes = not in_quotes
+        elif in_quotes:
+            continue
+        elif char in "{[":
+            depth += 1
+        elif char in "]}":
+            depth -= 1
+        elif depth == 0:
+            return i
+    return len(args_string)
 
 def parse_arguments(args_string):
-    """解析 Plotly.newPlot 函數的參數字串"""
+    """解析 Plotly.newPlot 函數的參數字串
+
+    以 JSONDecoder.raw_decode 依序解析每個參數，整體為線性時間；
+    無法解析為 JSON 的參數 (例如 JavaScript 物件) 會略過，與逐字元解析時的結果相同。
+    """
     args = []
-    start = 0
-    bracket_count = 0
-    in_quotes = False
-    current = ""
+    pos = 0
+    length = len(args_string)
     
-    for i, char in enumerate(args_string):
-        if char == '"' and args_string[i-1:i] != '\\':
-            in_quotes = not in_quotes
-        
-        if not in_quotes:
-            if char in "{[":
-                bracket_count += 1
-            if char in "]}":
-                bracket_count -= 1
+    while True:
+        pos = WHITESPACE_PATTERN.match(args_string, pos).end()
+        if pos >= length:
+            break
         
-        if char == "," and bracket_count == 0 and not in_quotes:
-            try:
-                args.append(json.loads(current.strip()))
-            except json.JSONDecodeError:
-                print(f"無法解析為 JSON: {current.strip()}")
-            current = ""
-        else:
-            current += char
-    
-    # 處理最後一個參數
-    if current.strip():
         try:
-            args.append(json.loads(current.strip()))
+            value, value_end = JSON_DECODER.raw_decode(args_string, pos)
+            next_pos = WHITESPACE_PATTERN.match(args_string, value_end).end()
+            if next_pos >= length or args_string[next_pos] == ",":
+                args.append(value)
+                pos = next_pos + 1
+                continue
         except json.JSONDecodeError:
-            print(f"無法解析為 JSON: {current.strip()}")
+            pass
+        
+        # 不是完整的 JSON 值，略過到下一個頂層逗號
+        arg_end = find_argument_end(args_string, pos)
+        print(f"無法解析為 JSON: {args_string[pos:arg_end].strip()}")
+        pos = arg_end + 1
     
     return args
 
 def get_gamma_data(data):
-    """從 Plotly 數據中提取 Gamma 數據"""
-    extracted_data = [item for item in data[1] if item.get('type') == 'bar']
-    sorted_by_price = []
-    
-    if extracted_data:
-        totals = {}
-        
-        for item in extracted_data:
-            for j, price in enumerate(item.get('y', [])):
-                gamma = item.get('x', [])[j]
-                if price in totals:
-                    totals[price] += gamma
-                else:
-                    totals[price] = gamma
-        
-        # 將字典轉換為按價格排序的列表
-        sorted_by_price = sorted(
-            [(float(key), value) for key, value in totals.items()],
-            key=lambda x: x[0]
-        )
-    
-    return sorted_by_price
-
-def get_delta25(data):
-    """獲取 Delta 25 值"""
-    target_data = [item for item in data[2].get('annotations', []) 
-                  if item.get('text') == "\u0394 25" and item.get('xanchor') == "right"]
-    return target_data[0].get('x') if target_data else -1
-
-def get_gamma_field(data):
-    """獲取 Gamma Field 值"""
-    target_data = [item for item in data[2].get('annotations', []) 
-                  if item.get('text') == "\u0393 Field" and item.get('xanchor') == "right"]
-    return target_data[0].get('y') if target_data else -1
-
-def get_gamma_flip(data):
-    """獲取 Gamma Flip 值"""
-    target_data = [item for item in data[2].get('annotations', []) 
-                  if item.get('text') == "\u0393 Flip" and item.get('xanchor') == "right"]
-    return target_data[0].get('y') if target_data else -1
-
-def get_call_wall(data):
-    """獲取 Call Wall 值"""
-    target_data = [item for item in data[2].get('annotations', []) 
-                  if item.get('text') == "Call Wall" and item.get('xanchor') == "right"]
-    return target_data[0].get('y') if target_data else -1
-
-def get_put_wall(data):
-    """獲取 Put Wall 值"""
-    target_data = [item for item in data[2].get('annotations', []) 
-                  if item.get('text') == "Put Wall" and item.get('xanchor') == "right"]
-    return target_data[0].get('y') if target_data else -1
+    """從 Plotly 數據中提取 Gamma 數據，所有 bar trace 按價格加總後按價格排序
+
+    Returns:
+        (strikes, gammas): 按價格排序的履約價與每個價格的淨 Gamma (float64 陣列)
+    """
+    bar_traces = [item for item in data[1] if item.get('type') == 'bar']
+    if not bar_traces:
+        return np.empty(0), np.empty(0)
+    
+    prices = np.concatenate([trace_array(item, 'y') for item in bar_traces])
+    gammas = np.concatenate([trace_array(item, 'x')[:len(trace_array(item, 'y'))] for item in bar_traces])
+    
+    # np.unique 已按價格排序，bincount 依原始順序累加每個價格的 Gamma
+    strikes, inverse = np.unique(prices, return_inverse=True)
+    totals = np.bincount(inverse, weights=gammas, minlength=len(strikes))
+    return strikes, totals
+
+def get_trace_gamma(data, strikes):
+    """獲取每個 bar trace 在各價格的 Gamma，與 strikes 對齊 (沒有數據的價格為 0)
+
+    Returns:
+        (trace_names, trace_gammas): trace 名稱與形狀為 (trace 數量, 價格數量) 的陣列
+    """
+    trace_names = []
+    trace_gammas = []
+    
+    bar_traces = [item for item in data[1] if item.get('type') == 'bar']
+    for n, item in enumerate(bar_traces):
+        name = str(item.get('name') or f"trace{n}")
+        while name in trace_names:
+            name += "_"
+        
+        prices = trace_array(item, 'y')
+        gammas = trace_array(item, 'x')[:len(prices)]
+        positions = np.searchsorted(strikes, prices)
+        trace_names.append(name)
+        trace_gammas.append(np.bincount(positions, weights=gammas, minlength=len(strikes)))
+    
+    return trace_names, np.array(trace_gammas, dtype=np.float64).reshape(len(trace_names), len(strikes))
+
+# 從 layout annotations 提取的水平: 名稱 -> (text, xanchor, 取值的座標)
+# 新的水平需要在這裡與 gamma_profile.LEVELS 各加一項，找不到的水平為 -1
+LEVEL_ANNOTATIONS = {
+    'delta25': ("\u0394 25", "right", 'x'),
+    'gamma_field': ("\u0393 Field", "right", 'y'),
+    'gamma_flip': ("\u0393 Flip", "right", 'y'),
+    'call_wall': ("Call Wall", "right", 'y'),
+    'put_wall': ("Put Wall", "right", 'y'),
+}
+
+def build_annotation_index(data):
+    """將 layout annotations 依 (text, xanchor) 分組，相同鍵只保留第一個"""
+    index = {}
+    for item in data[2].get('annotations', []):
+        index.setdefault((item.get('text'), item.get('xanchor')), item)
+    return index
+
+def get_levels(data, levels=LEVEL_ANNOTATIONS):
+    """一次掃描 annotations，返回 {水平名稱: 值}"""
+    index = build_annotation_index(data)
+    values = {}
+    for name, (text, xanchor, axis) in levels.items():
+        item = index.get((text, xanchor))
+        values[name] = item.get(axis) if item is not None else -1
+    return values
 
 def calculate_weak_gamma_filter_th(numbers):
     """計算弱 Gamma 過濾閾值"""
@@ -104,35 +158,39 @@ def calculate_weak_gamma_filter_th(numbers):
     return sorted_numbers[select] if sorted_numbers else 0
 
 def union(arr1, arr2):
-    """合併兩個數組並去重"""
-    return list(set(arr1 + arr2))
+    """合併兩個索引數組並去重"""
+    return np.union1d(arr1, arr2)
 
-def calculate_abs_gamma(sorted_by_price):
-    """計算絕對 Gamma 值"""
-    abs_gammas = [{'index': i, 'gamma': abs(sorted_by_price[i][1])} 
-                 for i in range(len(sorted_by_price))]
-    
-    # 按 gamma 值降序排序
-    abs_gammas.sort(key=lambda x: x['gamma'], reverse=True)
-    return abs_gammas
+def calculate_abs_gamma(profile):
+    """計算每個價格的絕對 Gamma 值"""
+    return np.abs(profile.gammas)
 
-def get_top_changes(changes, sorted_by_price, top_percentage):
-    """獲取前 top_percentage% 的變化"""
-    top_count = int(np.ceil(len(changes) * (top_percentage / 100.0)))
-    top_changes = changes[:top_count]
-    return [obj['index'] for obj in top_changes]
+def get_top_changes(changes, profile, top_percentage):
+    """獲取絕對 Gamma 最大的前 top_percentage% 的索引
+
+    以 np.partition 找出門檻值，不需要完整排序；數值相同時取索引較小者，與穩定排序後切片的結果相同。
+    """
+    count = len(changes)
+    top_count = min(int(np.ceil(count * (top_percentage / 100.0))), count)
+    if top_count <= 0:
+        return np.array([], dtype=np.intp)
+    
+    threshold = np.partition(changes, count - top_count)[count - top_count]
+    above = np.flatnonzero(changes > threshold)
+    ties = np.flatnonzero(changes == threshold)[:top_count - len(above)]
+    return np.concatenate([above, ties])
 
-def generate_tv_code(index_of_data_to_show, sorted_by_price, right_shift=1):
+def generate_tv_code(index_of_data_to_show, profile, right_shift=1):
     """生成 TradingView 代碼"""
     additional_tv_code = ""
     right_padding = " " * right_shift
     
-    # 先按價格降序排序
-    price_indices = [(sorted_by_price[index][0], index) for index in index_of_data_to_show if 0 <= index < len(sorted_by_price)]
-    price_indices.sort(reverse=True)  # 按價格降序排序
+    # 履約價已按價格升序排列，索引降序即為價格降序
+    indices = np.asarray(index_of_data_to_show, dtype=np.intp)
+    indices = np.unique(indices[(indices >= 0) & (indices < len(profile))])[::-1]
     
-    for price, index in price_indices:
-        gamma_in_mega = sorted_by_price[index][1] / 1000000
+    for price, gamma in zip(profile.strikes[indices].tolist(), profile.gammas[indices].tolist()):
+        gamma_in_mega = gamma / 1000000
         
         if abs(gamma_in_mega) >= 1:
             gamma_in_mega = f"{gamma_in_mega:.0f}"
@@ -162,8 +220,79 @@ def generate_level_tv_code(gamma_field, gamma_flip, call_wall, put_wall):
     
     return level_tv_code
 
+def find_newplot_arguments(script):
+    """返回 script 中 Plotly.newPlot( 與最後一個 ) 之間的參數字串，找不到時返回 None"""
+    plotly_match = re.search(r'Plotly\.newPlot\s*\(([\s\S]*)\)', script)
+    if not plotly_match:
+        return None
+    return plotly_match.group(1)
+
+def read_newplot_arguments(html_file):
+    """以記憶體映射與位元組搜尋取得 HTML 文件中 Plotly.newPlot 的參數字串
+
+    匯出頁面內嵌整個 plotly.js，只解碼呼叫所在的片段，不建立整頁的 DOM。
+    與 BeautifulSoup 的做法相同，使用第一個包含 Plotly.newPlot 且不含 plotly.js 的 <script>，
+    找不到時返回 None。
+    """
+    with open(html_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            span = find_newplot_span(mm)
+            if span is None:
+                return None
+            return mm[span[0]:span[1]].decode('utf-8')
+
+def find_newplot_span(mm):
+    """返回 Plotly.newPlot( 與最後一個 ) 之間參數的位元組範圍 (start, end)，找不到時返回 None"""
+    pos = mm.find(b'Plotly.newPlot')
+    while pos != -1:
+        script_start = mm.rfind(b'<script', 0, pos)
+        script_end = mm.find(b'</script>', pos)
+        if script_start == -1 or script_end == -1:
+            return None
+        body_start = mm.find(b'>', script_start, pos) + 1
+        
+        if body_start > 0 and mm.find(b'plotly.js', body_start, script_end) == -1:
+            match = NEWPLOT_CALL_PATTERN.search(mm, body_start, script_end)
+            if not match:
+                return None
+            call_end = mm.rfind(b')', match.end(), script_end)
+            if call_end == -1:
+                return None
+            return match.end(), call_end
+        
+        # 內嵌 plotly.js 的腳本，繼續搜尋下一個腳本
+        pos = mm.find(b'Plotly.newPlot', script_end)
+    return None
+
+def stream_plotly_args(html_file):
+    """以 ijson 串流解碼 HTML 或 JSON 文件，只取出 bar trace 與 annotations，找不到圖表時返回 None"""
+    if html_file.endswith('.json'):
+        return stream_figure_json(html_file)
+    with open(html_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            span = find_newplot_span(mm)
+            if span is None:
+                return None
+            return stream_newplot_arguments(mm, *span)
+
+def extract_plotly_data_from_arguments(args_string):
+    """從 Plotly.newPlot 的參數字串中提取 Plotly 數據"""
+    try:
+        # 解析參數
+        args = parse_arguments(args_string)
+        return extract_gamma_levels(args)
+    
+    except Exception as e:
+        print(f"解析 Plotly 數據時出錯: {e}")
+        return None
+
 def extract_plotly_data_from_html(html_content):
-    """從 HTML 內容中提取 Plotly 數據"""
+    """從 HTML 內容中提取 Plotly 數據 (BeautifulSoup 解析整頁，作為 read_newplot_arguments 的備用方式)"""
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(html_content, 'html.parser')
     
     # 查找包含 Plotly.newPlot 的 script 標籤
@@ -173,65 +302,113 @@ def extract_plotly_data_from_html(html_content):
     
     if not plotly_scripts:
         print("未找到 Plotly.newPlot 腳本")
-        return None, None, None, None, None, None
+        return None
     
     script = plotly_scripts[0].string
     
     # 查找 Plotly.newPlot 函數調用
-    plotly_match = re.search(r'Plotly\.newPlot\s*\(([\s\S]*)\)', script)
-    if not plotly_match:
+    args_string = find_newplot_arguments(script)
+    if args_string is None:
         print("未找到 Plotly.newPlot 函數調用")
-        return None, None, None, None, None, None
-    
-    args_string = plotly_match.group(1)
+        return None
     
+    return extract_plotly_data_from_arguments(args_string)
+
+def extract_plotly_data_from_json(json_content):
+    """從 playwright_record 網路擷取的 JSON 圖表數據中提取 Plotly 數據"""
     try:
-        # 解析參數
-        args = parse_arguments(args_string)
-        
-        # 提取數據
-        gamma_data = get_gamma_data(args)
-        delta25 = get_delta25(args)
-        gamma_field = get_gamma_field(args)
-        gamma_flip = get_gamma_flip(args)
-        call_wall = get_call_wall(args)
-        put_wall = get_put_wall(args)
-        
-        return gamma_data, delta25, gamma_field, gamma_flip, call_wall, put_wall
+        figure = json.loads(json_content)
+        # 組成與 Plotly.newPlot 相同的參數順序: (div id, data, layout)
+        args = [None, figure.get('data', []), figure.get('layout', {})]
+        return extract_gamma_levels(args)
     
     except Exception as e:
-        print(f"解析 Plotly 數據時出錯: {e}")
-        return None, None, None, None, None, None
+        print(f"解析 JSON 圖表數據時出錯: {e}")
+        return None
 
-def process_html_file(html_file, output_data=None, top_percentage=10, use_level_with_gamma=True):
-    """處理單個 HTML 文件並提取 Gamma 數據"""
-    try:
+def extract_gamma_levels(args):
+    """從 Plotly.newPlot 參數中提取 Gamma 數據和各個水平，返回 GammaProfile"""
+    strikes, gammas = get_gamma_data(args)
+    trace_names, trace_gammas = get_trace_gamma(args, strikes)
+    return GammaProfile(strikes, gammas, trace_names, trace_gammas, **get_levels(args))
+
+def decode_file(html_file):
+    """完整解碼 HTML 或 JSON 文件並提取 Gamma 數據與各個水平，失敗時返回 None"""
+    if html_file.endswith('.json'):
         with open(html_file, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        
+            return extract_plotly_data_from_json(f.read())
+    
+    args_string = read_newplot_arguments(html_file)
+    if args_string is not None:
+        return extract_plotly_data_from_arguments(args_string)
+    
+    # 頁面結構不同時改用 BeautifulSoup 解析整頁
+    with open(html_file, 'r', encoding='utf-8') as f:
+        return extract_plotly_data_from_html(f.read())
+
+def extract_file(html_file, cache=None):
+    """提取單個 HTML 或 JSON 文件的 GammaProfile，cache 不為 None 時先查詢快取
+
+    Returns:
+        (GammaProfile 或失敗時的 None, 是否使用了快取)
+    """
+    if cache is not None:
+        profile = cache.get(html_file)
+        if profile is not None:
+            print(f"使用快取的提取結果: {html_file}")
+            return profile, True
+        # 提取前取得文件的大小、修改時間與雜湊，提取期間文件被取代時快取不會記錄錯誤的對應
+        identity = cache.identify(html_file)
+    
+    profile = None
+    if HAS_IJSON:
+        # 串流解碼只保留需要的數組，失敗時改用完整解碼
+        try:
+            args = stream_plotly_args(html_file)
+            if args is not None and args[1]:
+                profile = extract_gamma_levels(args)
+        except Exception as e:
+            print(f"串流解碼 {html_file} 失敗，改用完整解碼: {e}")
+    if profile is None:
+        profile = decode_file(html_file)
+    
+    # 只快取成功的結果，失敗的文件下次仍會重新解析
+    if cache is not None and profile:
+        cache.put(html_file, profile, identity)
+    return profile, False
+
+def process_html_file(html_file, output_data=None, top_percentage=10, use_level_with_gamma=True, cache=None,
+                      store_dir=None):
+    """處理單個 HTML 文件 (或網路擷取的 JSON 文件) 並提取 Gamma 數據
+
+    store_dir 不為 None 時，同時將完整的 Gamma 分布寫入 gamma_store 的欄式儲存。
+    結果中的 'levels' 為 Gamma Field、Gamma Flip、Call Wall、Put Wall 的 LevelRecord 列表。
+    """
+    try:
         # 提取數據
-        sorted_by_price, delta25, gamma_field, gamma_flip, call_wall, put_wall = extract_plotly_data_from_html(html_content)
+        profile, cached = extract_file(html_file, cache)
         
-        if not sorted_by_price:
+        if not profile:
             print(f"無法從 {html_file} 提取數據")
             return None
         
         # 計算需要顯示的數據索引
-        changes = calculate_abs_gamma(sorted_by_price)
-        index_of_data_to_show = get_top_changes(changes, sorted_by_price, top_percentage)
+        changes = calculate_abs_gamma(profile)
+        index_of_data_to_show = get_top_changes(changes, profile, top_percentage)
         
         # 過濾 Delta 25 數據
-        if delta25:
-            over_delta25_data = [i for i, (price, gamma) in enumerate(sorted_by_price) if abs(gamma) >= delta25]
+        if profile.delta25:
+            over_delta25_data = np.flatnonzero(changes >= profile.delta25)
             index_of_data_to_show = union(index_of_data_to_show, over_delta25_data)
         
         # 生成 TV 代碼
-        tv_code = generate_tv_code(index_of_data_to_show, sorted_by_price, 1 if use_level_with_gamma else 4)
-        level_tv_code = generate_level_tv_code(gamma_field, gamma_flip, call_wall, put_wall)
+        tv_code = generate_tv_code(index_of_data_to_show, profile, 1 if use_level_with_gamma else 4)
+        level_tv_code = generate_level_tv_code(profile.gamma_field, profile.gamma_flip, profile.call_wall,
+                                               profile.put_wall)
         
         # 獲取股票代碼和日期
         file_name = os.path.basename(html_file)
-        match = re.search(r'Gamma_(\w+)_(\d+)\.html', file_name)
+        match = re.search(r'Gamma_(\w+)_(\d+)\.(?:html|json)', file_name)
         if match:
             stock_symbol = match.group(1)
             date_str = match.group(2)
@@ -247,13 +424,22 @@ def process_html_file(html_file, output_data=None, top_percentage=10, use_level_
                 # 如果股票已存在，則追加新的代碼
                 output_data[stock_symbol] = tv_code
         
+        # 保存完整的 Gamma 分布，失敗時不影響 TV 代碼的輸出；
+        # 使用快取時來源文件與提取邏輯都沒有改變，已存在的分區不需要重寫
+        if store_dir is not None and not (cached and has_profile(store_dir, stock_symbol, date_str)):
+            try:
+                write_profile(store_dir, stock_symbol, date_str, profile)
+            except Exception as e:
+                print(f"保存 {stock_symbol} {date_str} 的 Gamma 分布失敗: {e}")
+        
         print(f"已處理 {html_file} 並提取 Gamma 數據")
         
         return {
             'stock': stock_symbol,
             'date': date_str,
             'gamma_code': tv_code,
-            'level_code': level_tv_code
+            'level_code': level_tv_code,
+            'levels': records_from_profile(stock_symbol, date_str, profile)
         }
     
     except Exception as e:
@@ -264,84 +450,335 @@ def get_latest_html_file(stock_dir, use_newest=False):
     """
     尋找 HTML 文件，根據 use_newest 參數決定是尋找最新的文件還是當日的文件
     
+    同一天若同時有網路擷取的 JSON 文件 (json 目錄) 與 HTML 文件，優先使用 JSON 文件
+    
     Args:
         stock_dir (str): 股票目錄路徑
         use_newest (bool): 是否尋找最新的文件，而不是當日的文件
         
     Returns:
-        str: HTML 文件路徑，如果沒有找到則返回 None
+        str: HTML 或 JSON 文件路徑，如果沒有找到則返回 None
     """
     html_dir = os.path.join(stock_dir, "html")
-    if not os.path.exists(html_dir):
+    json_dir = os.path.join(stock_dir, "json")
+    if not os.path.exists(html_dir) and not os.path.exists(json_dir):
         return None
     
     # 略過備份資料夾
-    if 'backup' in html_dir.lower() or 'GEX_file_backup' in html_dir:
+    if 'backup' in stock_dir.lower() or 'GEX_file_backup' in stock_dir:
         return None
     
     # 獲取當前日期
     today = datetime.now().strftime("%Y%m%d")
+    date_pattern = "*" if use_newest else today
     
-    if use_newest:
-        # 尋找所有 HTML 文件並按日期排序
-        html_files = glob.glob(os.path.join(html_dir, "Gamma_*.html"))
-        if not html_files:
-            return None
-        
-        # 按照文件名中的日期排序
-        html_files.sort(key=lambda x: re.search(r'_(\d{8})\.html$', x).group(1) if re.search(r'_(\d{8})\.html$', x) else "", reverse=True)
-    else:
-        # 尋找當天的 HTML 文件
-        html_files = glob.glob(os.path.join(html_dir, f"Gamma_*_{today}.html"))
-        
-        if not html_files:
-            # 如果沒有當天的文件，則返回 None
-            return None
+    html_files = (glob.glob(os.path.join(json_dir, f"Gamma_*_{date_pattern}.json")) +
+                  glob.glob(os.path.join(html_dir, f"Gamma_*_{date_pattern}.html")))
+    if not html_files:
+        # 如果沒有符合條件的文件，則返回 None
+        return None
+    
+    # 按照文件名中的日期排序，同一天 JSON 優先於 HTML
+    def sort_key(path):
+        match = re.search(r'_(\d{8})\.(html|json)$', path)
+        if not match:
+            return ("", False)
+        return (match.group(1), match.group(2) == 'json')
     
-    return html_files[0] if html_files else None
+    html_files.sort(key=sort_key, reverse=True)
+    return html_files[0]
 
-def save_gamma_levels(data, output_dir):
+def save_gamma_levels(records, output_dir):
     """
-    將股票的 Gamma 水平數據保存到指定目錄
+    將從 Gamma 圖提取的水平記錄按日期保存到 <output_dir>/gamma_levels_<日期>.jsonl 與 .npy
+    
+    已有同一日期的文件時只取代記錄中出現的股票，其他股票保持不變。
     
     Args:
-        data (str): 包含多行股票數據的字符串，每行格式為 "股票代碼:水平數據"
+        records (list): level_records.LevelRecord 列表 (process_html_file 結果中的 'levels')
         output_dir (str): 輸出目錄路徑
+        
+    Returns:
+        int: 保存的記錄數
     """
     # 確保輸出目錄存在
     os.makedirs(output_dir, exist_ok=True)
     
-    # 獲取當前日期
-    today = datetime.now().strftime('%Y%m%d')
+    by_date = {}
+    for record in records:
+        by_date.setdefault(record.date, []).append(record)
     
-    # 分割每行數據
-    lines = [line.strip() for line in data.strip().split('\n') if line.strip()]
+    for date_str, day_records in sorted(by_date.items()):
+        path_base = os.path.join(output_dir, f"gamma_levels_{date_str}")
+        existing = read_records(path_base) or []
+        write_records(path_base, merge_records(existing, day_records))
+        print(f"已保存 {len({record.ticker for record in day_records})} 個股票的 Gamma 水平數據到 {path_base}.jsonl")
     
-    # 處理每行數據
-    for line in lines:
-        # 分割股票代碼和數據
-        parts = line.split(':', 1)
-        if len(parts) != 2:
-            print(f"警告: 無法解析行 '{line}'，跳過")
+    return len(records)
+
+def find_stock_files(stock_dirs, use_newest, today_date):
+    """找出每個股票目錄要處理的文件
+
+    Returns:
+        tuple: ([(股票代碼, 文件路徑), ...], [跳過的股票代碼, ...])
+    """
+    stock_files = []
+    skipped_stocks = []
+    for stock_dir in stock_dirs:
+        stock_symbol = os.path.basename(stock_dir)
+        html_dir = os.path.join(stock_dir, "html")
+        json_dir = os.path.join(stock_dir, "json")
+        
+        if not os.path.exists(html_dir) and not os.path.exists(json_dir):
+            print(f"跳過 {stock_symbol}: html/json 目錄不存在 ({html_dir})")
+            skipped_stocks.append(stock_symbol)
             continue
         
-        stock_symbol = parts[0].strip()
-        level_data = parts[1].strip()
-        
-        # 創建股票特定的輸出目錄
-        stock_dir = os.path.join(output_dir, stock_symbol)
-        os.makedirs(stock_dir, exist_ok=True)
+        # 找出最新的 HTML 文件
+        latest_html_file = get_latest_html_file(stock_dir, use_newest)
         
-        # 創建輸出文件名
-        output_file = os.path.join(stock_dir, f"gamma_levels_{today}.txt")
+        if not latest_html_file:
+            print(f"跳過 {stock_symbol}: 未找到符合條件的 HTML 文件")
+            skipped_stocks.append(stock_symbol)
+            continue
         
-        # 保存數據
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(level_data)
+        # 從檔案名中提取日期
+        file_name = os.path.basename(latest_html_file)
+        match = re.search(r'Gamma_\w+_(\d+)\.(?:html|json)', file_name)
+        file_date = match.group(1) if match else today_date
         
-        print(f"已保存 {stock_symbol} 的 Gamma 水平數據到 {output_file}")
+        print(f"處理股票 {stock_symbol}: 使用最新的 HTML 文件 ({file_date})")
+        stock_files.append((stock_symbol, latest_html_file))
     
-    return len(lines)
+    return stock_files, skipped_stocks
+
+def run_process_pool(html_files, indices, workers, results, cache=None, store_dir=None):
+    """以一個行程池處理 html_files 中的 indices，結果寫入 results
+
+    Returns:
+        list: 因行程池中斷 (工作行程異常結束) 而沒有完成的索引
+    """
+    unfinished = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process_html_file, html_files[i], cache=cache, store_dir=store_dir): i
+                   for i in indices}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except BrokenProcessPool:
+                unfinished.append(i)
+            except Exception as e:
+                print(f"處理 {html_files[i]} 時出錯: {e}")
+    return sorted(unfinished)
+
+def process_html_files(html_files, workers=1, cache=None, store_dir=None):
+    """處理多個文件，返回與 html_files 順序相同的結果列表 (失敗為 None)
+
+    workers 大於 1 時以多個行程並行處理，0 表示使用全部 CPU。
+    工作行程異常結束會使整個行程池中斷，未完成的文件先以新的行程池重試，
+    仍然中斷時逐個以獨立的行程處理，只有導致行程結束的文件結果為 None。
+    """
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(html_files))
+    if workers <= 1:
+        return [process_html_file(html_file, cache=cache, store_dir=store_dir) for html_file in html_files]
+    
+    print(f"使用 {workers} 個行程並行處理 {len(html_files)} 個文件")
+    results = [None] * len(html_files)
+    unfinished = run_process_pool(html_files, range(len(html_files)), workers, results, cache, store_dir)
+    if unfinished:
+        print(f"工作行程異常結束，以新的行程池重試 {len(unfinished)} 個未完成的文件")
+        unfinished = run_process_pool(html_files, unfinished, min(workers, len(unfinished)), results, cache,
+                                      store_dir)
+    for i in unfinished:
+        if run_process_pool(html_files, [i], 1, results, cache, store_dir):
+            print(f"處理 {html_files[i]} 時工作行程異常結束")
+    return results
+
+def write_gamma_code_file(all_gamma_data, results, gamma_code_dir, today_date):
+    """將所有股票的 Gamma 數據寫入 gammacode_<日期>.txt，日期使用結果中最常見的日期"""
+    # 確保輸出目錄存在
+    os.makedirs(gamma_code_dir, exist_ok=True)
+    
+    # 從結果中找出最新的日期
+    # 預設使用最常見的日期
+    date_counts = {}
+    for result in results:
+        if result and 'date' in result:
+            date = result['date']
+            date_counts[date] = date_counts.get(date, 0) + 1
+    
+    # 找出最常見的日期
+    most_common_date = today_date
+    max_count = 0
+    for date, count in date_counts.items():
+        if count > max_count:
+            max_count = count
+            most_common_date = date
+    
+    # 使用最常見的日期
+    latest_date = most_common_date
+    
+    # 創建輸出文件路徑
+    gamma_file = os.path.join(gamma_code_dir, f"gammacode_{latest_date}.txt")
+    
+    # 將所有股票的數據寫入文件
+    with open(gamma_file, 'w', encoding='utf-8') as f:
+        for stock, code in all_gamma_data.items():
+            # 確保每個股票的數據格式正確
+            # 移除可能的尾部空格和多餘的逗號
+            code = code.strip()
+            if code.endswith(','):
+                code = code[:-1]
+            f.write(f"{stock}:{code}\n")
+    
+    print(f"\n已將所有股票的 Gamma 數據存到: {gamma_file}")
+    print(f"共處理了 {len(all_gamma_data)} 個股票的數據")
+    return gamma_file
+
+def update_gamma_code_file(gamma_code_dir, date_str, stock, code):
+    """只更新 gammacode_<日期>.txt 中一個股票的一行，其他股票保持不變 (按股票排序)，返回文件路徑"""
+    os.makedirs(gamma_code_dir, exist_ok=True)
+    gamma_file = os.path.join(gamma_code_dir, f"gammacode_{date_str}.txt")
+
+    all_gamma_data = {}
+    if os.path.exists(gamma_file):
+        with open(gamma_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if ':' in line:
+                    name, existing = line.split(':', 1)
+                    all_gamma_data[name] = existing
+
+    code = code.strip()
+    if code.endswith(','):
+        code = code[:-1]
+    all_gamma_data[stock] = code
+
+    # 先寫入暫存文件再替換，讀取方 (例如 sending_discord) 不會讀到寫到一半的文件
+    tmp_file = f"{gamma_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        for name in sorted(all_gamma_data):
+            f.write(f"{name}:{all_gamma_data[name]}\n")
+    os.replace(tmp_file, gamma_file)
+    return gamma_file
+
+# 歷史回補時只接受完整的文件名，避免誤認暫存或手動改名的文件
+ARCHIVE_FILE_PATTERN = re.compile(r'^Gamma_([A-Za-z0-9]+)_(\d{8})\.(html|json)$')
+
+def find_archived_files(roots):
+    """找出 roots (GEX_file 與 GEX_file_backup) 中所有 Gamma 匯出文件
+
+    同一股票同一天有多個文件時，JSON 優先於 HTML，先列出的根目錄優先。
+
+    Returns:
+        dict: {日期: {股票代碼: 文件路徑}}
+    """
+    found = {}
+    for root_index, root in enumerate(roots):
+        if not os.path.exists(root):
+            print(f"略過不存在的目錄: {root}")
+            continue
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                match = ARCHIVE_FILE_PATTERN.match(filename)
+                if not match:
+                    continue
+                ticker, date_str, ext = match.groups()
+                rank = (ext != 'json', root_index)
+                current = found.setdefault(date_str, {}).get(ticker)
+                if current is None or rank < current[0]:
+                    found[date_str][ticker] = (rank, os.path.join(dirpath, filename))
+    return {date_str: {ticker: path for ticker, (_, path) in tickers.items()}
+            for date_str, tickers in found.items()}
+
+def extractor_mtime():
+    """EXTRACTOR_MODULES 中最新的修改時間"""
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    return max(os.path.getmtime(os.path.join(module_dir, name)) for name in EXTRACTOR_MODULES
+               if os.path.exists(os.path.join(module_dir, name)))
+
+def gamma_code_is_current(gamma_file, source_files, code_mtime=None):
+    """輸出文件是否比所有來源文件與提取模組 (EXTRACTOR_MODULES) 都新
+
+    code_mtime 為 extractor_mtime() 的結果，逐日期檢查時傳入避免重複讀取。
+    """
+    if not os.path.exists(gamma_file):
+        return False
+    if code_mtime is None:
+        code_mtime = extractor_mtime()
+    newest_source = max([os.path.getmtime(path) for path in source_files] + [code_mtime])
+    return os.path.getmtime(gamma_file) >= newest_source
+
+def backfill(roots, gamma_code_dir, workers=1, since=None, until=None, force=False, batch_size=200, cache=None,
+             store_dir=None, levels_dir=None):
+    """重新提取所有歷史匯出文件，每個日期輸出一個 gammacode_<日期>.txt
+
+    levels_dir 不為 None 時，同時以 save_gamma_levels 保存每個日期的水平記錄。
+
+    已存在且比來源文件與提取模組都新的日期會略過 (force 為 True 時全部重做)，
+    修改提取邏輯後重跑即可只更新受影響的日期。文件以 batch_size 個為一批並行處理，
+    每批完成後立即寫出該批的日期，中斷後重跑會從未完成的日期繼續。
+    """
+    archived = find_archived_files(roots)
+    dates = sorted(date_str for date_str in archived
+                   if (not since or date_str >= since) and (not until or date_str <= until))
+    
+    pending = []
+    up_to_date = 0
+    code_mtime = extractor_mtime()
+    for date_str in dates:
+        gamma_file = os.path.join(gamma_code_dir, f"gammacode_{date_str}.txt")
+        if not force and gamma_code_is_current(gamma_file, archived[date_str].values(), code_mtime):
+            up_to_date += 1
+        else:
+            pending.append(date_str)
+    
+    total_files = sum(len(archived[date_str]) for date_str in pending)
+    print(f"找到 {len(dates)} 個日期，{up_to_date} 個已是最新，需處理 {len(pending)} 個日期 ({total_files} 個文件)")
+    
+    written = 0
+    failed_files = []
+    started = datetime.now()
+    while pending:
+        # 整個日期放在同一批，批次結束時該日期的所有股票都已處理
+        batch_dates = []
+        batch_files = []
+        while pending and (not batch_files or len(batch_files) + len(archived[pending[0]]) <= batch_size):
+            date_str = pending.pop(0)
+            batch_dates.append(date_str)
+            batch_files.extend((date_str, path) for _, path in sorted(archived[date_str].items()))
+        
+        batch_results = process_html_files([path for _, path in batch_files], workers, cache, store_dir)
+        by_date = {date_str: [] for date_str in batch_dates}
+        for (date_str, path), result in zip(batch_files, batch_results):
+            if result:
+                by_date[date_str].append(result)
+            else:
+                failed_files.append(path)
+        
+        for date_str in batch_dates:
+            results = by_date[date_str]
+            if not results:
+                print(f"警告: {date_str} 沒有成功處理的文件")
+                continue
+            all_gamma_data = {result['stock']: result['gamma_code'] for result in results}
+            write_gamma_code_file(all_gamma_data, results, gamma_code_dir, date_str)
+            if levels_dir is not None:
+                save_gamma_levels([record for result in results for record in result['levels']], levels_dir)
+            written += 1
+        
+        print(f"回補進度: 已寫出 {written} 個日期，剩餘 {len(pending)} 個日期")
+    
+    elapsed = (datetime.now() - started).total_seconds()
+    print(f"\n回補完成: 寫出 {written} 個日期，略過 {up_to_date} 個已是最新的日期，耗時 {elapsed:.1f}s")
+    if failed_files:
+        print(f"處理失敗的文件 {len(failed_files)} 個:")
+        for path in failed_files:
+            print(f"  {path}")
+    return written
 
 def main():
     # 解析命令行參數
@@ -349,12 +786,24 @@ def main():
     parser = argparse.ArgumentParser(description="從 HTML 文件提取 Gamma 數據和處理 Gamma 水平數據")
     parser.add_argument("-n", "--newest", action="store_true", help="尋找最新的 HTML 文件，而不是當日的文件")
     parser.add_argument("-m", "--mode", type=int, choices=[1, 2, 3], default=3, help="處理模式: 1=提取HTML, 2=保存水平數據, 3=兩者都執行 (默認: 3)")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="並行處理的行程數，0 表示使用全部 CPU (默認: 1)")
+    parser.add_argument("--backfill", action="store_true", help="重新提取 GEX_file 與 GEX_file_backup 中所有日期的文件，每個日期輸出一個 gammacode 文件")
+    parser.add_argument("--since", help="回補的起始日期 (YYYYMMDD)")
+    parser.add_argument("--until", help="回補的結束日期 (YYYYMMDD)")
+    parser.add_argument("--force", action="store_true", help="回補時重做已是最新的日期")
+    parser.add_argument("--batch-size", type=int, default=200, help="回補時每批處理的文件數 (默認: 200)")
+    parser.add_argument("--no-cache", action="store_true", help="不使用提取結果快取，全部重新解析")
+    parser.add_argument("--store-dir", default="/home/ben/pCloudDrive/stock/GEX/gamma_profiles", help="完整 Gamma 分布的欄式儲存目錄")
+    parser.add_argument("--no-store", action="store_true", help="不保存完整的 Gamma 分布")
     args = parser.parse_args()
     
     # 設定目錄
     base_dir = "/home/ben/pCloudDrive/stock/GEX/GEX_file"
+    backup_dir = "/home/ben/pCloudDrive/stock/GEX/GEX_file_backup"
     output_base_dir = "/home/ben/pCloudDrive/stock/GEX/gamma_codes"
     gamma_code_dir = os.path.join(base_dir, "gamma_code")
+    cache = None if args.no_cache else ExtractionCache(os.path.join(base_dir, "cache", "extract"), EXTRACTOR_VERSION)
+    store_dir = None if args.no_store else args.store_dir
     
     # 是否尋找最新的 HTML 文件
     use_newest = args.newest
@@ -368,6 +817,11 @@ def main():
     os.makedirs(output_base_dir, exist_ok=True)
     os.makedirs(gamma_code_dir, exist_ok=True)
     
+    if args.backfill:
+        backfill([base_dir, backup_dir], gamma_code_dir, args.workers,
+                 args.since, args.until, args.force, args.batch_size, cache, store_dir, output_base_dir)
+        return
+    
     # 處理模式選擇
     print("請選擇處理模式:")
     print("1. 從 HTML 文件提取 Gamma 數據")
@@ -396,8 +850,8 @@ def main():
     else:
         print("將尋找當日的 HTML 文件")
     
-    # 處理 HTML 文件
-    if choice in ["1", "3"]:
+    # 處理 HTML 文件 (模式 2 也需要提取結果中的水平)
+    if choice in ["1", "2", "3"]:
         # 獲取當日日期
         today_date = datetime.now().strftime('%Y%m%d')
         
@@ -422,91 +876,38 @@ def main():
         
         print(f"找到 {len(stock_dirs)} 個可能的股票目錄")
         
+        # 依目錄名稱排序，合併結果與輸出文件的順序不受檔案系統影響
+        stock_files, skipped_stocks = find_stock_files(sorted(stock_dirs), use_newest, today_date)
+        
         results = []
         processed_stocks = []
-        skipped_stocks = []
         
         # 創建一個字典來存儲所有股票的 Gamma 數據
         all_gamma_data = {}
         
-        for stock_dir in stock_dirs:
-            stock_symbol = os.path.basename(stock_dir)
-            html_dir = os.path.join(stock_dir, "html")
-            
-            if not os.path.exists(html_dir):
-                print(f"跳過 {stock_symbol}: html 目錄不存在 ({html_dir})")
-                skipped_stocks.append(stock_symbol)
-                continue
-            
-            # 找出最新的 HTML 文件
-            latest_html_file = get_latest_html_file(stock_dir, use_newest)
-            
-            if not latest_html_file:
-                print(f"跳過 {stock_symbol}: 未找到符合條件的 HTML 文件")
-                skipped_stocks.append(stock_symbol)
-                continue
-            
-            # 從檔案名中提取日期
-            file_name = os.path.basename(latest_html_file)
-            match = re.search(r'Gamma_\w+_(\d+)\.html', file_name)
-            file_date = match.group(1) if match else today_date
-            
-            print(f"處理股票 {stock_symbol}: 使用最新的 HTML 文件 ({file_date})")
-            
-            # 處理 HTML 文件
-            result = process_html_file(latest_html_file, all_gamma_data)
-            
+        file_results = process_html_files([html_file for _, html_file in stock_files], args.workers, cache,
+                                          store_dir)
+        for (stock_symbol, _), result in zip(stock_files, file_results):
             if result:
                 results.append(result)
                 processed_stocks.append(stock_symbol)
+                all_gamma_data[result['stock']] = result['gamma_code']
                 print(f"成功處理 {stock_symbol}: 提取了 Gamma 數據")
             else:
                 print(f"警告: {stock_symbol} 的文件處理失敗")
                 skipped_stocks.append(stock_symbol)
         
         # 將所有股票的 Gamma 數據存到同一個文件中
-        if all_gamma_data:
-            # 確保輸出目錄存在
-            os.makedirs(gamma_code_dir, exist_ok=True)
-            
-            # 從結果中找出最新的日期
-            # 預設使用最常見的日期
-            date_counts = {}
-            for result in results:
-                if result and 'date' in result:
-                    date = result['date']
-                    date_counts[date] = date_counts.get(date, 0) + 1
-            
-            # 找出最常見的日期
-            most_common_date = today_date
-            max_count = 0
-            for date, count in date_counts.items():
-                if count > max_count:
-                    max_count = count
-                    most_common_date = date
-            
-            # 使用最常見的日期
-            latest_date = most_common_date
-            
-            # 創建輸出文件路徑
-            gamma_file = os.path.join(gamma_code_dir, f"gammacode_{latest_date}.txt")
-            
-            # 將所有股票的數據寫入文件
-            with open(gamma_file, 'w', encoding='utf-8') as f:
-                for stock, code in all_gamma_data.items():
-                    # 確保每個股票的數據格式正確
-                    # 移除可能的尾部空格和多餘的逗號
-                    code = code.strip()
-                    if code.endswith(','):
-                        code = code[:-1]
-                    f.write(f"{stock}:{code}\n")
-            
-            print(f"\n已將所有股票的 Gamma 數據存到: {gamma_file}")
-            print(f"共處理了 {len(all_gamma_data)} 個股票的數據")
+        if all_gamma_data and choice in ["1", "3"]:
+            write_gamma_code_file(all_gamma_data, results, gamma_code_dir, today_date)
+        
+        # 保存結構化的水平記錄
+        if results and choice in ["2", "3"]:
+            save_gamma_levels([record for result in results for record in result['levels']], output_base_dir)
     
         # 生成摘要報告
         if results:
-            df = pd.DataFrame(results)
+            df = pd.DataFrame([{key: value for key, value in result.items() if key != 'levels'} for result in results])
             report_file = os.path.join(output_base_dir, f"gamma_extraction_report_{datetime.now().strftime('%Y%m%d')}.csv")
             df.to_csv(report_file, index=False)
             print(f"已生成摘要報告: {report_file}")
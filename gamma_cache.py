@@ -0,0 +1,91 @@
+"""
+Gamma 提取結果快取
+
+extract_gamma_from_html 解析每個 HTML/JSON 文件後，將提取結果 (GammaProfile: 按價格排序的 Gamma 數據、
+Delta 25、Gamma Field、Gamma Flip、Call Wall、Put Wall) 保存在快取目錄，
+同一文件再次處理時直接讀取，不需要重新解析。
+
+每個來源文件一個快取文件 (並行處理時各行程寫入不同文件)。記錄的大小與修改時間相同時直接命中；
+修改時間不同但大小相同時 (例如從備份複製回來) 比對 SHA-256。
+提取邏輯改變時提高 EXTRACTOR_VERSION，舊的快取會全部失效。
+"""
+
+import os
+import pickle
+import hashlib
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """計算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """以文件路徑、大小、修改時間與內容雜湊為鍵的提取結果快取，可傳給其他行程使用"""
+
+    def __init__(self, cache_dir, version):
+        self.cache_dir = cache_dir
+        self.version = version
+
+    def _entry_path(self, path):
+        key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pkl")
+
+    def _read_entry(self, path):
+        try:
+            with open(self._entry_path(path), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"讀取快取失敗 ({path}): {e}")
+            return None
+
+    def get(self, path):
+        """返回快取的提取結果，沒有或已失效時返回 None"""
+        entry = self._read_entry(path)
+        if not entry or entry.get('version') != self.version or entry.get('path') != os.path.abspath(path):
+            return None
+
+        stat = os.stat(path)
+        if stat.st_size != entry['size']:
+            return None
+        if stat.st_mtime_ns != entry['mtime_ns']:
+            if file_sha256(path) != entry['sha256']:
+                return None
+            # 內容相同，只是修改時間不同，更新記錄避免下次再計算雜湊
+            self._write_entry(path, dict(entry, mtime_ns=stat.st_mtime_ns))
+        return entry['extracted']
+
+    def identify(self, path):
+        """返回文件目前的大小、修改時間與 SHA-256，在提取前取得後傳給 put"""
+        stat = os.stat(path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': file_sha256(path)}
+
+    def put(self, path, extracted, identity=None):
+        """保存一個文件的提取結果
+
+        identity 為提取前 identify(path) 的結果；提取期間文件被取代時，
+        記錄的仍是被提取的舊文件，下次 get 不會命中。None 時現在才取得。
+        """
+        if identity is None:
+            identity = self.identify(path)
+        self._write_entry(path, {
+            'version': self.version,
+            'path': os.path.abspath(path),
+            **identity,
+            'extracted': extracted
+        })
+
+    def _write_entry(self, path, entry):
+        entry_path = self._entry_path(path)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            print(f"寫入快取失敗 ({path}): {e}")
@@ -3,234 +3,189 @@ import argparse
 from datetime import datetime
 import os
 import sys
+import glob
+import time
+import shutil
 import logging
-import hashlib
-
-def convert_to_short(input_text):
-    # 定義映射關係
-    level_mapping = {
-        'Put Dominate': 'PD',
-        'Call Dominate': 'CD',
-        'Gamma Flip': 'GF',
-        'Put Wall': 'PW',
-        'Call Wall': 'CW',
-        'Key Delta': 'KD',
-        'Large Gamma': 'LG',
-        'Gamma Field': 'GFL',
-        'Implied Movement +σ': 'IM+',
-        'Implied Movement -σ': 'IM-',
-        'Implied Movement +2σ': 'IM2+',
-        'Implied Movement -2σ': 'IM2-'
-    }
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from level_codes import (parse_long, parse_short, text_format, unmatched_text, LONG_PAIR_PATTERN, SHORT_PAIR_PATTERN,
+                         SEPARATOR_PATTERN)
+from level_records import render_short, render_long, records_from_levels, write_records
+from levels_db import LEVELS_DB_FILE, LevelsDB
+
+TVCODE_FILE_PATTERN = re.compile(r'^tvcode_(\d{8})\.txt$')
+
+def parse_long_records(input_text):
+    """解析長格式文字
+
+    Returns:
+        (records, unknown): records 為 {股票: {價格: {代碼, ...}}}，
+        unknown 為 {股票: [(無法識別的標籤, 價格), ...]}
+    """
+    records = {}
+    unknown = {}
     
     # 分割每個股票的數據
     stocks = [s.strip() for s in input_text.strip().split('\n\n') if s.strip()]
-    result = []
-    
     for stock in stocks:
-        # 提取股票代碼
-        symbol = stock.split(':')[0].strip()
+        # 提取股票代碼和所有價格與 level 對
+        symbol, pairs = parse_long(stock)
         
         # 創建價格到level的映射
-        price_levels = {}
-        
-        # 提取所有價格和level對
-        pairs = re.findall(r'([^,]+),\s*([\d.]+)', stock)
-        
-        for level, price in pairs:
-            price = float(price)
-            level = level.strip()
-            has_ce = ' CE' in level
-            
-            # 分割多個level（如果有的話）
-            sub_levels = [l.strip() for l in level.replace(' CE', '').split('&')]
-            
-            # 轉換每個level到簡短代碼
-            for sub_level in sub_levels:
-                for full_name, code in level_mapping.items():
-                    if full_name in sub_level:
-                        if price not in price_levels:
-                            price_levels[price] = set()
-                        if has_ce:
-                            # 如果是 CE 後綴，只添加帶 CE 的代碼
-                            price_levels[price].add(code + 'CE')
-                        else:
-                            # 如果不是 CE 後綴，只添加基礎代碼
-                            price_levels[price].add(code)
-                        break  # 找到匹配後就跳出，避免重複添加
-        
-        # 構建輸出字符串
-        output_parts = [symbol + ':']
-        for price, codes in sorted(price_levels.items()):
-            # 將 set 轉換為列表並排序，確保每個代碼只出現一次
-            codes_list = sorted(list(codes))
-            codes_str = ','.join(codes_list)
-            output_parts.append(f"{codes_str}={price}")
-        
-        result.append(''.join(output_parts))
-    
-    return '\n'.join(result)
-
-def convert_to_long(input_text):
-    # 定義反向映射關係
-    reverse_mapping = {
-        'PD': 'Put Dominate',
-        'CD': 'Call Dominate',
-        'GF': 'Gamma Flip',
-        'PW': 'Put Wall',
-        'CW': 'Call Wall',
-        'KD': 'Key Delta',
-        'LG': 'Large Gamma',
-        'GFL': 'Gamma Field',
-        'IM+': 'Implied Movement +σ',
-        'IM-': 'Implied Movement -σ',
-        'IM2+': 'Implied Movement +2σ',
-        'IM2-': 'Implied Movement -2σ'
-    }
+        price_levels = records.setdefault(symbol, {})
+        for label, codes, price in pairs:
+            if codes:
+                price_levels.setdefault(price, set()).update(codes)
+            else:
+                unknown.setdefault(symbol, []).append((label, price))
     
-    result = []
+    return records, unknown
+
+def parse_short_records(input_text):
+    """解析短格式文字為 {股票: {價格: (代碼, ...)}}，價格與代碼保持出現的順序"""
+    records = {}
     lines = [l.strip() for l in input_text.strip().split('\n') if l.strip()]
     
     for line in lines:
-        try:
-            # 忽略分隔線（如 "===== spx ====="）
-            if re.match(r'^=+\s+\w+\s+=+$', line):
-                continue
-                
-            if ':' not in line:
-                continue
-                
-            # 提取股票代碼和數據
-            symbol, data = line.split(':', 1)
-            symbol = symbol.strip()
-            
-            # 解析所有價格和代碼對
-            levels = []
-            
-            # 使用正則表達式分割數據
-            pairs = re.findall(r'([^=]+)=(\d+\.?\d*)', data)
-            
-            for codes, price in pairs:
-                try:
-                    price = float(price)
-                    codes = [c.strip() for c in codes.split(',') if c.strip()]
-                    
-                    # 轉換代碼到完整名稱
-                    full_names = []
-                    for code in codes:
-                        if code.endswith('CE'):
-                            base_code = code[:-2]
-                            if base_code in reverse_mapping:
-                                full_names.append(reverse_mapping[base_code] + ' CE')
-                        else:
-                            if code in reverse_mapping:
-                                full_names.append(reverse_mapping[code])
-                    
-                    if full_names:
-                        levels.append(f"{' & '.join(full_names)}, {price}")
-                except Exception as e:
-                    print(f"警告：處理價格對時出錯 '{codes}={price}': {str(e)}")
-                    continue
-            
-            # 組合結果
-            if levels:
-                result.append(f"{symbol}: {', '.join(levels)}")
-                
-        except Exception as e:
-            print(f"警告：處理行 '{line}' 時出錯: {str(e)}")
+        # 忽略分隔線（如 "===== spx ====="）
+        if SEPARATOR_PATTERN.match(line):
+            continue
+        
+        # 提取股票代碼並解析所有價格和代碼對
+        parsed = parse_short(line)
+        if parsed is None:
             continue
+        symbol, pairs = parsed
+        
+        price_levels = records.setdefault(symbol, {})
+        for codes, price in pairs:
+            existing = price_levels.get(price)
+            if existing is None:
+                price_levels[price] = codes
+            else:
+                # 同一價格出現多次時合併代碼
+                price_levels[price] = existing + tuple(code for code in codes if code not in existing)
+    
+    return records
+
+def convert_to_short(input_text, date_str=None):
+    """長格式轉為短格式 (同一股票出現多次時合併為一行)"""
+    records, _ = parse_long_records(input_text)
+    return render_short(records_from_levels(records, date_str))
+
+def convert_to_long(input_text, date_str=None):
+    """短格式轉為長格式"""
+    return render_long(records_from_levels(parse_short_records(input_text), date_str))
+
+def find_unparsed(input_text, is_short=False):
+    """找出原始文字中沒有被解析為水平的部分 (分隔線除外)
+
+    Returns:
+        [(股票代碼, 未解析的文字, 是否完全沒有解析到水平), ...]，沒有股票代碼的段落或行代碼為 None
+    """
+    if is_short:
+        pattern = SHORT_PAIR_PATTERN
+        chunks = input_text.split('\n')
+    else:
+        pattern = LONG_PAIR_PATTERN
+        chunks = input_text.split('\n\n')
     
-    return '\n\n'.join(result)
+    unparsed = []
+    for chunk in chunks:
+        chunk = '\n'.join(line for line in chunk.strip().split('\n') if not SEPARATOR_PATTERN.match(line.strip()))
+        if not chunk.strip():
+            continue
+        symbol, sep, body = chunk.partition(':')
+        if not sep:
+            unparsed.append((None, chunk.strip(), True))
+            continue
+        leftover = unmatched_text(pattern, body)
+        if leftover:
+            unparsed.append((symbol.strip(), leftover, not pattern.search(body)))
+    return unparsed
 
 def get_today_filename():
     """獲取今天的文件名格式"""
     return f"tvcode_{datetime.now().strftime('%Y%m%d')}.txt"
 
-def validate_conversion(original_text, converted_text, is_reverse=False):
+def diff_records(expected, actual):
+    """逐個股票比較兩份 {股票: {價格: 代碼}}
+
+    Returns:
+        {股票: (遺失的 [(價格, 代碼), ...], 多出的 [(價格, 代碼), ...])}，只包括有差異的股票
+    """
+    diffs = {}
+    for symbol in list(expected) + [symbol for symbol in actual if symbol not in expected]:
+        expected_prices = expected.get(symbol, {})
+        actual_prices = actual.get(symbol, {})
+        if expected_prices.keys() == actual_prices.keys() and all(
+                len(codes) == len(actual_prices[price]) and set(codes).issuperset(actual_prices[price])
+                for price, codes in expected_prices.items()):
+            continue
+        expected_levels = {(price, code) for price, codes in expected_prices.items() for code in codes}
+        actual_levels = {(price, code) for price, codes in actual_prices.items() for code in codes}
+        lost = sorted(expected_levels - actual_levels)
+        added = sorted(actual_levels - expected_levels)
+        if lost or added:
+            diffs[symbol] = (lost, added)
+    return diffs
+
+def format_levels(levels):
+    return ', '.join(f"{code}={price}" for price, code in levels)
+
+def validate_conversion(records, converted_text, is_reverse=False, unknown=None, source_text=None):
     """驗證轉換是否成功
     
-    檢查轉換前後的數據是否保持一致性，確保沒有數據丟失
+    將轉換後的文本解析回結構化記錄，與轉換前解析得到的記錄逐個股票比較，確保沒有數據丟失；
+    有 source_text 時同時檢查原始文字是否全部被解析 (有內容卻沒有解析到水平的股票、沒有被匹配的文字都算失敗)
     
     Args:
-        original_text: 原始文本
+        records: 轉換前解析得到的 {股票: {價格: 代碼}}
         converted_text: 轉換後的文本
-        is_reverse: 是否為反向轉換
+        is_reverse: 是否為反向轉換 (短格式轉長格式)
+        unknown: 轉換前無法識別的標籤 {股票: [(標籤, 價格), ...]}
+        source_text: 轉換前的原始文本
         
     Returns:
-        (bool, str): 驗證結果和錯誤信息
+        (bool, str): 驗證結果和錯誤信息 (每個有差異的股票一行)
     """
-    # 移除空白行和空格進行比較
-    original_clean = '\n'.join([line.strip() for line in original_text.strip().split('\n') if line.strip()])
-    converted_clean = '\n'.join([line.strip() for line in converted_text.strip().split('\n') if line.strip()])
-    
-    # 檢查股票代碼是否一致
-    original_symbols = set()
-    converted_symbols = set()
-    
-    # 根據格式提取股票代碼
     if is_reverse:
-        # 從短格式提取股票代碼
-        for line in original_clean.split('\n'):
-            if ':' in line:
-                symbol = line.split(':', 1)[0].strip()
-                original_symbols.add(symbol)
-        
-        # 從長格式提取股票代碼
-        for block in converted_clean.split('\n\n'):
-            if ':' in block:
-                symbol = block.split(':', 1)[0].strip()
-                converted_symbols.add(symbol)
+        converted, _ = parse_long_records(converted_text)
     else:
-        # 從長格式提取股票代碼
-        for block in original_clean.split('\n\n'):
-            if ':' in block:
-                symbol = block.split(':', 1)[0].strip()
-                original_symbols.add(symbol)
-        
-        # 從短格式提取股票代碼
-        for line in converted_clean.split('\n'):
-            if ':' in line:
-                symbol = line.split(':', 1)[0].strip()
-                converted_symbols.add(symbol)
+        converted = parse_short_records(converted_text)
     
-    # 檢查股票代碼是否一致
-    if original_symbols != converted_symbols:
-        missing = original_symbols - converted_symbols
-        extra = converted_symbols - original_symbols
-        error_msg = []
-        
-        if missing:
-            error_msg.append(f"缺少股票代碼: {', '.join(missing)}")
-        if extra:
-            error_msg.append(f"多出股票代碼: {', '.join(extra)}")
-            
-        return False, '\n'.join(error_msg)
+    error_msg = []
+    missing = [symbol for symbol in records if symbol not in converted]
+    extra = [symbol for symbol in converted if symbol not in records]
+    if missing:
+        error_msg.append(f"缺少股票代碼: {', '.join(missing)}")
+    if extra:
+        error_msg.append(f"多出股票代碼: {', '.join(extra)}")
     
-    # 計算內容雜湊值，用於檢查數據完整性
-    original_hash = hashlib.md5(original_clean.encode()).hexdigest()
+    if source_text is not None:
+        for symbol, text, no_levels in find_unparsed(source_text, is_reverse):
+            if len(text) > 80:
+                text = text[:77] + '...'
+            if no_levels:
+                error_msg.append(f"{symbol or '(無股票代碼)'}: 沒有解析到任何水平: {text}")
+            else:
+                error_msg.append(f"{symbol}: 未解析的文字: {text}")
     
-    # 如果是正向轉換，再轉換回來檢查一致性
-    if not is_reverse:
-        back_converted = convert_to_long(converted_clean)
-        back_converted_clean = '\n'.join([line.strip() for line in back_converted.strip().split('\n') if line.strip()])
-        back_hash = hashlib.md5(back_converted_clean.encode()).hexdigest()
-        
-        # 檢查轉換回來的內容是否與原始內容一致
-        if original_hash != back_hash:
-            return False, "轉換後再轉換回來的內容與原始內容不一致，可能有數據丟失"
-    else:
-        # 如果是反向轉換，再轉換回來檢查一致性
-        back_converted = convert_to_short(converted_clean)
-        back_converted_clean = '\n'.join([line.strip() for line in back_converted.strip().split('\n') if line.strip()])
-        
-        # 與原始短格式比較
-        original_short_hash = hashlib.md5(original_clean.encode()).hexdigest()
-        back_short_hash = hashlib.md5(back_converted_clean.encode()).hexdigest()
-        
-        if original_short_hash != back_short_hash:
-            return False, "反向轉換後再轉換回來的內容與原始短格式不一致，可能有數據丟失"
+    for symbol, labels in (unknown or {}).items():
+        error_msg.append(f"{symbol}: 無法識別 {', '.join(f'{label}={price}' for label, price in labels)}")
+    
+    for symbol, (lost, added) in diff_records(records, converted).items():
+        if symbol in missing or symbol in extra:
+            continue
+        parts = []
+        if lost:
+            parts.append(f"遺失 {format_levels(lost)}")
+        if added:
+            parts.append(f"多出 {format_levels(added)}")
+        error_msg.append(f"{symbol}: {'；'.join(parts)}")
     
-    return True, ""
+    return not error_msg, '\n'.join(error_msg)
 
 def find_gex_path():
     """查找正確的GEX文件路徑"""
@@ -244,13 +199,222 @@ def find_gex_path():
             return path
     return None
 
-if __name__ == "__main__":
+def write_atomic(path, text):
+    """先寫入暫存文件再替換，中途失敗不會留下寫到一半的文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def get_output_file(input_file, reverse=False, overwrite=False):
+    """轉換後的文件路徑
+
+    覆蓋模式下為輸入文件；否則轉換後的檔案使用原始檔名，原始格式的檔案加上 orig 字樣。
+    """
+    if overwrite or not reverse:
+        return input_file
+    base_path, filename = os.path.split(input_file)
+    return os.path.join(base_path, f"orig_{filename}")
+
+def backup_original(input_file):
+    """正向轉換前備份原始檔案為 orig_<文件名>，已有備份時不覆蓋"""
+    base_path, filename = os.path.split(input_file)
+    orig_backup = os.path.join(base_path, f"orig_{filename}")
+    if os.path.exists(orig_backup):
+        return
+    try:
+        shutil.copy2(input_file, orig_backup)
+        logging.info(f"已備份原始檔案至 {orig_backup}")
+    except Exception as e:
+        logging.warning(f"警告：備份原始檔案時出錯: {str(e)}")
+
+def get_records_base(input_file):
+    """水平記錄的路徑 (不含副檔名) 與日期: tvcode_<日期>.txt -> 同目錄的 levels_<日期>，文件名不符時返回 (None, None)"""
+    base_path, filename = os.path.split(input_file)
+    match = TVCODE_FILE_PATTERN.match(filename)
+    if not match:
+        return None, None
+    date_str = match.group(1)
+    return os.path.join(base_path, f"levels_{date_str}"), date_str
+
+def get_levels_db_path(input_file):
+    """水平資料庫的路徑: 與 tvcode 文件同目錄的 levels.db"""
+    return os.path.join(os.path.dirname(input_file), LEVELS_DB_FILE)
+
+def save_records(input_file, records):
+    """將水平記錄 (LevelRecord 列表) 寫為 levels_<日期>.jsonl 與 .npy，並更新水平資料庫中該日期的記錄
+
+    Returns:
+        記錄的路徑 (不含副檔名)，無法取得日期時返回 None
+    """
+    records_base, date_str = get_records_base(input_file)
+    if records_base is None:
+        return None
+    write_records(records_base, records)
+    with LevelsDB(get_levels_db_path(input_file)) as db:
+        db.replace_day(date_str, records, os.path.basename(input_file), os.path.getmtime(input_file))
+    logging.debug(f"已寫出水平記錄 {records_base}.jsonl/.npy 並更新 {LEVELS_DB_FILE}")
+    return records_base
+
+def records_are_current(input_file):
+    """水平記錄文件與資料庫是否都已包含 input_file 目前的內容"""
+    records_base, date_str = get_records_base(input_file)
+    if records_base is None or not os.path.exists(records_base + '.npy'):
+        return False
+    with LevelsDB(get_levels_db_path(input_file)) as db:
+        return db.day_mtime(date_str) == os.path.getmtime(input_file)
+
+def convert_file(input_file, reverse=False, overwrite=False, force=False, save_levels=True):
+    """轉換單個文件
+
+    已經是目標格式的文件 (或空文件) 不會再轉換。save_levels 為 True 時同時寫出結構化的水平記錄
+    (level_records) 並更新水平資料庫 (levels_db)，已是目標格式但記錄不是最新的文件也會補寫記錄。
+
+    Returns:
+        (str, str): 狀態 ("converted"、"skipped" 或 "failed") 與說明
+    """
+    if not os.path.exists(input_file):
+        return 'failed', f"錯誤：找不到輸入文件 {input_file}"
+    
+    try:
+        # 讀取輸入文件
+        with open(input_file, 'r', encoding='utf-8') as f:
+            input_data = f.read()
+        logging.debug(f"讀取的輸入數據：\n{input_data}\n")
+        
+        records_base, date_str = get_records_base(input_file)
+        current_format = text_format(input_data)
+        if current_format is None:
+            return 'skipped', "空文件"
+        if current_format == ('long' if reverse else 'short'):
+            message = f"已是{'原始' if reverse else '簡化'}格式"
+            if save_levels and records_base is not None and not records_are_current(input_file):
+                levels = parse_short_records(input_data) if current_format == 'short' else \
+                    parse_long_records(input_data)[0]
+                save_records(input_file, records_from_levels(levels, date_str))
+                message += "，已補寫水平記錄"
+            return 'skipped', message
+        
+        # 根據參數選擇轉換方向，解析一次得到的水平記錄同時用於輸出、驗證與保存
+        unknown = None
+        if reverse:
+            levels = parse_short_records(input_data)
+            logging.debug("執行反向轉換：從簡化格式轉換為原始格式")
+        else:
+            levels, unknown = parse_long_records(input_data)
+            logging.debug("執行正向轉換：從原始格式轉換為簡化格式")
+        records = records_from_levels(levels, date_str)
+        output = render_long(records) if reverse else render_short(records)
+        logging.debug(f"轉換後的數據：\n{output}\n")
+        
+        # 驗證轉換結果
+        is_valid, error_msg = validate_conversion(levels, output, reverse, unknown, input_data)
+        if not is_valid:
+            logging.warning(f"{input_file} 轉換驗證失敗:\n{error_msg}")
+            if not force:
+                return 'failed', f"轉換驗證失敗:\n{error_msg}"
+            logging.warning("強制繼續轉換，即使驗證失敗")
+        
+        if not reverse and not overwrite:
+            backup_original(input_file)
+        
+        # 保存到輸出文件
+        output_file = get_output_file(input_file, reverse, overwrite)
+        write_atomic(output_file, output)
+        if save_levels:
+            # 記錄寫入失敗不影響已完成的轉換
+            try:
+                save_records(input_file, records)
+            except Exception as e:
+                logging.warning(f"警告：寫出 {input_file} 的水平記錄時出錯: {str(e)}")
+        return 'converted', output_file
+    
+    except Exception as e:
+        logging.debug(traceback.format_exc())
+        return 'failed', f"處理文件時發生錯誤 - {str(e)}"
+
+def convert_task(task):
+    """在工作行程中轉換一個文件，返回 (文件, 狀態, 說明, 耗時)"""
+    input_file, reverse, overwrite, force, save_levels = task
+    started = time.perf_counter()
+    status, message = convert_file(input_file, reverse, overwrite, force, save_levels)
+    return input_file, status, message, time.perf_counter() - started
+
+def find_tvcode_files(base_path, date_from=None, date_to=None):
+    """列出 base_path 中日期在 [date_from, date_to] 之間的 tvcode_<YYYYMMDD>.txt (不含 orig_ 備份)"""
+    files = []
+    for path in glob.glob(os.path.join(base_path, "tvcode_*.txt")):
+        match = TVCODE_FILE_PATTERN.match(os.path.basename(path))
+        if not match:
+            continue
+        date_str = match.group(1)
+        if (date_from and date_str < date_from) or (date_to and date_str > date_to):
+            continue
+        files.append(path)
+    return sorted(files)
+
+def convert_files(files, reverse=False, overwrite=False, force=False, workers=1, save_levels=True):
+    """在同一個行程 (或工作行程池) 中轉換多個文件並輸出統計，返回 {狀態: [文件, ...]}"""
+    started = time.perf_counter()
+    tasks = [(path, reverse, overwrite, force, save_levels) for path in files]
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks)))
+    
+    outcomes = {'converted': [], 'skipped': [], 'failed': []}
+    
+    def record(result):
+        input_file, status, message, elapsed = result
+        outcomes[status].append(input_file)
+        line = f"[{status}] {os.path.basename(input_file)} ({elapsed:.2f}s)"
+        if status != 'converted':
+            line += f": {message}"
+        if status == 'failed':
+            logging.error(line)
+        else:
+            logging.info(line)
+    
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for result in executor.map(convert_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+                record(result)
+    else:
+        for task in tasks:
+            record(convert_task(task))
+    
+    elapsed = time.perf_counter() - started
+    print(f"\n共 {len(files)} 個文件: 轉換 {len(outcomes['converted'])}，略過 {len(outcomes['skipped'])}，"
+          f"失敗 {len(outcomes['failed'])}，總耗時 {elapsed:.2f}s (workers={workers})")
+    for path in outcomes['failed']:
+        print(f"  失敗: {path}")
+    return outcomes
+
+def valid_date(value):
+    """argparse 的 YYYYMMDD 日期參數"""
+    try:
+        datetime.strptime(value, '%Y%m%d')
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"日期格式應為 YYYYMMDD: {value}")
+    return value
+
+def main():
     parser = argparse.ArgumentParser(description='轉換 Gamma Levels 數據格式')
     parser.add_argument('-r', '--reverse', action='store_true', help='將簡化格式轉換回原始格式')
     parser.add_argument('--filepath', help='指定完整的文件路徑，優先於自動查找')
+    parser.add_argument('--from', dest='date_from', type=valid_date,
+                        help='批次轉換: 起始日期 YYYYMMDD (與 --to 一起使用，未指定 --to 時到今天)')
+    parser.add_argument('--to', dest='date_to', type=valid_date, help='批次轉換: 結束日期 YYYYMMDD')
+    parser.add_argument('--glob', dest='pattern', help='批次轉換: 符合的所有文件，例如 "tvcode/tvcode_2024*.txt"')
+    parser.add_argument('--dir', help='--from/--to 使用的 tvcode 目錄 (default: 自動查找)')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='批次轉換的並行行程數，0 表示使用所有 CPU (default: 1)')
     parser.add_argument('-d', '--debug', action='store_true', help='顯示調試信息')
     parser.add_argument('--overwrite', action='store_true', help='直接覆蓋原始文件')
     parser.add_argument('--force', action='store_true', help='強制轉換，即使驗證失敗')
+    parser.add_argument('--no-levels', action='store_true', help='不寫出結構化的水平記錄 (levels_<日期>.jsonl/.npy) 與更新 levels.db')
     parser.add_argument('--log', help='指定日誌文件路徑')
     args = parser.parse_args()
     
@@ -262,126 +426,58 @@ if __name__ == "__main__":
     else:
         logging.basicConfig(level=log_level, format=log_format)
     
-    # 顯示棄用警告
-    if hasattr(args, 'path') and args.path or hasattr(args, 'file') and args.file:
-        logging.warning("--path 和 --file 參數已棄用，請使用 --filepath 指定完整文件路徑")
+    batch = args.pattern or args.date_from or args.date_to
+    if batch and args.filepath:
+        parser.error("--filepath 不能與 --from/--to/--glob 同時使用")
     
-    # 確定文件路徑
-    input_file = None
-    base_path = None
-    filename = None
+    if batch:
+        if args.pattern:
+            files = sorted(path for path in glob.glob(args.pattern)
+                           if not os.path.basename(path).startswith("orig_"))
+        else:
+            base_path = args.dir or find_gex_path()
+            if not base_path:
+                print("錯誤：找不到有效的GEX文件路徑")
+                sys.exit(1)
+            date_to = args.date_to or datetime.now().strftime('%Y%m%d')
+            files = find_tvcode_files(base_path, args.date_from, date_to)
+        if not files:
+            print("沒有符合條件的文件")
+            sys.exit(1)
+        
+        print(f"批次{'反向' if args.reverse else '正向'}轉換 {len(files)} 個文件")
+        outcomes = convert_files(files, args.reverse, args.overwrite, args.force, args.workers,
+                                 not args.no_levels)
+        sys.exit(1 if outcomes['failed'] else 0)
     
+    # 確定文件路徑
     if args.filepath:
         # 優先使用完整文件路徑
         input_file = args.filepath
-        # 從完整路徑中提取 base_path 和 filename
-        base_path = os.path.dirname(input_file)
-        filename = os.path.basename(input_file)
         logging.info(f"使用指定的完整文件路徑: {input_file}")
-        logging.info(f"提取的路徑: {base_path}, 文件名: {filename}")
     else:
         # 使用自動查找的路徑
-        base_path = find_gex_path()
+        base_path = args.dir or find_gex_path()
         if not base_path:
             logging.error("錯誤：找不到有效的GEX文件路徑")
             print("錯誤：找不到有效的GEX文件路徑")
-            exit(1)
+            sys.exit(1)
         
-        # 獲取文件名
-        filename = get_today_filename()
-        input_file = os.path.join(base_path, filename)
+        input_file = os.path.join(base_path, get_today_filename())
         logging.info(f"使用自動查找的文件路徑: {input_file}")
     
-    # 確保 base_path 和 filename 已經設置
-    if base_path is None or filename is None:
-        logging.error("錯誤：base_path 或 filename 未設置")
-        print("錯誤：base_path 或 filename 未設置")
-        exit(1)
-        
-    if args.overwrite:
-        # 如果使用覆蓋模式，輸出文件就是輸入文件
-        output_file = input_file
+    status, message = convert_file(input_file, args.reverse, args.overwrite, args.force, not args.no_levels)
+    if status == 'converted':
+        print("轉換完成！")
+        print(f"文件已更新：{message}")
+    elif status == 'skipped':
+        print(f"略過 {input_file}: {message}")
     else:
-        # 修改命名方式：轉換後的檔案使用原始檔名，原始檔案加上 orig 字樣
-        if args.reverse:
-            # 反向轉換時，輸入檔案是原始檔案，輸出檔案是原始格式加上 orig 字樣
-            output_file = os.path.join(base_path, f"orig_{filename}")
-        else:
-            # 正向轉換時，輸入檔案是原始檔案，輸出檔案直接使用原始檔名
-            # 先備份原始檔案
-            orig_backup = os.path.join(base_path, f"orig_{filename}")
-            if not os.path.exists(orig_backup):
-                try:
-                    import shutil
-                    shutil.copy2(input_file, orig_backup)
-                    print(f"已備份原始檔案至 {orig_backup}")
-                    logging.info(f"已備份原始檔案至 {orig_backup}")
-                except Exception as e:
-                    error_msg = f"警告：備份原始檔案時出錯: {str(e)}"
-                    print(error_msg)
-                    logging.warning(error_msg)
-            output_file = input_file
-    
-    # 檢查輸入文件是否存在
-    if not os.path.exists(input_file):
-        error_msg = f"錯誤：找不到輸入文件 {input_file}"
-        logging.error(error_msg)
-        print(error_msg)
-        exit(1)
-    
-    try:
-            
-        # 讀取輸入文件
-        with open(input_file, 'r', encoding='utf-8') as f:
-            input_data = f.read()
-            if args.debug:
-                logging.debug(f"讀取的輸入數據：\n{input_data}\n")
-                print(f"讀取的輸入數據：\n{input_data}\n")
-        
-        # 根據參數選擇轉換方向
-        if args.reverse:
-            output = convert_to_long(input_data)
-            logging.info("執行反向轉換：從簡化格式轉換為原始格式")
-        else:
-            output = convert_to_short(input_data)
-            logging.info("執行正向轉換：從原始格式轉換為簡化格式")
-        
-        if args.debug:
-            logging.debug(f"轉換後的數據：\n{output}\n")
-            print(f"轉換後的數據：\n{output}\n")
-        
-        # 驗證轉換結果
-        is_valid, error_msg = validate_conversion(input_data, output, args.reverse)
-        
-        if not is_valid:
-            logging.warning(f"轉換驗證失敗: {error_msg}")
-            print(f"警告：轉換驗證失敗: {error_msg}")
-            
-            if not args.force:
-                print("轉換未完成。如果仍要繼續，請使用 --force 參數強制轉換。")
-                logging.error("轉換中止：驗證失敗且未使用 --force 參數")
-                exit(1)
-            else:
-                print("警告：強制繼續轉換，即使驗證失敗")
-                logging.warning("強制繼續轉換，即使驗證失敗")
-        else:
-            logging.info("轉換驗證成功：數據保持一致性")
-            print("轉換驗證成功：數據保持一致性")
-        
-        # 保存到輸出文件
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(output)
-        
-        logging.info(f"轉換完成！文件已更新：{output_file}")
-        print(f"轉換完成！")
-        print(f"文件已更新：{output_file}")
-        
-    except Exception as e:
-        logging.error(f"錯誤：處理文件時發生錯誤 - {str(e)}")
-        print(f"錯誤：處理文件時發生錯誤 - {str(e)}")
-        if args.debug:
-            import traceback
-            traceback_str = traceback.format_exc()
-            logging.debug(traceback_str)
-            print(traceback_str)
-        exit(1)
\ No newline at end of file
+        logging.error(message)
+        print(message)
+        if not args.force and message.startswith("轉換驗證失敗"):
+            print("轉換未完成。如果仍要繼續，請使用 --force 參數強制轉換。")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Gamma 分布欄式儲存
+
+extract_gamma_from_html 每處理一個文件，就把完整的逐價格 Gamma 分布寫入
+<store_dir>/ticker=<股票>/date=<YYYYMMDD>/ 分區，之後的分析可以直接向量化讀取多年的數據，
+不需要重新解析 HTML。
+
+欄位: strike, net_gamma, gamma_<trace 名稱> (每個 bar trace 一欄), delta25, gamma_field, gamma_flip,
+call_wall, put_wall (水平在每一列重複，欄式壓縮後幾乎不佔空間)。
+
+有 pyarrow 時保存為 profile.parquet，否則保存為 NumPy 的 profile.npz；讀取時兩種格式都支援。
+"""
+
+import os
+import re
+import glob
+import json
+import numpy as np
+import pandas as pd
+from gamma_profile import LEVELS
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+LEVEL_COLUMNS = LEVELS
+
+def trace_column(name):
+    """trace 名稱轉為欄位名稱，例如 "Call Gamma" -> "gamma_call_gamma" """
+    return "gamma_" + (re.sub(r'[^0-9a-z]+', '_', str(name).lower()).strip('_') or "trace")
+
+def partition_dir(store_dir, ticker, date_str):
+    return os.path.join(store_dir, f"ticker={ticker.upper()}", f"date={date_str}")
+
+def profile_frame(profile):
+    """將一個股票一天的 GammaProfile 組成 DataFrame"""
+    columns = {"strike": profile.strikes, "net_gamma": profile.gammas}
+    for name, values in profile.traces().items():
+        column = trace_column(name)
+        while column in columns:
+            column += "_"
+        columns[column] = values
+    for column, value in zip(LEVEL_COLUMNS, profile.levels):
+        columns[column] = np.full(len(profile), -1 if value is None else value, dtype=np.float64)
+    return pd.DataFrame(columns)
+
+def has_profile(store_dir, ticker, date_str):
+    """一個股票一天的分區是否已存在 (任一種格式)"""
+    target_dir = partition_dir(store_dir, ticker, date_str)
+    return any(os.path.exists(os.path.join(target_dir, name)) for name in ("profile.parquet", "profile.npz"))
+
+def write_profile(store_dir, ticker, date_str, profile):
+    """寫入 (覆蓋) 一個股票一天的分區，返回文件路徑"""
+    frame = profile_frame(profile)
+    target_dir = partition_dir(store_dir, ticker, date_str)
+    os.makedirs(target_dir, exist_ok=True)
+
+    if HAS_PARQUET:
+        path = os.path.join(target_dir, "profile.parquet")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        frame.to_parquet(tmp_path, index=False, compression="zstd")
+    else:
+        path = os.path.join(target_dir, "profile.npz")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, __columns__=np.array(json.dumps(list(frame.columns))),
+                                **{column: frame[column].to_numpy() for column in frame.columns})
+    os.replace(tmp_path, path)
+
+    # 同一分區只保留一種格式，避免讀到舊的文件
+    for stale in ("profile.parquet", "profile.npz"):
+        stale_path = os.path.join(target_dir, stale)
+        if stale_path != path and os.path.exists(stale_path):
+            os.remove(stale_path)
+    return path
+
+def read_partition(path):
+    """讀取一個分區文件為 DataFrame"""
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    with np.load(path) as data:
+        columns = json.loads(str(data["__columns__"]))
+        return pd.DataFrame({column: data[column] for column in columns})
+
+def list_partitions(store_dir, tickers=None, since=None, until=None):
+    """列出符合條件的分區 [(股票, 日期, 文件路徑), ...]，按股票與日期排序"""
+    wanted = {ticker.upper() for ticker in tickers} if tickers else None
+    partitions = []
+    for path in glob.glob(os.path.join(store_dir, "ticker=*", "date=*", "profile.*")):
+        if not path.endswith((".parquet", ".npz")):
+            continue
+        date_dir = os.path.dirname(path)
+        ticker = os.path.basename(os.path.dirname(date_dir)).split("=", 1)[1]
+        date_str = os.path.basename(date_dir).split("=", 1)[1]
+        if wanted and ticker not in wanted:
+            continue
+        if (since and date_str < since) or (until and date_str > until):
+            continue
+        partitions.append((ticker, date_str, path))
+    return sorted(partitions)
+
+def read_profiles(store_dir, tickers=None, since=None, until=None):
+    """讀取多個股票多天的 Gamma 分布，返回加上 ticker 與 date 欄位的 DataFrame
+
+    不同股票的 trace 欄位可能不同，缺少的欄位為 NaN。
+    """
+    frames = []
+    for ticker, date_str, path in list_partitions(store_dir, tickers, since, until):
+        frame = read_partition(path)
+        frame.insert(0, "date", date_str)
+        frame.insert(0, "ticker", ticker)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=["ticker", "date", "strike", "net_gamma", *LEVEL_COLUMNS])
+    return pd.concat(frames, ignore_index=True)
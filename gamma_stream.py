@@ -0,0 +1,97 @@
+"""
+Plotly 圖表數據的串流解碼
+
+以 ijson 逐個讀取 Plotly.newPlot 的參數 (HTML 匯出) 或網路擷取的 {data, layout} JSON 中的
+trace 與 layout annotations，不建立整個圖表的 Python 物件：同一時間只有一個 trace 被解碼，
+bar trace 的 x/y 立即轉為 float64 陣列，其他 trace 直接丟棄。
+trace 與 annotations 各掃描一次，ijson 的 C 後端 (yajl2_c) 下比 json 完整解碼更快。
+
+ijson 為可選依賴，未安裝時 HAS_IJSON 為 False，由 extract_gamma_from_html 改用 json 完整解碼。
+"""
+
+import base64
+import numpy as np
+
+try:
+    import ijson
+    HAS_IJSON = True
+except ImportError:
+    HAS_IJSON = False
+
+ANNOTATION_FIELDS = ('text', 'xanchor', 'x', 'y')
+
+class SliceReader:
+    """將 mmap 的一段包成 JSON 陣列 ([ 片段 ]) 的唯讀文件物件，供 ijson 逐塊讀取"""
+
+    def __init__(self, mm, start, end, prefix=b'[', suffix=b']'):
+        self.mm = mm
+        self.pos = start
+        self.end = end
+        self.prefix = prefix
+        self.suffix = suffix
+
+    def read(self, size=-1):
+        if size == 0:
+            # ijson 以 read(0) 判斷是位元組還是文字
+            return b''
+        if size is None or size < 0:
+            size = self.end - self.pos + len(self.prefix) + len(self.suffix)
+        chunk = self.prefix
+        self.prefix = b''
+        take = max(0, min(size - len(chunk), self.end - self.pos))
+        if take:
+            chunk += self.mm[self.pos:self.pos + take]
+            self.pos += take
+        if self.pos >= self.end and len(chunk) < size:
+            chunk += self.suffix
+            self.suffix = b''
+        return chunk
+
+def trace_array(item, axis):
+    """返回 trace 的 x 或 y 為 float64 陣列，支援一般列表與 plotly 的型別陣列"""
+    value = item.get(axis, [])
+    if isinstance(value, dict) and 'bdata' in value:
+        return decode_typed_array(value).astype(np.float64)
+    return np.asarray(value, dtype=np.float64)
+
+def decode_typed_array(value):
+    """將 plotly 的型別陣列 {"dtype": "f8", "bdata": "<base64>"} 解碼為 numpy 陣列"""
+    dtype = np.dtype(value.get('dtype', 'f8')).newbyteorder('<')
+    return np.frombuffer(base64.b64decode(value['bdata']), dtype=dtype)
+
+def collect_bar_traces(items):
+    """從逐個解碼的 trace 中保留 bar trace 的 type/name/x/y"""
+    traces = []
+    for item in items:
+        if not isinstance(item, dict) or item.get('type') != 'bar':
+            continue
+        trace = {'type': 'bar', 'x': trace_array(item, 'x'), 'y': trace_array(item, 'y')}
+        if 'name' in item:
+            trace['name'] = item['name']
+        traces.append(trace)
+    return traces
+
+def collect_annotations(items):
+    """只保留 annotation 中提取水平需要的欄位"""
+    return [{key: item[key] for key in ANNOTATION_FIELDS if key in item}
+            for item in items if isinstance(item, dict)]
+
+def stream_newplot_arguments(mm, start, end):
+    """串流解碼 mmap[start:end] 中的 Plotly.newPlot 參數 ("div id", data, layout, config)
+
+    Returns:
+        list: 與 Plotly.newPlot 參數相同順序的最小結構 [None, bar traces, {'annotations': [...]}]
+    """
+    # 參數包成一個陣列後，data 的 trace 位於 item.item，layout 的 annotations 位於 item.annotations.item
+    traces = collect_bar_traces(ijson.items(SliceReader(mm, start, end), 'item.item', use_float=True))
+    annotations = collect_annotations(
+        ijson.items(SliceReader(mm, start, end), 'item.annotations.item', use_float=True))
+    return [None, traces, {'annotations': annotations}]
+
+def stream_figure_json(path):
+    """串流解碼網路擷取的 {"data": [...], "layout": {...}} 文件，返回值與 stream_newplot_arguments 相同"""
+    with open(path, 'rb') as f:
+        traces = collect_bar_traces(ijson.items(f, 'data.item', use_float=True))
+    with open(path, 'rb') as f:
+        annotations = collect_annotations(ijson.items(f, 'layout.annotations.item', use_float=True))
+    return [None, traces, {'annotations': annotations}]
@@ -0,0 +1,271 @@
+"""
+Gamma 匯出文件監看
+
+監看 GEX_file/<股票>/html 與 GEX_file/<股票>/json 目錄，playwright_record 每保存一個
+Gamma_<股票>_<YYYYMMDD>.html/.json 就立即提取，並只更新 gamma_code/gammacode_<日期>.txt 中該股票的一行，
+不需要等 run.sh 的固定 sleep 與逐個目錄的批次提取。
+
+Linux 上以 inotify (ctypes，不需要額外套件) 監看，新建立的股票目錄會自動加入；
+其他系統或 inotify 不可用時 (例如部分 FUSE 掛載) 改為定時輪詢，也可以用 --poll 指定。
+
+範例:
+    python gamma_watch.py
+    python gamma_watch.py --poll --interval 5
+    python gamma_watch.py --catch-up
+"""
+
+import os
+import sys
+import time
+import glob
+import ctypes
+import ctypes.util
+import select
+import struct
+import argparse
+from datetime import datetime
+
+from extract_gamma_from_html import (ARCHIVE_FILE_PATTERN, EXTRACTOR_VERSION, process_html_file,
+                                     save_gamma_levels, update_gamma_code_file)
+from gamma_cache import ExtractionCache
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+EVENT_HEADER = struct.Struct('iIII')
+DATA_DIRS = ('html', 'json')
+
+class InotifyWatcher:
+    """以 inotify 監看 base_dir/<股票>/{html,json}，返回寫入完成或移入的文件路徑"""
+
+    def __init__(self, base_dir):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or not libc_name:
+            raise OSError("inotify 只支援 Linux")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失敗")
+        self.base_dir = base_dir
+        self.watches = {}
+        self._add_watch(base_dir)
+        for stock_dir in list_stock_dirs(base_dir):
+            self._add_stock_dir(stock_dir)
+
+    def _add_watch(self, path):
+        mask = IN_CREATE | IN_CLOSE_WRITE | IN_MOVED_TO
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            print(f"無法監看 {path}: {os.strerror(ctypes.get_errno())}")
+            return
+        self.watches[wd] = path
+
+    def _add_stock_dir(self, stock_dir):
+        self._add_watch(stock_dir)
+        for name in DATA_DIRS:
+            data_dir = os.path.join(stock_dir, name)
+            if os.path.isdir(data_dir):
+                self._add_watch(data_dir)
+
+    def _depth(self, path):
+        return len(os.path.relpath(path, self.base_dir).split(os.sep)) if path != self.base_dir else 0
+
+    def poll(self, timeout):
+        """等待最多 timeout 秒，返回這段時間內完成寫入的文件"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        buffer = os.read(self.fd, 64 * 1024)
+        files = []
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+            offset += length
+
+            parent = self.watches.get(wd)
+            if parent is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+            path = os.path.join(parent, name)
+
+            if mask & IN_ISDIR:
+                # 新目錄在加入監看前可能已經寫入文件，只補上今日的文件，
+                # 移入或新建目錄中的歷史文件不會被重新提取 (會覆蓋舊日期的 gammacode 與分區)
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    depth = self._depth(parent)
+                    if depth == 0 and not is_skipped_dir(path):
+                        self._add_stock_dir(path)
+                        files.extend(today_files(scan_files(path)))
+                    elif depth == 1 and name in DATA_DIRS:
+                        self._add_watch(path)
+                        files.extend(today_files(scan_data_dir(path)))
+                continue
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                files.append(path)
+        return files
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """定時掃描 base_dir/<股票>/{html,json}，大小與修改時間連續兩次相同時視為寫入完成"""
+
+    def __init__(self, base_dir, interval=5.0):
+        self.base_dir = base_dir
+        self.interval = interval
+        self.seen = {path: file_signature(path) for path in scan_files(base_dir, all_stocks=True)}
+        self.changing = {}
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        files = []
+        for path in scan_files(self.base_dir, all_stocks=True):
+            signature = file_signature(path)
+            if signature is None or self.seen.get(path) == signature:
+                continue
+            if self.changing.get(path) == signature:
+                # 與上次掃描相同，寫入已完成
+                self.seen[path] = signature
+                del self.changing[path]
+                files.append(path)
+            else:
+                self.changing[path] = signature
+        return files
+
+    def close(self):
+        pass
+
+def is_skipped_dir(path):
+    name = os.path.basename(path)
+    return 'backup' in name.lower() or name in ('gamma_code', 'cache', 'trace', 'manifest')
+
+def list_stock_dirs(base_dir):
+    return sorted(path for path in glob.glob(os.path.join(base_dir, "*"))
+                  if os.path.isdir(path) and not is_skipped_dir(path))
+
+def scan_data_dir(data_dir):
+    """列出一個 html 或 json 目錄中的 Gamma 匯出文件"""
+    return [f for f in glob.glob(os.path.join(data_dir, "Gamma_*_*.*"))
+            if ARCHIVE_FILE_PATTERN.match(os.path.basename(f))]
+
+def scan_files(path, all_stocks=False):
+    """列出股票目錄 (all_stocks 為 True 時為所有股票目錄) 中的 Gamma 匯出文件"""
+    stock_dirs = list_stock_dirs(path) if all_stocks else [path]
+    files = []
+    for stock_dir in stock_dirs:
+        for name in DATA_DIRS:
+            files.extend(scan_data_dir(os.path.join(stock_dir, name)))
+    return files
+
+def today_files(files):
+    """只保留文件名日期為今日的文件"""
+    today = datetime.now().strftime('%Y%m%d')
+    return [f for f in files if ARCHIVE_FILE_PATTERN.match(os.path.basename(f)).group(2) == today]
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def preferred_file(path):
+    """同一股票同一天有 JSON 時以 JSON 為準，HTML 不再處理"""
+    match = ARCHIVE_FILE_PATTERN.match(os.path.basename(path))
+    ticker, date_str, ext = match.groups()
+    if ext == 'html':
+        json_path = os.path.join(os.path.dirname(os.path.dirname(path)), "json", f"Gamma_{ticker}_{date_str}.json")
+        if os.path.exists(json_path):
+            return json_path
+    return path
+
+def handle_file(path, gamma_code_dir, cache=None, store_dir=None, levels_dir=None):
+    """提取一個文件並更新該日期的 gammacode 文件 (levels_dir 不為 None 時同時更新水平記錄)，返回是否成功"""
+    if not ARCHIVE_FILE_PATTERN.match(os.path.basename(path)) or not os.path.exists(path):
+        return False
+    target = preferred_file(path)
+    if target != path:
+        print(f"略過 {os.path.basename(path)}: 已有同日的 JSON 文件")
+        return False
+
+    started = time.monotonic()
+    result = process_html_file(path, cache=cache, store_dir=store_dir)
+    if not result:
+        print(f"警告: {path} 提取失敗")
+        return False
+    gamma_file = update_gamma_code_file(gamma_code_dir, result['date'], result['stock'], result['gamma_code'])
+    if levels_dir is not None:
+        save_gamma_levels(result['levels'], levels_dir)
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 已更新 {result['stock']} -> {os.path.basename(gamma_file)}"
+          f" ({time.monotonic() - started:.2f}s)")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description='監看 Gamma 匯出文件並即時更新 gammacode 文件')
+    parser.add_argument('--base-dir', default='/home/ben/pCloudDrive/stock/GEX/GEX_file', help='GEX 文件目錄')
+    parser.add_argument('--store-dir', default='/home/ben/pCloudDrive/stock/GEX/gamma_profiles',
+                        help='完整 Gamma 分布的欄式儲存目錄')
+    parser.add_argument('--no-store', action='store_true', help='不保存完整的 Gamma 分布')
+    parser.add_argument('--levels-dir', default='/home/ben/pCloudDrive/stock/GEX/gamma_codes',
+                        help='水平記錄 (gamma_levels_<日期>.jsonl/.npy) 的目錄')
+    parser.add_argument('--no-levels', action='store_true', help='不保存水平記錄')
+    parser.add_argument('--no-cache', action='store_true', help='不使用提取結果快取')
+    parser.add_argument('--poll', action='store_true', help='使用定時輪詢，而非 inotify')
+    parser.add_argument('--interval', type=float, default=5.0, help='輪詢間隔秒數 (default: 5)')
+    parser.add_argument('--settle', type=float, default=0.5,
+                        help='文件寫入完成後等待的秒數，合併同一文件的連續事件 (default: 0.5)')
+    parser.add_argument('--catch-up', action='store_true', help='啟動時先處理今日已存在的文件')
+    args = parser.parse_args()
+
+    gamma_code_dir = os.path.join(args.base_dir, "gamma_code")
+    cache = None if args.no_cache else ExtractionCache(os.path.join(args.base_dir, "cache", "extract"),
+                                                      EXTRACTOR_VERSION)
+    store_dir = None if args.no_store else args.store_dir
+    levels_dir = None if args.no_levels else args.levels_dir
+
+    watcher = None
+    if not args.poll:
+        try:
+            watcher = InotifyWatcher(args.base_dir)
+            print(f"以 inotify 監看 {args.base_dir} ({len(watcher.watches)} 個目錄)")
+        except OSError as e:
+            print(f"無法使用 inotify ({e})，改用輪詢")
+    if watcher is None:
+        watcher = PollingWatcher(args.base_dir, args.interval)
+        print(f"每 {args.interval} 秒輪詢 {args.base_dir}")
+
+    # 文件路徑 -> 可以處理的時間，同一文件的連續事件只處理一次
+    pending = {}
+    if args.catch_up:
+        for path in today_files(scan_files(args.base_dir, all_stocks=True)):
+            pending[path] = time.monotonic()
+
+    try:
+        while True:
+            now = time.monotonic()
+            timeout = max(0.0, min(pending.values()) - now) if pending else 1.0
+            for path in watcher.poll(timeout):
+                pending[path] = time.monotonic() + args.settle
+
+            now = time.monotonic()
+            for path in sorted(path for path, due in pending.items() if due <= now):
+                del pending[path]
+                try:
+                    handle_file(path, gamma_code_dir, cache, store_dir, levels_dir)
+                except Exception as e:
+                    print(f"處理 {path} 時出錯: {e}")
+    except KeyboardInterrupt:
+        print("停止監看")
+    finally:
+        watcher.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+TV Code 水平格式的解析
+
+平台的 TV Code 有兩種格式:
+    長格式 (每個股票一段，以空行分隔): "SPX: Put Dominate & Gamma Flip CE, 5000.5, Call Wall, 5100"
+    短格式 (每個股票一行):            "SPX:GFCE,PDCE=5000.5CW=5100.0"
+
+gamma_converter (長 <-> 短，levels_db 的回補也使用它的解析) 共用這裡預先編譯的正則表達式與對照表。
+長格式的標籤先去掉股票代碼前綴再以字典精確查找，只有查不到時才回到逐個名稱的子字串比對；
+同一個標籤的結果會快取，整年的文件中不同的標籤只有幾十個。
+"""
+
+import re
+from functools import lru_cache
+
+# 長格式名稱 -> 短代碼
+LEVEL_CODES = {
+    'Put Dominate': 'PD',
+    'Call Dominate': 'CD',
+    'Gamma Flip': 'GF',
+    'Put Wall': 'PW',
+    'Call Wall': 'CW',
+    'Key Delta': 'KD',
+    'Large Gamma': 'LG',
+    'Gamma Field': 'GFL',
+    'Implied Movement +σ': 'IM+',
+    'Implied Movement -σ': 'IM-',
+    'Implied Movement +2σ': 'IM2+',
+    'Implied Movement -2σ': 'IM2-'
+}
+
+CE_SUFFIX = 'CE'
+
+# 短代碼 -> 長格式名稱
+LEVEL_NAMES = {code: name for name, code in LEVEL_CODES.items()}
+# 包括 CE 後綴的短代碼 -> 長格式名稱，例如 "GFCE" -> "Gamma Flip CE"
+CODE_NAMES = {**LEVEL_NAMES, **{code + CE_SUFFIX: f"{name} {CE_SUFFIX}" for code, name in LEVEL_NAMES.items()}}
+
+# 長格式: "標籤, 價格"；短格式: "代碼,代碼=價格"
+LONG_PAIR_PATTERN = re.compile(r'([^,]+),\s*([\d.]+)')
+SHORT_PAIR_PATTERN = re.compile(r'([^=]+)=(\d+\.?\d*)')
+# 一整行短格式 (股票代碼後為零或多個 "代碼,代碼=價格"，沒有空格) 與分隔線 (例如 "===== spx =====")
+SHORT_LINE_PATTERN = re.compile(r'^[^:\s]+:(?:[^=,\s]+(?:,[^=,\s]+)*=\d+\.?\d*)*$')
+SEPARATOR_PATTERN = re.compile(r'^=+\s+\w+\s+=+$')
+FILLER_PATTERN = re.compile(r'[\s,]+')
+
+def text_format(text):
+    """判斷文字為 "short" (每行都是短格式) 或 "long"，沒有內容時返回 None"""
+    lines = [line.strip() for line in text.splitlines()]
+    lines = [line for line in lines if line and not SEPARATOR_PATTERN.match(line)]
+    if not lines:
+        return None
+    return 'short' if all(SHORT_LINE_PATTERN.match(line) for line in lines) else 'long'
+
+def unmatched_text(pattern, body):
+    """body 中沒有被 pattern 匹配的文字 (分隔的逗號與空白合併為一個空格)，全部匹配時返回空字串"""
+    return FILLER_PATTERN.sub(' ', pattern.sub(' ', body)).strip()
+
+def split_symbol(text):
+    """返回 (股票代碼, 冒號後的內容)，沒有冒號時內容為整段文字"""
+    symbol, sep, body = text.partition(':')
+    return symbol.strip(), body if sep else text
+
+@lru_cache(maxsize=None)
+def label_codes(label):
+    """將長格式的標籤 (例如 "Put Dominate & Gamma Flip CE") 轉為短代碼，無法識別的部分略過
+
+    標籤中有 " CE" 時，所有的代碼都加上 CE 後綴。
+    """
+    label = label.strip()
+    has_ce = ' CE' in label
+    codes = []
+    for sub_level in label.replace(' CE', '').split('&'):
+        sub_level = sub_level.strip()
+        code = LEVEL_CODES.get(sub_level)
+        if code is None:
+            # 標籤帶有其他文字時，使用第一個包含在標籤中的名稱
+            code = next((code for name, code in LEVEL_CODES.items() if name in sub_level), None)
+        if code is not None:
+            codes.append(code + CE_SUFFIX if has_ce else code)
+    return tuple(codes)
+
+def code_name(code):
+    """將短代碼 (例如 "GFCE") 轉為長格式名稱，無法識別時返回 None"""
+    return CODE_NAMES.get(code)
+
+@lru_cache(maxsize=None)
+def split_codes(codes):
+    """將短格式的代碼組 (例如 "GFCE,PD") 分割為 tuple"""
+    return tuple(code.strip() for code in codes.split(',') if code.strip())
+
+@lru_cache(maxsize=None)
+def codes_label(codes):
+    """將代碼 tuple 轉為長格式的標籤 (例如 "Gamma Flip CE & Put Dominate")，都無法識別時返回空字串"""
+    return ' & '.join(name for name in map(CODE_NAMES.get, codes) if name)
+
+def parse_long(block):
+    """解析一個股票的長格式文字
+
+    Returns:
+        (symbol, pairs): pairs 為 [(標籤, 短代碼 tuple, 價格), ...]，依出現順序；無法識別的標籤代碼為空 tuple
+    """
+    symbol, body = split_symbol(block)
+    return symbol, [(label.strip(), label_codes(label), float(price))
+                    for label, price in LONG_PAIR_PATTERN.findall(body)]
+
+def parse_short(line):
+    """解析一行短格式文字，沒有冒號時返回 None
+
+    Returns:
+        (symbol, pairs): pairs 為 [(短代碼 tuple, 價格), ...]，依出現順序
+    """
+    symbol, sep, body = line.partition(':')
+    if not sep:
+        return None
+    return symbol.strip(), [(split_codes(codes), float(price)) for codes, price in SHORT_PAIR_PATTERN.findall(body)]
+
+def short_levels(line):
+    """解析一行短格式文字為 (symbol, {短代碼: 價格})，同一代碼出現多次時以最後一個為準，沒有冒號時返回 None"""
+    parsed = parse_short(line)
+    if parsed is None:
+        return None
+    symbol, pairs = parsed
+    return symbol, {code: price for codes, price in pairs for code in codes}
@@ -0,0 +1,229 @@
+"""
+Gamma 水平記錄
+
+所有水平 (平台的 TV Code 與從 Gamma 圖提取的水平) 的統一表示: 一個 LevelRecord 為
+(股票, 日期, 水平代碼, 是否 CE, 價格)，例如 ("SPX", "20250103", "GF", True, 5000.5)。
+
+gamma_converter 解析一次 TV Code 後寫出記錄，下游 (put_dom_trade、extract_gamma_from_html 的水平輸出)
+直接讀取記錄，不需要再解析文字；文字的 TV Code 只是記錄的其中一種輸出 (render_short / render_long)。
+
+保存格式:
+    <名稱>.jsonl: 每行一個記錄的 JSON，方便閱讀與 grep
+    <名稱>.npy:   NumPy 結構化陣列 (每個記錄 33 bytes)，np.load 即可批次讀取多年的數據，不需要 pickle
+"""
+
+import os
+import json
+import numpy as np
+from level_codes import CE_SUFFIX, LEVEL_NAMES, code_name, codes_label
+
+# 打包格式: 股票代碼、YYYYMMDD 整數日期、不含 CE 的代碼、CE 旗標、價格
+RECORD_DTYPE = np.dtype([('ticker', 'S12'), ('date', '<u4'), ('level', 'S8'), ('ce', '?'), ('price', '<f8')])
+
+# 短代碼 -> (不含 CE 的代碼, 是否 CE)，例如 "GFCE" -> ("GF", True)
+CODE_PARTS = {**{code: (code, False) for code in LEVEL_NAMES},
+              **{code + CE_SUFFIX: (code, True) for code in LEVEL_NAMES}}
+
+# Gamma 圖提取的水平 (GammaProfile 屬性) -> 水平代碼；Delta 25 是過濾門檻而不是價格水平
+PROFILE_LEVEL_CODES = {
+    'gamma_field': 'GFL',
+    'gamma_flip': 'GF',
+    'call_wall': 'CW',
+    'put_wall': 'PW',
+}
+
+class LevelRecord:
+    """一個股票一天的一個水平
+
+    Attributes:
+        ticker: 股票代碼
+        date: 日期字串 YYYYMMDD
+        level: 不含 CE 後綴的水平代碼，例如 "GF"
+        ce: 是否為 CE 水平
+        price: 價格
+    """
+
+    __slots__ = ('ticker', 'date', 'level', 'ce', 'price')
+
+    def __init__(self, ticker, date, level, ce=False, price=0.0):
+        self.ticker = ticker
+        self.date = date
+        self.level = level
+        self.ce = bool(ce)
+        self.price = float(price)
+
+    @classmethod
+    def from_code(cls, ticker, date, code, price):
+        """由短代碼 (例如 "GFCE") 建立記錄，無法識別的代碼原樣保留"""
+        level, ce = CODE_PARTS.get(code) or (code, False)
+        return cls(ticker, date, level, ce, price)
+
+    @property
+    def code(self):
+        """短代碼，例如 "GFCE" """
+        return self.level + CE_SUFFIX if self.ce else self.level
+
+    @property
+    def name(self):
+        """長格式名稱，例如 "Gamma Flip CE"，無法識別時返回 None"""
+        return code_name(self.code)
+
+    def key(self):
+        return (self.ticker, self.date, self.level, self.ce, self.price)
+
+    def __eq__(self, other):
+        if not isinstance(other, LevelRecord):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return f"LevelRecord({self.ticker} {self.date} {self.code}={self.price})"
+
+    def to_dict(self):
+        return {'ticker': self.ticker, 'date': self.date, 'level': self.level, 'ce': self.ce,
+                'price': self.price}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['ticker'], data['date'], data['level'], data.get('ce', False), data['price'])
+
+def records_from_levels(levels, date_str):
+    """將 {股票: {價格: 代碼}} (gamma_converter 的解析結果) 轉為記錄列表
+
+    代碼為 tuple 時保持順序，為 set 時排序，輸出的順序固定。
+    """
+    from_code = LevelRecord.from_code
+    records = []
+    for ticker, price_levels in levels.items():
+        for price, codes in price_levels.items():
+            if isinstance(codes, (set, frozenset)):
+                codes = sorted(codes)
+            for code in codes:
+                records.append(from_code(ticker, date_str, code, price))
+    return records
+
+def records_from_profile(ticker, date_str, profile):
+    """將 GammaProfile 的 Gamma Field、Gamma Flip、Call Wall、Put Wall 轉為記錄，沒有的水平 (-1) 略過"""
+    records = []
+    for attr, level in PROFILE_LEVEL_CODES.items():
+        value = getattr(profile, attr)
+        if value is not None and value >= 0:
+            records.append(LevelRecord(ticker, date_str, level, False, value))
+    return records
+
+def group_levels(records):
+    """將記錄組成 {股票: {價格: (代碼, ...)}}，股票、價格與代碼保持記錄的順序"""
+    levels = {}
+    for record in records:
+        price_levels = levels.get(record.ticker)
+        if price_levels is None:
+            price_levels = levels[record.ticker] = {}
+        code = record.level + CE_SUFFIX if record.ce else record.level
+        codes = price_levels.get(record.price)
+        if codes is None:
+            price_levels[record.price] = (code,)
+        elif code not in codes:
+            price_levels[record.price] = codes + (code,)
+    return levels
+
+def render_short(records):
+    """記錄輸出為短格式的 TV Code (每個股票一行)，價格與代碼都排序"""
+    result = []
+    for symbol, price_levels in group_levels(records).items():
+        # 構建輸出字符串
+        output_parts = [symbol + ':']
+        for price, codes in sorted(price_levels.items()):
+            # 排序確保代碼順序固定 (代碼已去重)
+            codes_str = ','.join(sorted(codes))
+            output_parts.append(f"{codes_str}={price}")
+
+        result.append(''.join(output_parts))
+
+    return '\n'.join(result)
+
+def render_long(records):
+    """記錄輸出為長格式的 TV Code (每個股票一段)，沒有可識別代碼的股票不輸出"""
+    result = []
+    for symbol, price_levels in group_levels(records).items():
+        parts = []
+        for price, codes in price_levels.items():
+            # 轉換代碼到完整名稱
+            label = codes_label(codes)
+            if label:
+                parts.append(f"{label}, {price}")
+
+        # 組合結果
+        if parts:
+            result.append(f"{symbol}: {', '.join(parts)}")
+
+    return '\n\n'.join(result)
+
+def records_array(records):
+    """記錄轉為 RECORD_DTYPE 的結構化陣列"""
+    array = np.empty(len(records), dtype=RECORD_DTYPE)
+    for i, record in enumerate(records):
+        array[i] = (record.ticker.encode('utf-8'), int(record.date), record.level.encode('utf-8'), record.ce,
+                    record.price)
+    return array
+
+def array_records(array):
+    """結構化陣列轉回記錄列表"""
+    return [LevelRecord(ticker.decode('utf-8'), str(date), level.decode('utf-8'), ce, price)
+            for ticker, date, level, ce, price in array.tolist()]
+
+def _replace(path, write):
+    """以 write(暫存文件路徑) 寫入暫存文件再替換 path，中途失敗不會留下寫到一半的文件"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def write_jsonl(path, records):
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record.to_dict(), ensure_ascii=False) + '\n')
+    _replace(path, write)
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [LevelRecord.from_dict(json.loads(line)) for line in f if line.strip()]
+
+def write_array(path, records):
+    def write(tmp_path):
+        with open(tmp_path, 'wb') as f:
+            np.save(f, records_array(records))
+    _replace(path, write)
+
+def read_array(path):
+    """讀取 .npy 為結構化陣列"""
+    return np.load(path, allow_pickle=False)
+
+def write_records(path_base, records):
+    """寫出 <path_base>.jsonl 與 <path_base>.npy，返回兩個文件路徑"""
+    jsonl_path = path_base + '.jsonl'
+    array_path = path_base + '.npy'
+    write_jsonl(jsonl_path, records)
+    write_array(array_path, records)
+    return jsonl_path, array_path
+
+def read_records(path_base):
+    """讀取 write_records 寫出的記錄，優先讀取 .npy，都不存在時返回 None"""
+    if os.path.exists(path_base + '.npy'):
+        return array_records(read_array(path_base + '.npy'))
+    if os.path.exists(path_base + '.jsonl'):
+        return read_jsonl(path_base + '.jsonl')
+    return None
+
+def merge_records(existing, records):
+    """以 records 取代 existing 中相同股票的記錄，其他股票保持不變，按股票排序"""
+    tickers = {record.ticker for record in records}
+    merged = [record for record in existing if record.ticker not in tickers] + list(records)
+    merged.sort(key=lambda record: record.ticker)
+    return merged
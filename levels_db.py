@@ -0,0 +1,223 @@
+"""
+每日水平資料庫
+
+將所有 tvcode_<日期>.txt 的水平記錄 (level_records.LevelRecord) 保存在 tvcode 目錄的 levels.db (SQLite)，
+以 (股票, 日期) 為主鍵前綴建立索引，"這些股票最近 N 個交易日的 GF/GFCE/PD" 只需要一次索引查詢，
+不需要猜測前一個交易日的文件名再逐行解析整個文件。
+
+gamma_converter 每轉換一個文件就更新該日期的記錄；已有的歷史文件以 backfill 回補。
+交易日為資料庫中有 tvcode 文件的日期 (days 表)，假日沒有文件，不需要另外的交易日曆。
+
+範例:
+    python levels_db.py backfill
+    python levels_db.py backfill --from 20240101 --force
+    python levels_db.py query SPX QQQ --days 5 --codes GF GFCE PD
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+from level_records import LevelRecord, read_records, records_from_levels
+
+LEVELS_DB_FILE = "levels.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS levels (
+    ticker TEXT NOT NULL,
+    date TEXT NOT NULL,
+    level TEXT NOT NULL,
+    ce INTEGER NOT NULL,
+    price REAL NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (ticker, date, level, ce, price)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS levels_date ON levels (date);
+CREATE TABLE IF NOT EXISTS days (
+    date TEXT PRIMARY KEY,
+    source TEXT,
+    mtime REAL,
+    count INTEGER NOT NULL
+);
+"""
+
+class LevelsDB:
+    """tvcode 水平的 SQLite 資料庫，可用於 with 敘述"""
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        # 批次轉換的多個行程可能同時寫入，等待其他行程的交易完成
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def replace_day(self, date_str, records, source=None, mtime=None):
+        """以 records 取代一個日期的所有記錄，source/mtime 為來源文件與其修改時間"""
+        with self.conn:
+            self.conn.execute("DELETE FROM levels WHERE date = ?", (date_str,))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO levels (ticker, date, level, ce, price, seq) VALUES (?, ?, ?, ?, ?, ?)",
+                [(record.ticker, date_str, record.level, int(record.ce), record.price, seq)
+                 for seq, record in enumerate(records)])
+            self.conn.execute("INSERT OR REPLACE INTO days (date, source, mtime, count) VALUES (?, ?, ?, ?)",
+                              (date_str, source, mtime, len(records)))
+
+    def day_mtime(self, date_str):
+        """一個日期來源文件的修改時間，沒有該日期時返回 None"""
+        row = self.conn.execute("SELECT mtime FROM days WHERE date = ?", (date_str,)).fetchone()
+        return row[0] if row else None
+
+    def trading_days(self, until=None, limit=None):
+        """返回 until (含) 之前的交易日，由新到舊，最多 limit 個"""
+        sql = "SELECT date FROM days"
+        params = []
+        if until:
+            sql += " WHERE date <= ?"
+            params.append(until)
+        sql += " ORDER BY date DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [date_str for date_str, in self.conn.execute(sql, params)]
+
+    def recent_levels(self, tickers=None, days=1, codes=None, until=None):
+        """最近 days 個交易日的水平
+
+        Args:
+            tickers: 股票代碼列表，None 表示全部
+            days: 交易日數
+            codes: 短代碼列表 (例如 ["GF", "GFCE", "PD"])，None 表示全部
+            until: 最後的日期 (含)，None 表示資料庫中最新的日期
+
+        Returns:
+            {股票: {日期: {短代碼: 價格}}}，股票依最新一天文件中的順序，日期由新到舊
+        """
+        sql = ["WITH recent AS (SELECT date FROM days"]
+        params = []
+        if until:
+            sql.append("WHERE date <= ?")
+            params.append(until)
+        sql.append("ORDER BY date DESC LIMIT ?)")
+        params.append(days)
+        sql.append("SELECT ticker, date, level, ce, price FROM levels WHERE date IN (SELECT date FROM recent)")
+        if tickers is not None:
+            tickers = list(tickers)
+            sql.append(f"AND ticker IN ({', '.join('?' * len(tickers))})")
+            params.extend(tickers)
+        if codes is not None:
+            pairs = [(record.level, int(record.ce)) for record in
+                     (LevelRecord.from_code(None, None, code, 0) for code in codes)]
+            sql.append(f"AND (level, ce) IN (VALUES {', '.join(['(?, ?)'] * len(pairs))})")
+            params.extend(value for pair in pairs for value in pair)
+        sql.append("ORDER BY date DESC, seq")
+
+        result = {}
+        for ticker, date_str, level, ce, price in self.conn.execute(' '.join(sql), params):
+            code = LevelRecord(ticker, date_str, level, ce, price).code
+            result.setdefault(ticker, {}).setdefault(date_str, {})[code] = price
+        return result
+
+def read_tvcode_records(path, date_str):
+    """讀取一個 tvcode 文件的記錄，有不比文件舊的 levels_<日期>.npy 時直接讀取，否則解析文字"""
+    # 延遲匯入，gamma_converter 本身也會匯入這個模組
+    from gamma_converter import get_records_base, parse_long_records, parse_short_records
+    from level_codes import text_format
+
+    records_base, _ = get_records_base(path)
+    if records_base and os.path.exists(records_base + '.npy') and \
+            os.path.getmtime(records_base + '.npy') >= os.path.getmtime(path):
+        return read_records(records_base)
+
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text_format(text) == 'long':
+        levels, _ = parse_long_records(text)
+    else:
+        levels = parse_short_records(text)
+    return records_from_levels(levels, date_str)
+
+def sync_file(db, path, date_str, force=False):
+    """文件比資料庫中的記錄新時 (或 force) 更新該日期，返回是否有更新"""
+    mtime = os.path.getmtime(path)
+    if not force and db.day_mtime(date_str) == mtime:
+        return False
+    db.replace_day(date_str, read_tvcode_records(path, date_str), os.path.basename(path), mtime)
+    return True
+
+def backfill(db, base_path, date_from=None, date_to=None, force=False):
+    """將 base_path 中日期在 [date_from, date_to] 之間的 tvcode 文件寫入資料庫，已是最新的日期略過
+
+    Returns:
+        (更新的日期數, 略過的日期數)
+    """
+    from gamma_converter import TVCODE_FILE_PATTERN, find_tvcode_files
+
+    updated = skipped = 0
+    for path in find_tvcode_files(base_path, date_from, date_to):
+        date_str = TVCODE_FILE_PATTERN.match(os.path.basename(path)).group(1)
+        try:
+            if sync_file(db, path, date_str, force):
+                updated += 1
+            else:
+                skipped += 1
+        except Exception as e:
+            print(f"回補 {path} 時出錯: {e}")
+    return updated, skipped
+
+def find_tvcode_dir():
+    """查找 tvcode 目錄"""
+    from gamma_converter import find_gex_path
+    return find_gex_path()
+
+def main():
+    parser = argparse.ArgumentParser(description='每日水平資料庫 (SQLite)')
+    parser.add_argument('--dir', help='tvcode 目錄 (default: 自動查找)')
+    parser.add_argument('--db', help=f'資料庫路徑 (default: <tvcode 目錄>/{LEVELS_DB_FILE})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    backfill_parser = subparsers.add_parser('backfill', help='從 tvcode_*.txt 回補資料庫')
+    backfill_parser.add_argument('--from', dest='date_from', help='起始日期 YYYYMMDD')
+    backfill_parser.add_argument('--to', dest='date_to', help='結束日期 YYYYMMDD')
+    backfill_parser.add_argument('--force', action='store_true', help='重新寫入已是最新的日期')
+
+    query_parser = subparsers.add_parser('query', help='查詢最近 N 個交易日的水平')
+    query_parser.add_argument('tickers', nargs='*', help='股票代碼，不指定時為全部')
+    query_parser.add_argument('--days', type=int, default=3, help='交易日數 (default: 3)')
+    query_parser.add_argument('--codes', nargs='+', default=['GF', 'GFCE', 'PD'], help='短代碼 (default: GF GFCE PD)')
+    query_parser.add_argument('--until', help='最後的日期 YYYYMMDD (default: 最新)')
+    args = parser.parse_args()
+
+    base_path = args.dir or find_tvcode_dir()
+    if not base_path and not args.db:
+        print("錯誤：找不到有效的GEX文件路徑")
+        sys.exit(1)
+    db_path = args.db or os.path.join(base_path, LEVELS_DB_FILE)
+
+    with LevelsDB(db_path) as db:
+        if args.command == 'backfill':
+            if not base_path:
+                print("錯誤：回補需要 tvcode 目錄，請使用 --dir")
+                sys.exit(1)
+            started = time.perf_counter()
+            updated, skipped = backfill(db, base_path, args.date_from, args.date_to, args.force)
+            print(f"回補完成: 更新 {updated} 個日期，略過 {skipped} 個已是最新的日期，"
+                  f"耗時 {time.perf_counter() - started:.2f}s ({db_path})")
+        else:
+            levels = db.recent_levels(args.tickers or None, args.days, args.codes, args.until)
+            if not levels:
+                print("沒有符合條件的記錄")
+            for ticker, days in levels.items():
+                for date_str, codes in days.items():
+                    print(f"{ticker} {date_str} " + ' '.join(f"{code}={price}" for code, price in codes.items()))
+
+if __name__ == "__main__":
+    main()
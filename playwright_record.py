@@ -4,8 +4,76 @@ import shutil
 import time
 import json
 import argparse
+import queue
+import threading
 from datetime import datetime
 from playwright.sync_api import Playwright, sync_playwright, expect
+from scrape_trace import StepTracer, note_retry, set_outcome, print_summary
+from scrape_manifest import ARTIFACTS, ScrapeManifest, block_symbol, write_tvcode_block
+from request_filter import SIZE_TABLE_FILE, RequestFilter
+from scrape_replay import har_context_options, install_har_routing
+
+PLATFORM_URL = "https://www.lietaresearch.com/platform"
+
+# 保護 tvcode 文件的寫入，避免並行模式下內容交錯
+tvcode_lock = threading.Lock()
+
+# 各步驟的預設等待上限 (秒)，可由 config.json 的 download_settings.step_budget 覆蓋
+DEFAULT_STEP_BUDGET = {
+    "page_load": 60,
+    "gamma_load": 60,
+    "tvcode_load": 90,
+    "smile_load": 60,
+    "download": 60
+}
+
+# 標記目前已存在的圖表並監聽 plotly_afterplot 事件 (包含之後新建立的圖表)
+ARM_PLOT_SIGNAL_JS = """
+() => {
+    window.__gexAfterplot = 0;
+    window.__gexHook = window.__gexHook || ((gd) => {
+        if (gd.__gexHooked || typeof gd.on !== 'function') return;
+        gd.__gexHooked = true;
+        gd.on('plotly_afterplot', () => { window.__gexAfterplot += 1; });
+    });
+    document.querySelectorAll('.js-plotly-plot').forEach((gd) => {
+        gd.__gexStale = true;
+        window.__gexHook(gd);
+    });
+    if (!window.__gexObserver) {
+        window.__gexObserver = new MutationObserver(() => {
+            document.querySelectorAll('.js-plotly-plot').forEach(window.__gexHook);
+        });
+        window.__gexObserver.observe(document.body, {childList: true, subtree: true});
+    }
+}
+"""
+
+# 收到 plotly_afterplot 事件，或出現一個已完成排版的新圖表
+PLOT_READY_JS = """
+() => {
+    if (window.__gexAfterplot > 0) return true;
+    return Array.from(document.querySelectorAll('.js-plotly-plot')).some(
+        (gd) => !gd.__gexStale && gd._fullLayout && gd.querySelector('.plot-container'));
+}
+"""
+
+READ_TVCODE_JS = """
+() => {
+    const el = document.querySelector('.pt-5 p');
+    return el ? el.innerText.trim() : '';
+}
+"""
+
+# TV Code 文字非空且與點擊 Enter 前不同
+TVCODE_READY_JS = """
+(previous) => {
+    const el = document.querySelector('.pt-5 p');
+    if (!el) return false;
+    const text = el.innerText.trim();
+    return text.length > 0 && text !== previous;
+}
+"""
 
 def load_config(config_file):
     """載入配置文件"""
@@ -37,6 +105,7 @@ def wait_for_chart(page, max_retries=5):
         except Exception as e:
             print(f"等待圖表加載嘗試 {attempt + 1}/{max_retries} 失敗: {str(e)}")
             if attempt < max_retries - 1:
+                note_retry()
                 time.sleep(10)  # 增加等待時間至10秒後重試
                 page.reload()  # 重新加載頁面
                 time.sleep(5)  # 重載後等待5秒
@@ -58,6 +127,7 @@ def safe_click_and_wait(page, selector_func, timeout=60000, max_retries=3, descr
         except Exception as e:
             print(f"點擊{description}嘗試 {attempt + 1}/{max_retries} 失敗: {str(e)}")
             if attempt < max_retries - 1:
+                note_retry()
                 time.sleep(5)
                 # 嘗試滾動頁面以確保元素在視圖中
                 try:
@@ -80,250 +150,499 @@ def safe_inner_text(page, selector, timeout=60000, default_text=""):
         print(f"獲取文本內容失敗: {str(e)}")
         return default_text
 
-def process_ticker(page, ticker, download_dir):
-    """處理單個股票的數據採集"""
+def collect_json_response(response, captured):
+    """收集可能包含 Plotly 圖表數據的 XHR/fetch 回應
+
+    只記錄回應物件，不在事件回呼中讀取內容，避免阻塞 Playwright 的事件循環
+    """
+    try:
+        if response.request.resource_type not in ("xhr", "fetch"):
+            return
+        if "json" not in response.headers.get("content-type", ""):
+            return
+        captured.append(response)
+    except Exception:
+        pass
+
+def find_plotly_figure(obj, depth=0):
+    """在 JSON 物件中遞迴尋找包含 bar 軌跡的 Plotly 圖表 (data + layout)"""
+    if depth > 10:
+        return None
+
+    # 部分 API 會把圖表以 JSON 字串的形式再包一層
+    if isinstance(obj, str):
+        if '"layout"' not in obj or not obj.lstrip().startswith('{'):
+            return None
+        try:
+            obj = json.loads(obj)
+        except ValueError:
+            return None
+
+    if isinstance(obj, dict):
+        data = obj.get('data')
+        layout = obj.get('layout')
+        if (isinstance(data, list) and isinstance(layout, dict)
+                and any(isinstance(trace, dict) and trace.get('type') == 'bar' for trace in data)):
+            return obj
+        children = obj.values()
+    elif isinstance(obj, list):
+        children = obj
+    else:
+        return None
+
+    for child in children:
+        figure = find_plotly_figure(child, depth + 1)
+        if figure:
+            return figure
+    return None
+
+def capture_gamma_figure(captured):
+    """從收集到的回應中找出最新的 Gamma 圖表數據"""
+    for response in reversed(captured):
+        try:
+            payload = response.json()
+        except Exception:
+            continue
+        figure = find_plotly_figure(payload)
+        if figure:
+            return figure
+    return None
+
+def save_gamma_figure(figure, download_dir, ticker, today_date):
+    """將 Gamma 圖表數據以精簡 JSON 格式保存，取代 HTML 下載"""
+    json_dir = os.path.join(download_dir, ticker, "json")
+    os.makedirs(json_dir, exist_ok=True)
+    json_filepath = os.path.join(json_dir, f"Gamma_{ticker}_{today_date}.json")
+    tmp_filepath = json_filepath + ".tmp"
+
+    with open(tmp_filepath, 'w', encoding='utf-8') as f:
+        json.dump({'data': figure['data'], 'layout': figure['layout']}, f,
+                  ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_filepath, json_filepath)
+    return json_filepath
+
+def step_timeout(settings, step):
+    """取得步驟的等待上限 (毫秒)，來源為 config.json 的 download_settings.step_budget (秒)"""
+    budget = (settings or {}).get("step_budget", {})
+    return int(budget.get(step, DEFAULT_STEP_BUDGET[step]) * 1000)
+
+def arm_plot_signal(page):
+    """在點擊 Enter 前重置 Plotly 繪製訊號，之後由 wait_for_plot_ready 等待新的繪製完成"""
+    page.evaluate(ARM_PLOT_SIGNAL_JS)
+
+def wait_for_plot_ready(page, timeout):
+    """等待 arm_plot_signal 之後的 plotly_afterplot 事件 (或新建立的圖表完成排版)"""
+    page.wait_for_function(PLOT_READY_JS, timeout=timeout)
+
+def read_tvcode_text(page):
+    """讀取目前 TV Code 區塊的文字，找不到時返回空字串"""
+    try:
+        return page.evaluate(READ_TVCODE_JS) or ""
+    except Exception:
+        return ""
+
+def reload_page(page, timeout):
+    """重新加載頁面並等待股票代碼輸入框出現"""
+    page.reload(timeout=timeout)
+    page.get_by_placeholder("Ticker").wait_for(state="visible", timeout=timeout)
+
+def select_model(page, model, current_label, timeout):
+    """打開模型選單並選擇指定模型
+
+    current_label 為選單目前顯示的文字，第一次選擇時為 "Select model..."，
+    之後為上一個模型的名稱。
+    """
+    exact = current_label != "Select model..."
+    if not safe_click_and_wait(page, lambda: page.get_by_text(current_label, exact=exact),
+                               timeout=timeout, description=f"{current_label}選項"):
+        return False
+    return safe_click_and_wait(page, lambda: page.get_by_role("option", name=model),
+                               timeout=timeout, description=f"{model}選項")
+
+def save_download(download, target_dir, filename):
+    """將下載的文件移動到指定目錄，download.path() 會等待下載完成"""
+    os.makedirs(target_dir, exist_ok=True)
+    filepath = os.path.join(target_dir, filename)
+    shutil.move(download.path(), filepath)
+    return filepath
+
+def download_plot_png(page, timeout):
+    """點擊 Plotly 工具欄的下載按鈕並等待下載事件"""
+    # 移動鼠標到圖表區域以顯示工具欄
+    page.mouse.move(200, 200)
+    with page.expect_download(timeout=timeout) as download_info:
+        modebar_button = page.locator(".modebar-btn").first
+        modebar_button.wait_for(state="visible", timeout=timeout)
+        modebar_button.click(timeout=timeout)
+    return download_info.value
+
+def new_page_session():
+    """建立頁面狀態：模型選單目前顯示的文字，以及下一個股票開始前是否需要重新加載"""
+    return {'model': "Select model...", 'needs_reload': False}
+
+def process_ticker(page, ticker, download_dir, capture_mode="network", settings=None, tracer=None,
+                   manifest=None, resume=False, session=None):
+    """處理單個股票的數據採集
+
+    capture_mode 為 "network" 時，直接從網路回應擷取 Gamma 圖表數據並保存為 JSON，
+    擷取失敗時才退回下載 HTML；為 "html" 時維持原本的 HTML 下載流程。
+
+    每個步驟等待具體的訊號 (plotly_afterplot 事件、TV Code 文字變化、下載事件)，
+    等待上限來自 settings["step_budget"]，每個步驟的耗時、結果與重試次數記錄在 tracer 中。
+
+    取得的產物記錄在當日的 manifest 中；resume 為 True 時只補抓 manifest 中缺少的產物。
+
+    settings["keep_alive"] 為 True 時不在股票之間重新加載頁面，只重設股票代碼與模型選單，
+    session 記錄同一頁面跨股票的狀態，只有在步驟失敗後才重新加載。
+    """
+    if tracer is None:
+        tracer = StepTracer()
+    if manifest is None:
+        manifest = ScrapeManifest.for_date(download_dir)
+    if session is None:
+        session = new_page_session()
+        session['needs_reload'] = True
+
+    needed = manifest.missing(ticker) if resume else list(ARTIFACTS)
+    with tracer.step(ticker, "ticker") as ticker_record:
+        if not needed:
+            ticker_record['outcome'] = 'skipped'
+            print(f"{ticker} 今日的產物都已存在，略過")
+            return True
+        if resume:
+            print(f"{ticker} 缺少的產物: {', '.join(needed)}")
+
+        first_record = len(tracer.records)
+        success = _process_ticker_steps(page, ticker, download_dir, capture_mode, settings, tracer,
+                                        manifest, needed, session)
+        if not success:
+            ticker_record['outcome'] = 'failed'
+
+        # 有步驟失敗或超時時，頁面狀態不可信，下一個股票開始前重新加載
+        failed_steps = [record for record in tracer.records[first_record:]
+                        if record['ticker'] == ticker and record['outcome'] in ('error', 'timeout', 'fallback')]
+        if not success or failed_steps:
+            session['needs_reload'] = True
+        return success
+
+def _reload_for_session(page, ticker, settings, tracer, session, description):
+    """重新加載頁面並重設 session；keep_alive 模式下頁面狀態正常時略過並記錄為 avoided"""
+    with tracer.step(ticker, "reload"):
+        if (settings or {}).get("keep_alive") and not session['needs_reload']:
+            set_outcome("avoided")
+            return
+        try:
+            reload_page(page, step_timeout(settings, "page_load"))
+            session['model'] = "Select model..."
+            session['needs_reload'] = False
+        except Exception as e:
+            set_outcome("timeout", e)
+            session['needs_reload'] = True
+            print(f"{description}失敗: {str(e)}")
+
+def _process_ticker_steps(page, ticker, download_dir, capture_mode, settings, tracer, manifest, needed, session):
+    """process_ticker 的各個步驟，只執行 needed 中的產物所需的步驟"""
+    today_date = datetime.today().strftime('%Y%m%d')
+
     try:
         print(f"開始處理 {ticker}...")
         
         # 重置頁面狀態
-        try:
-            page.reload()
-            page.wait_for_load_state("networkidle", timeout=60000)
-            time.sleep(10)  # 給頁面充分時間加載
-        except Exception as e:
-            print(f"重置頁面狀態失敗: {str(e)}")
+        _reload_for_session(page, ticker, settings, tracer, session, "重置頁面狀態")
         
         # 輸入股票代碼
-        try:
-            ticker_input = page.get_by_placeholder("Ticker")
-            ticker_input.click(timeout=60000)
-            ticker_input.fill(ticker, timeout=60000)
-            print(f"已輸入股票代碼: {ticker}")
-            time.sleep(3)
-        except Exception as e:
-            print(f"輸入股票代碼失敗: {str(e)}")
-            return False
-        
-        # 選擇模型 - 使用更穩健的方法
-        try:
-            # 先嘗試直接點擊
-            model_selector = page.get_by_text("Select model...")
-            model_selector.click(timeout=60000)
-            time.sleep(3)
-            
-            # 選擇Gamma選項
-            gamma_option = page.get_by_role("option", name="Gamma")
-            gamma_option.click(timeout=60000)
-            time.sleep(2)
-            
-            # 點擊Enter按鈕
-            enter_button = page.get_by_role("button", name="Enter")
-            enter_button.click(timeout=60000)
-            print("已選擇Gamma模型並點擊Enter")
-            time.sleep(20)  # 增加等待時間
-        except Exception as e:
-            print(f"選擇模型失敗: {str(e)}")
-            # 嘗試替代方法
+        with tracer.step(ticker, "ticker_input"):
             try:
-                # 使用JavaScript點擊
-                page.evaluate("""
-                    () => {
-                        const selectElements = Array.from(document.querySelectorAll('button, select, div')).
-                            filter(el => el.textContent.includes('Select model'));
-                        if (selectElements.length > 0) selectElements[0].click();
-                        
-                        setTimeout(() => {
-                            const gammaOptions = Array.from(document.querySelectorAll('div[role="option"]')).
-                                filter(el => el.textContent.includes('Gamma'));
-                            if (gammaOptions.length > 0) gammaOptions[0].click();
-                            
-                            setTimeout(() => {
-                                const enterButtons = Array.from(document.querySelectorAll('button')).
-                                    filter(el => el.textContent.includes('Enter'));
-                                if (enterButtons.length > 0) enterButtons[0].click();
-                            }, 2000);
-                        }, 2000);
-                    }
-                """)
-                print("使用替代方法選擇模型")
-                time.sleep(25)
-            except Exception as e2:
-                print(f"替代選擇模型方法也失敗: {str(e2)}")
+                ticker_input = page.get_by_placeholder("Ticker")
+                ticker_input.click(timeout=60000)
+                ticker_input.fill(ticker, timeout=60000)
+                print(f"已輸入股票代碼: {ticker}")
+            except Exception as e:
+                set_outcome("error", e)
+                print(f"輸入股票代碼失敗: {str(e)}")
                 return False
 
-        # 使用等待函數，但不因失敗而中斷
-        chart_loaded = wait_for_chart(page)
-        if not chart_loaded:
-            print(f"等待圖表加載失敗，但將嘗試繼續處理 {ticker}")
-        
-        # 下載HTML
-        try:
-            with page.expect_download(timeout=60000) as download_info:
-                download_button = page.get_by_role("button", name="下載")
-                download_button.click(timeout=60000)
-            download = download_info.value
-            time.sleep(5)  # 增加等待時間
-            
-            # 創建HTML保存目錄
-            html_dir = os.path.join(download_dir, ticker, "html")
-            os.makedirs(html_dir, exist_ok=True)
-            today_date = datetime.today().strftime('%Y%m%d')
-            html_filename = f"Gamma_{ticker}_{today_date}.html"
-            html_filepath = os.path.join(html_dir, html_filename)
-            
-            # 將下載的HTML文件移動到指定目錄
+        # session['model'] 為模型選單目前顯示的文字，切換模型時需要點擊它
+        if "gamma_data" in needed or "gamma_png" in needed:
+            if not _gamma_steps(page, ticker, download_dir, today_date, capture_mode, settings, tracer,
+                                manifest, needed, session['model']):
+                return False
+            session['model'] = "Gamma"
+
+        if "tvcode" in needed:
             try:
-                shutil.move(download.path(), html_filepath)
-                print(f"成功保存HTML文件到 {html_filepath}")
+                _tvcode_steps(page, ticker, download_dir, today_date, session, settings, tracer, manifest)
+                session['model'] = "TV Code"
             except Exception as e:
-                print(f"移動HTML文件失敗: {str(e)}")
-        except Exception as e:
-            print(f"下載HTML失敗: {str(e)}")
+                session['needs_reload'] = True
+                print(f"處理TV Code失敗: {str(e)}")
 
-        # 下載 Gamma 圖片
-        try:
-            # 移動鼠標到圖表區域
-            page.mouse.move(200, 200)
-            time.sleep(2)
-            
-            with page.expect_download(timeout=60000) as download_info:
-                modebar_button = page.locator(".modebar-btn").first
-                modebar_button.wait_for(state="visible", timeout=60000)
-                modebar_button.click(timeout=60000)
-            download = download_info.value
-            time.sleep(5)
-
-            # 處理 Gamma 圖片
-            ticker_dir = os.path.join(download_dir, ticker)
-            gamma_dir = os.path.join(ticker_dir, "gamma")
-            os.makedirs(gamma_dir, exist_ok=True)
-            today_date = datetime.today().strftime('%Y%m%d')
-            new_filename = f"Gamma_{ticker}_{today_date}.png"
-            new_filepath = os.path.join(gamma_dir, new_filename)
-            shutil.move(download.path(), new_filepath)
-            print(f"成功保存Gamma圖片到 {new_filepath}")
-            time.sleep(15)
-        except Exception as e:
-            print(f"下載Gamma圖片失敗: {str(e)}")
+        if "smile_png" in needed:
+            try:
+                _smile_steps(page, ticker, download_dir, today_date, session['model'], settings, tracer, manifest)
+                session['model'] = "Smile"
+            except Exception as e:
+                session['needs_reload'] = True
+                print(f"處理Smile圖片失敗: {str(e)}")
+
+        # 重新加載頁面，準備處理下一個股票
+        _reload_for_session(page, ticker, settings, tracer, session, "重新加載頁面")
+        
+        print(f"{ticker} 處理完成")
+        return True
 
-        # TV Code 處理
+    except Exception as e:
+        print(f"處理 {ticker} 時發生錯誤: {str(e)}")
+        # 嘗試重置頁面狀態
+        session['needs_reload'] = True
         try:
-            # 選擇TV Code模型
-            safe_click_and_wait(page, lambda: page.get_by_text("Gamma", exact=True), description="Gamma選項")
-            time.sleep(2)
-            safe_click_and_wait(page, lambda: page.get_by_role("option", name="TV Code"), description="TV Code選項")
-            time.sleep(2)
-            safe_click_and_wait(page, lambda: page.get_by_role("button", name="Enter"), description="Enter按鈕")
-            time.sleep(45)  # 給足夠時間加載
-
-            # 獲取文本內容
-            page.mouse.move(300, 300)
-            # 使用更穩健的方式獲取文本
+            reload_page(page, step_timeout(settings, "page_load"))
+            session['model'] = "Select model..."
+            session['needs_reload'] = False
+        except:
+            pass
+        return False
+
+def _gamma_steps(page, ticker, download_dir, today_date, capture_mode, settings, tracer, manifest, needed,
+                 current_model="Select model..."):
+    """選擇 Gamma 模型，保存圖表數據 (JSON 或 HTML) 與 Gamma 圖片"""
+    captured_responses = []
+    on_response = lambda response: collect_json_response(response, captured_responses)
+    if capture_mode == "network":
+        page.on("response", on_response)
+
+    ticker_dir = os.path.join(download_dir, ticker)
+    download_timeout = step_timeout(settings, "download")
+    gamma_timeout = step_timeout(settings, "gamma_load")
+
+    try:
+        # 選擇模型 - 使用更穩健的方法
+        with tracer.step(ticker, "model_select"):
             try:
-                # 先等待元素出現
-                page.wait_for_selector(".pt-5 p", state="visible", timeout=60000)
-                text_content = page.inner_text(".pt-5 p")
+                if not select_model(page, "Gamma", current_model, gamma_timeout):
+                    raise RuntimeError("無法選擇Gamma選項")
+                
+                # 點擊Enter按鈕
+                captured_responses.clear()
+                arm_plot_signal(page)
+                enter_button = page.get_by_role("button", name="Enter")
+                enter_button.click(timeout=60000)
+                print("已選擇Gamma模型並點擊Enter")
             except Exception as e:
-                print(f"獲取TV Code文本失敗: {str(e)}")
+                print(f"選擇模型失敗: {str(e)}")
+                set_outcome("fallback", e)
                 # 嘗試替代方法
                 try:
-                    text_content = page.evaluate("""
+                    # 使用JavaScript點擊
+                    captured_responses.clear()
+                    arm_plot_signal(page)
+                    page.evaluate("""
                         () => {
-                            const elements = document.querySelectorAll('.pt-5 p, p, pre, code');
-                            for (const el of elements) {
-                                if (el.textContent && el.textContent.trim().length > 0) {
-                                    return el.textContent;
-                                }
-                            }
-                            return '';
+                            const selectElements = Array.from(document.querySelectorAll('button, select, div')).
+                                filter(el => el.textContent.includes('Select model'));
+                            if (selectElements.length > 0) selectElements[0].click();
+                            
+                            setTimeout(() => {
+                                const gammaOptions = Array.from(document.querySelectorAll('div[role="option"]')).
+                                    filter(el => el.textContent.includes('Gamma'));
+                                if (gammaOptions.length > 0) gammaOptions[0].click();
+                                
+                                setTimeout(() => {
+                                    const enterButtons = Array.from(document.querySelectorAll('button')).
+                                        filter(el => el.textContent.includes('Enter'));
+                                    if (enterButtons.length > 0) enterButtons[0].click();
+                                }, 2000);
+                            }, 2000);
                         }
                     """)
-                except:
-                    text_content = "無法獲取TV Code"
-
-            if text_content and text_content.strip():
-                # 過濾掉所有包含中文字元的行
-                filtered_lines = []
-                for line in text_content.split('\n'):
-                    # 使用正則表達式檢查是否包含中文字元
-                    # CJK Unified Ideographs (\u4e00-\u9fff) 和其他常見中文範圍
-                    if not re.search(r'[\u4e00-\u9fff\u3400-\u4dbf\uf900-\ufaff\u3000-\u303f]', line):
-                        filtered_lines.append(line)
-                
-                # 重新組合過濾後的文本
-                filtered_text = '\n'.join(filtered_lines)
-                
-                # 只有在過濾後的文本不為空時才保存
-                if filtered_text.strip():
-                    tvcode_dir = os.path.join(download_dir, "tvcode")
-                    os.makedirs(tvcode_dir, exist_ok=True)
-                    today_date = datetime.today().strftime('%Y%m%d')
-                    text_filename = f"tvcode_{today_date}.txt"
-                    text_filepath = os.path.join(tvcode_dir, text_filename)
-
-                    with open(text_filepath, "a") as text_file:
-                        text_file.write(filtered_text + "\n\n")
-                print(f"成功保存TV Code到 {text_filepath}")
-        except Exception as e:
-            print(f"處理TV Code失敗: {str(e)}")
+                    print("使用替代方法選擇模型")
+                except Exception as e2:
+                    set_outcome("error", e2)
+                    print(f"替代選擇模型方法也失敗: {str(e2)}")
+                    return False
 
-        # Smile 圖片處理
-        try:
-            # 選擇Smile模型
-            safe_click_and_wait(page, lambda: page.get_by_text("TV Code"), description="TV Code選項")
-            time.sleep(2)
-            safe_click_and_wait(page, lambda: page.get_by_role("option", name="Smile"), description="Smile選項")
-            time.sleep(2)
-            safe_click_and_wait(page, lambda: page.get_by_role("button", name="Enter"), description="Enter按鈕")
-            time.sleep(30)  # 增加等待時間
-            
-            # 等待圖表加載
-            chart_loaded = wait_for_chart(page)
-            if not chart_loaded:
-                print(f"等待Smile圖表加載失敗，但將嘗試繼續處理")
-            
-            # 下載圖片
-            with page.expect_download(timeout=60000) as download2_info:
-                modebar_button = page.locator(".modebar-btn").first
-                modebar_button.wait_for(state="visible", timeout=60000)
-                modebar_button.click(timeout=60000)
-            download2 = download2_info.value
-            time.sleep(5)
-
-            smile_dir = os.path.join(ticker_dir, "smile")
-            os.makedirs(smile_dir, exist_ok=True)
-            new_filename = f"Smile_{ticker}_{today_date}.png"
-            new_filepath = os.path.join(smile_dir, new_filename)
-            shutil.move(download2.path(), new_filepath)
-            print(f"成功保存Smile圖片到 {new_filepath}")
-        except Exception as e:
-            print(f"處理Smile圖片失敗: {str(e)}")
+        # 等待 Gamma 圖表繪製完成，超時則退回原本的等待函數，但不因失敗而中斷
+        with tracer.step(ticker, "gamma_load"):
+            try:
+                wait_for_plot_ready(page, gamma_timeout)
+            except Exception as e:
+                set_outcome("fallback", e)
+                print(f"等待Gamma圖表繪製訊號超時: {str(e)}")
+                if not wait_for_chart(page, max_retries=2):
+                    set_outcome("timeout")
+                    print(f"等待圖表加載失敗，但將嘗試繼續處理 {ticker}")
 
-        # 重新加載頁面，準備處理下一個股票
+        if "gamma_data" in needed:
+            # 從網路回應擷取 Gamma 圖表數據
+            figure_saved = False
+            if capture_mode == "network":
+                with tracer.step(ticker, "json_capture"):
+                    try:
+                        figure = capture_gamma_figure(captured_responses)
+                        if figure:
+                            json_filepath = save_gamma_figure(figure, download_dir, ticker, today_date)
+                            manifest.record(ticker, "gamma_data", json_filepath)
+                            figure_saved = True
+                            print(f"成功從網路回應保存Gamma數據到 {json_filepath}")
+                        else:
+                            set_outcome("missing")
+                            print(f"未在網路回應中找到 {ticker} 的Gamma圖表數據，改為下載HTML")
+                    except Exception as e:
+                        set_outcome("error", e)
+                        print(f"保存Gamma圖表數據失敗: {str(e)}，改為下載HTML")
+
+            # 下載HTML (network 模式下作為備援)
+            if not figure_saved:
+                with tracer.step(ticker, "html_download"):
+                    try:
+                        with page.expect_download(timeout=download_timeout) as download_info:
+                            download_button = page.get_by_role("button", name="下載")
+                            download_button.click(timeout=download_timeout)
+
+                        # 將下載的HTML文件移動到指定目錄
+                        try:
+                            html_filepath = save_download(download_info.value, os.path.join(ticker_dir, "html"),
+                                                          f"Gamma_{ticker}_{today_date}.html")
+                            manifest.record(ticker, "gamma_data", html_filepath)
+                            print(f"成功保存HTML文件到 {html_filepath}")
+                        except Exception as e:
+                            set_outcome("error", e)
+                            print(f"移動HTML文件失敗: {str(e)}")
+                    except Exception as e:
+                        set_outcome("error", e)
+                        print(f"下載HTML失敗: {str(e)}")
+
+        # 下載 Gamma 圖片
+        if "gamma_png" in needed:
+            with tracer.step(ticker, "gamma_png"):
+                try:
+                    download = download_plot_png(page, download_timeout)
+                    new_filepath = save_download(download, os.path.join(ticker_dir, "gamma"),
+                                                 f"Gamma_{ticker}_{today_date}.png")
+                    manifest.record(ticker, "gamma_png", new_filepath)
+                    print(f"成功保存Gamma圖片到 {new_filepath}")
+                except Exception as e:
+                    set_outcome("error", e)
+                    print(f"下載Gamma圖片失敗: {str(e)}")
+        return True
+    finally:
+        if capture_mode == "network":
+            page.remove_listener("response", on_response)
+
+def _tvcode_steps(page, ticker, download_dir, today_date, session, settings, tracer, manifest):
+    """切換到 TV Code 模型並保存 TV Code 文字
+
+    取得的文字不是 ticker 的段落時 (例如 keep_alive 下逾時後讀到上一個股票的 TV Code) 不保存，
+    並要求重新加載頁面，--resume 時會重新抓取。
+    """
+    current_model = session['model']
+    # 選擇TV Code模型，等待 TV Code 文字出現變化
+    tvcode_timeout = step_timeout(settings, "tvcode_load")
+    with tracer.step(ticker, "tvcode_select"):
+        previous_text = read_tvcode_text(page)
+        select_model(page, "TV Code", current_model, tvcode_timeout)
+        safe_click_and_wait(page, lambda: page.get_by_role("button", name="Enter"), description="Enter按鈕")
+
+    with tracer.step(ticker, "tvcode_load"):
+        page.mouse.move(300, 300)
+        # 使用更穩健的方式獲取文本
         try:
-            page.reload()
-            time.sleep(10)  # 給頁面充分時間加載
+            page.wait_for_function(TVCODE_READY_JS, arg=previous_text, timeout=tvcode_timeout)
+            text_content = page.inner_text(".pt-5 p")
         except Exception as e:
-            print(f"重新加載頁面失敗: {str(e)}")
+            set_outcome("fallback", e)
+            print(f"獲取TV Code文本失敗: {str(e)}")
+            # 嘗試替代方法
+            try:
+                text_content = page.evaluate("""
+                    () => {
+                        const elements = document.querySelectorAll('.pt-5 p, p, pre, code');
+                        for (const el of elements) {
+                            if (el.textContent && el.textContent.trim().length > 0) {
+                                return el.textContent;
+                            }
+                        }
+                        return '';
+                    }
+                """)
+            except:
+                set_outcome("error")
+                text_content = "無法獲取TV Code"
+
+    if text_content and text_content.strip():
+        # 過濾掉所有包含中文字元的行
+        filtered_lines = []
+        for line in text_content.split('\n'):
+            # 使用正則表達式檢查是否包含中文字元
+            # CJK Unified Ideographs (\u4e00-\u9fff) 和其他常見中文範圍
+            if not re.search(r'[\u4e00-\u9fff\u3400-\u4dbf\uf900-\ufaff\u3000-\u303f]', line):
+                filtered_lines.append(line)
         
-        print(f"{ticker} 處理完成")
-        return True
+        # 重新組合過濾後的文本
+        filtered_text = '\n'.join(filtered_lines)
+        
+        # 只有在過濾後的文本不為空時才保存
+        if filtered_text.strip():
+            symbol = block_symbol(filtered_text)
+            if symbol != ticker.upper():
+                with tracer.step(ticker, "tvcode_save"):
+                    set_outcome("error", f"TV Code 的股票代碼為 {symbol}")
+                session['needs_reload'] = True
+                print(f"TV Code 的股票代碼 {symbol} 與 {ticker} 不符，不保存")
+                return
 
-    except Exception as e:
-        print(f"處理 {ticker} 時發生錯誤: {str(e)}")
-        # 嘗試重置頁面狀態
+            tvcode_dir = os.path.join(download_dir, "tvcode")
+            os.makedirs(tvcode_dir, exist_ok=True)
+            text_filename = f"tvcode_{today_date}.txt"
+            text_filepath = os.path.join(tvcode_dir, text_filename)
+
+            # 取代同一股票既有的段落，重跑時不會重複附加；
+            # 並行模式下多個工作執行緒會寫入同一個文件
+            with tvcode_lock:
+                write_tvcode_block(text_filepath, filtered_text)
+            manifest.record(ticker, "tvcode", text_filepath, text=filtered_text)
+            print(f"成功保存TV Code到 {text_filepath}")
+
+def _smile_steps(page, ticker, download_dir, today_date, current_model, settings, tracer, manifest):
+    """切換到 Smile 模型並保存 Smile 圖片"""
+    # 選擇Smile模型
+    smile_timeout = step_timeout(settings, "smile_load")
+    with tracer.step(ticker, "smile_select"):
+        select_model(page, "Smile", current_model, smile_timeout)
+        arm_plot_signal(page)
+        safe_click_and_wait(page, lambda: page.get_by_role("button", name="Enter"), description="Enter按鈕")
+    
+    # 等待圖表繪製完成
+    with tracer.step(ticker, "smile_load"):
         try:
-            page.reload()
-            time.sleep(10)
-        except:
-            pass
-        return False
+            wait_for_plot_ready(page, smile_timeout)
+        except Exception as e:
+            set_outcome("fallback", e)
+            print(f"等待Smile圖表繪製訊號超時: {str(e)}")
+            if not wait_for_chart(page, max_retries=2):
+                set_outcome("timeout")
+                print(f"等待Smile圖表加載失敗，但將嘗試繼續處理")
+    
+    # 下載圖片
+    with tracer.step(ticker, "smile_png"):
+        download2 = download_plot_png(page, step_timeout(settings, "download"))
+        new_filepath = save_download(download2, os.path.join(download_dir, ticker, "smile"),
+                                     f"Smile_{ticker}_{today_date}.png")
+    manifest.record(ticker, "smile_png", new_filepath)
+    print(f"成功保存Smile圖片到 {new_filepath}")
 
-def run(playwright: Playwright, auth_file: str, tickers: list, download_dir: str) -> None:
-    """主要運行函數"""
+def open_platform_page(playwright: Playwright, auth_file: str, settings=None, request_filter=None):
+    """啟動瀏覽器、以 auth.json 建立上下文並打開平台頁面
+
+    request_filter 不為 None 時，在上下文上攔截與圖表無關的請求。
+    settings["har"] 為 {"mode": "record" 或 "replay", "path": HAR 文件, "server": 替身伺服器網址 (可選)}
+    時記錄或重播 HAR，見 scrape_replay.py。
+    """
+    settings = settings or {}
+    har_settings = settings.get("har")
     # 設置更長的超時時間和更穩健的瀏覽器選項
     browser = playwright.chromium.launch(
-        headless=False,
+        headless=settings.get("headless", False),
         args=[
             '--disable-web-security',
             '--disable-features=IsolateOrigins,site-per-process',
@@ -335,8 +654,12 @@ def run(playwright: Playwright, auth_file: str, tickers: list, download_dir: str
     context = browser.new_context(
         storage_state=auth_file, 
         viewport={"width":1920,"height":1080},
-        accept_downloads=True
+        accept_downloads=True,
+        **har_context_options(har_settings)
     )
+    if request_filter is not None:
+        request_filter.install(context)
+    install_har_routing(context, har_settings)
     
     # 配置頁面
     page = context.new_page()
@@ -350,25 +673,126 @@ def run(playwright: Playwright, auth_file: str, tickers: list, download_dir: str
     
     # 導航到目標網站
     try:
-        page.goto("https://www.lietaresearch.com/platform", timeout=60000)
-        page.wait_for_load_state("networkidle", timeout=60000)
-        time.sleep(20)  # 給頁面充分時間加載
-        print("成功加載網站")
+        started = time.monotonic()
+        page_timeout = step_timeout(settings, "page_load")
+        page.goto(settings.get("platform_url", PLATFORM_URL), timeout=page_timeout)
+        page.get_by_placeholder("Ticker").wait_for(state="visible", timeout=page_timeout)
+        print(f"成功加載網站 ({time.monotonic() - started:.1f}s)")
     except Exception as e:
         print(f"加載網站失敗: {str(e)}")
     
+    return browser, context, page
+
+def run(playwright: Playwright, auth_file: str, tickers: list, download_dir: str, capture_mode: str = "network",
+        settings=None, tracer=None, manifest=None, resume=False, request_filter=None) -> None:
+    """主要運行函數"""
+    browser, context, page = open_platform_page(playwright, auth_file, settings, request_filter)
+    session = new_page_session()
+    
     # 處理每個股票
     for ticker in tickers:
         print(f"\n===== 開始處理 {ticker} =====")
-        success = process_ticker(page, ticker, download_dir)
+        success = process_ticker(page, ticker, download_dir, capture_mode, settings, tracer, manifest, resume,
+                                 session)
         if not success:
             print(f"處理 {ticker} 失敗，將繼續處理下一個股票")
-        time.sleep(10)  # 在處理下一個股票前等待
     
     print("\n所有股票處理完成")
     context.close()
     browser.close()
 
+def run_worker(worker_id, auth_file, ticker_queue, download_dir, capture_mode, retries, results,
+               settings=None, tracer=None, manifest=None, resume=False, request_filter=None):
+    """工作執行緒：擁有獨立的瀏覽器上下文，從佇列中取出股票逐一處理
+
+    Playwright 的同步 API 物件只能在建立它的執行緒中使用，
+    因此每個工作執行緒都啟動自己的 sync_playwright 實例，共用同一個 auth.json。
+    """
+    finished = False
+    try:
+        with sync_playwright() as playwright:
+            browser, context, page = open_platform_page(playwright, auth_file, settings, request_filter)
+            session = new_page_session()
+            try:
+                while not finished:
+                    ticker = ticker_queue.get()
+                    try:
+                        if ticker is None:
+                            finished = True
+                            break
+                        
+                        success = False
+                        for attempt in range(retries):
+                            print(f"\n===== [worker {worker_id}] 開始處理 {ticker} (嘗試 {attempt + 1}/{retries}) =====")
+                            success = process_ticker(page, ticker, download_dir, capture_mode,
+                                                     settings, tracer, manifest, resume, session)
+                            if success:
+                                break
+                            print(f"[worker {worker_id}] 處理 {ticker} 失敗")
+                        results[ticker] = success
+                    finally:
+                        ticker_queue.task_done()
+            finally:
+                context.close()
+                browser.close()
+    except Exception as e:
+        print(f"[worker {worker_id}] 瀏覽器發生錯誤: {str(e)}")
+    
+    # 瀏覽器異常結束時繼續消耗佇列，避免主執行緒在 put 時永久阻塞
+    while not finished:
+        ticker = ticker_queue.get()
+        ticker_queue.task_done()
+        if ticker is None:
+            finished = True
+        else:
+            print(f"[worker {worker_id}] 略過 {ticker}：瀏覽器已無法使用")
+            results[ticker] = False
+
+def run_parallel(auth_file: str, tickers: list, download_dir: str, capture_mode: str = "network",
+                 workers: int = 2, retries: int = 3, queue_size: int = 0, settings=None, tracer=None,
+                 manifest=None, resume=False, request_filter=None) -> dict:
+    """以多個瀏覽器上下文並行處理股票，總耗時約為 股票數 / workers
+
+    Args:
+        workers: 並行的工作執行緒 (瀏覽器上下文) 數量
+        retries: 每個股票在同一工作執行緒中的最大嘗試次數
+        queue_size: 待處理佇列的上限，0 表示與 workers 相同
+
+    Returns:
+        dict: 每個股票的處理結果 {ticker: bool}
+    """
+    workers = max(1, min(workers, len(tickers)))
+    ticker_queue = queue.Queue(maxsize=queue_size or workers)
+    results = {}
+    
+    threads = [
+        threading.Thread(
+            target=run_worker,
+            args=(worker_id, auth_file, ticker_queue, download_dir, capture_mode, max(1, retries), results,
+                  settings, tracer, manifest, resume, request_filter),
+            name=f"scraper-worker-{worker_id}",
+            daemon=True
+        )
+        for worker_id in range(1, workers + 1)
+    ]
+    for thread in threads:
+        thread.start()
+    
+    # 佇列有上限，put 會在工作執行緒都忙碌時阻塞
+    for ticker in tickers:
+        ticker_queue.put(ticker)
+    for _ in threads:
+        ticker_queue.put(None)
+    
+    for thread in threads:
+        thread.join()
+    
+    failed = [ticker for ticker in tickers if not results.get(ticker)]
+    print(f"\n所有股票處理完成 (workers={workers})，成功 {len(tickers) - len(failed)} 個，失敗 {len(failed)} 個")
+    if failed:
+        print(f"處理失敗的股票: {', '.join(failed)}")
+    return results
+
 def main():
     """主程序"""
     parser = argparse.ArgumentParser(description='股票數據採集工具')
@@ -379,6 +803,26 @@ def main():
     parser.add_argument('--download-dir', type=str,
                       default='/home/ben/pCloudDrive/stock/GEX/GEX_file/',
                       help='下載目錄路徑')
+    parser.add_argument('--capture', choices=['network', 'html'], default='network',
+                      help='Gamma 數據擷取方式: network=從網路回應保存 JSON (失敗時下載 HTML), html=只下載 HTML (default: network)')
+    parser.add_argument('--trace-dir', type=str, default=None,
+                      help='步驟耗時記錄 (JSONL) 的目錄 (default: <download-dir>/trace)')
+    parser.add_argument('--resume', action='store_true',
+                      help='只補抓今日檢查點清單 (manifest) 中缺少的產物')
+    parser.add_argument('--no-block-requests', dest='block_requests', action='store_false', default=True,
+                      help='不攔截字型、圖片與追蹤服務等請求 (仍會記錄資源大小，供估計節省的流量)')
+    parser.add_argument('--keep-alive', action='store_true', default=None,
+                      help='股票之間不重新加載頁面，只在步驟失敗後重新加載 (default: config.json 的 download_settings.keep_alive)')
+    parser.add_argument('--workers', type=int, default=None,
+                      help='並行處理的瀏覽器上下文數量 (default: config.json 的 download_settings.workers 或 1)')
+    parser.add_argument('--headless', action='store_true', help='不顯示瀏覽器視窗')
+    har_group = parser.add_mutually_exclusive_group()
+    har_group.add_argument('--record-har', metavar='PATH',
+                      help='將本次運行的網路請求記錄為 HAR (.zip 或 .har)，供離線重播')
+    har_group.add_argument('--replay-har', metavar='PATH',
+                      help='以 HAR 記錄重播平台頁面，不連線到網站')
+    parser.add_argument('--har-server', metavar='URL',
+                      help='重播時經由 scrape_replay.py 啟動的替身伺服器回應請求')
     
     args = parser.parse_args()
     
@@ -391,8 +835,56 @@ def main():
                        "tsla", "uvix", "svix", "tlt"]
         }
 
-    with sync_playwright() as playwright:
-        run(playwright, args.auth, config['tickers'], args.download_dir)
+    settings = dict(config.get('download_settings', {}))
+    if args.keep_alive:
+        settings['keep_alive'] = True
+    if args.headless:
+        settings['headless'] = True
+    workers = args.workers if args.workers is not None else settings.get('workers', 1)
+    if args.record_har:
+        settings['har'] = {'mode': 'record', 'path': args.record_har}
+        if workers > 1:
+            print("記錄 HAR 時只使用一個瀏覽器上下文")
+            workers = 1
+    elif args.replay_har:
+        settings['har'] = {'mode': 'replay', 'path': args.replay_har, 'server': args.har_server}
+
+    # 每次運行輸出一個步驟耗時記錄文件，可用 scrape_trace.py 統計最近 N 次運行
+    trace_dir = args.trace_dir or os.path.join(args.download_dir, "trace")
+    tracer = StepTracer(os.path.join(trace_dir, f"scrape_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"))
+    manifest = ScrapeManifest.for_date(args.download_dir)
+    filter_settings = dict(config.get('request_filter', {}))
+    if not args.block_requests:
+        filter_settings['enabled'] = False
+    request_filter = RequestFilter(filter_settings, os.path.join(trace_dir, SIZE_TABLE_FILE))
+    run_started = time.monotonic()
+
+    tickers = config['tickers']
+    if args.resume:
+        tickers = [ticker for ticker in tickers if manifest.missing(ticker)]
+        print(f"續傳模式：{len(config['tickers']) - len(tickers)} 個股票今日已完成，剩餘 {len(tickers)} 個")
+
+    try:
+        if not tickers:
+            print("沒有需要處理的股票")
+        elif workers > 1:
+            run_parallel(args.auth, tickers, args.download_dir, args.capture,
+                         workers=workers, retries=settings.get('retries', 3),
+                         queue_size=settings.get('queue_size', 0), settings=settings, tracer=tracer,
+                         manifest=manifest, resume=args.resume, request_filter=request_filter)
+        else:
+            with sync_playwright() as playwright:
+                run(playwright, args.auth, tickers, args.download_dir, args.capture, settings, tracer,
+                    manifest, args.resume, request_filter)
+    finally:
+        tracer.close()
+        request_filter.save_size_table()
+        request_filter.print_summary()
+        print_summary(tracer.records, title=f"本次運行步驟耗時統計 (總耗時 {time.monotonic() - run_started:.1f}s)")
+        reload_records = [record for record in tracer.records if record['step'] == 'reload']
+        avoided = sum(1 for record in reload_records if record['outcome'] == 'avoided')
+        print(f"重新加載頁面 {len(reload_records) - avoided} 次，避免了 {avoided} 次")
+        print(f"步驟耗時記錄已保存到 {tracer.trace_path}")
 
 if __name__ == "__main__":
     main()
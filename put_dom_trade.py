@@ -12,10 +12,16 @@ from io import BytesIO
 import json
 import requests
 import pickle
+from levels_db import LEVELS_DB_FILE, LevelsDB, backfill as sync_levels
 
 # 載入環境變數
 load_dotenv()
 
+# 市場狀態使用的水平: Gamma Flip、Gamma Flip CE、Put Dominate
+MARKET_STATUS_CODES = ('GF', 'GFCE', 'PD')
+# 查詢前先同步這段期間內有變動的 tvcode 文件 (天)
+LEVELS_SYNC_DAYS = 14
+
 def get_previous_trading_day(date):
     """獲取前一個交易日的日期"""
     current = date
@@ -25,94 +31,48 @@ def get_previous_trading_day(date):
         if current.weekday() < 5:
             return current
 
-def parse_price_levels(line):
-    """解析價格水平"""
-    try:
-        parts = line.split(':')
-        if len(parts) < 2:
-            print(f"行格式錯誤: {line}")
-            return None, {}
-            
-        stock = parts[0]
-        levels_str = parts[1]
-        levels = {}
-        
-        # 分割成標籤=值的對
-        items = levels_str.split('=')
-        
-        for i in range(len(items)-1):
-            # 取得當前項和下一項
-            current_item = items[i]
-            next_item = items[i+1]
-            
-            # 從下一項中提取數值
-            value = ""
-            for char in next_item:
-                if char.isdigit() or char == '.':
-                    value += char
-                else:
-                    break
-            
-            if value:  # 如果找到數值
-                value = float(value)
-                # 從當前項中提取標籤
-                if i == 0:
-                    labels = current_item.split(',')
-                else:
-                    # 找到前一個數值的結尾位置
-                    prev_value = ""
-                    for char in current_item:
-                        if char.isdigit() or char == '.':
-                            prev_value += char
-                        else:
-                            break
-                    labels = current_item[len(prev_value):].split(',')
-                
-                # 清理並儲存每個標籤
-                for label in labels:
-                    label = label.strip()
-                    if label:  # 確保標籤不為空
-                        levels[label] = value
-        
-        # 映射標籤到標準名稱
-        standardized_levels = {}
-        
-        # 特殊處理 Gamma Flip：優先使用 GF，如果沒有則使用 GFCE
-        if 'GF' in levels:
-            standardized_levels['Gamma Flip'] = levels['GF']
-        elif 'GFCE' in levels:
-            standardized_levels['Gamma Flip'] = levels['GFCE']
-            
-        # 其他標籤的映射
-        label_mapping = {
-            'GFCE': 'Gamma Flip CE',      # Gamma Flip CE
-            'GFLCE': 'Gamma Field CE',    # Gamma Field CE (不是 Gamma Flip CE)
-            'PD': 'Put Dominate',         # Put Dominate
-            'CD': 'Call Dominate',        # Call Dominate
-            'PW': 'Put Wall',             # Put Wall
-            'CW': 'Call Wall',            # Call Wall
-            'KD': 'Key Delta',            # Key Delta
-            'LG': 'Large Gamma',          # Large Gamma
-            'IM+': 'Implied Movement +σ',  # Implied Movement +σ
-            'IM-': 'Implied Movement -σ',  # Implied Movement -σ
-            'IM2+': 'Implied Movement +2σ', # Implied Movement +2σ
-            'IM2-': 'Implied Movement -2σ', # Implied Movement -2σ
-        }
-        
-        # 轉換標籤
-        for label, value in levels.items():
-            if label in label_mapping:
-                standard_label = label_mapping[label]
-                if standard_label != 'Gamma Flip':  # 避免重複添加 Gamma Flip
-                    standardized_levels[standard_label] = value
-        
-        # 調試輸出
-        print(f"解析結果 {stock}: Gamma Flip={standardized_levels.get('Gamma Flip')}, Gamma Flip CE={standardized_levels.get('Gamma Flip CE')}, Gamma Field CE={standardized_levels.get('Gamma Field CE')}, Put Dominate={standardized_levels.get('Put Dominate')}")
-            
-        return stock, standardized_levels
-    except Exception as e:
-        print(f"解析價格水平時發生錯誤: {e}")
-        return None, {}
+def standardize_levels(stock, levels):
+    """將 {短代碼: 價格} 映射為標準名稱"""
+    # 映射標籤到標準名稱
+    standardized_levels = {}
+    
+    # 特殊處理 Gamma Flip：優先使用 GF，如果沒有則使用 GFCE
+    if 'GF' in levels:
+        standardized_levels['Gamma Flip'] = levels['GF']
+    elif 'GFCE' in levels:
+        standardized_levels['Gamma Flip'] = levels['GFCE']
+        
+    # 其他標籤的映射
+    label_mapping = {
+        'GFCE': 'Gamma Flip CE',      # Gamma Flip CE
+        'GFLCE': 'Gamma Field CE',    # Gamma Field CE (不是 Gamma Flip CE)
+        'PD': 'Put Dominate',         # Put Dominate
+        'CD': 'Call Dominate',        # Call Dominate
+        'PW': 'Put Wall',             # Put Wall
+        'CW': 'Call Wall',            # Call Wall
+        'KD': 'Key Delta',            # Key Delta
+        'LG': 'Large Gamma',          # Large Gamma
+        'IM+': 'Implied Movement +σ',  # Implied Movement +σ
+        'IM-': 'Implied Movement -σ',  # Implied Movement -σ
+        'IM2+': 'Implied Movement +2σ', # Implied Movement +2σ
+        'IM2-': 'Implied Movement -2σ', # Implied Movement -2σ
+    }
+    
+    # 轉換標籤
+    for label, value in levels.items():
+        if label in label_mapping:
+            standard_label = label_mapping[label]
+            if standard_label != 'Gamma Flip':  # 避免重複添加 Gamma Flip
+                standardized_levels[standard_label] = value
+    
+    # 調試輸出
+    print(f"解析結果 {stock}: Gamma Flip={standardized_levels.get('Gamma Flip')}, Gamma Flip CE={standardized_levels.get('Gamma Flip CE')}, Gamma Field CE={standardized_levels.get('Gamma Field CE')}, Put Dominate={standardized_levels.get('Put Dominate')}")
+
+    return standardized_levels
+
+def day_levels(recent, date_str):
+    """從 LevelsDB.recent_levels 的結果取出一天的 {股票: 標準化的水平}，沒有該日期時返回空字典"""
+    return {stock: standardize_levels(stock, days[date_str]) for stock, days in recent.items() if date_str in days}
 
 def get_real_time_price(symbol):
     """獲取即時價格"""
@@ -544,17 +504,33 @@ async def send_market_status():
     
     today = datetime.now()
     today_str = today.strftime("%Y%m%d")
-    today_file = os.path.join(base_path, f"tvcode_{today_str}.txt")
     
-    # 獲取前一個交易日
-    prev_day = get_previous_trading_day(today)
-    prev_day_str = prev_day.strftime("%Y%m%d")
-    prev_file = os.path.join(base_path, f"tvcode_{prev_day_str}.txt")
+    # 以一次索引查詢從水平資料庫讀取最近三個交易日 (今日、前一個、前前一個) 的水平，
+    # 查詢前先同步最近有變動的 tvcode 文件 (例如當天沒有執行 gamma_converter)
+    try:
+        with LevelsDB(os.path.join(base_path, LEVELS_DB_FILE)) as db:
+            sync_levels(db, base_path, (today - timedelta(days=LEVELS_SYNC_DAYS)).strftime("%Y%m%d"), today_str)
+            trading_days = db.trading_days(until=today_str, limit=3)
+            recent = db.recent_levels(None, 3, MARKET_STATUS_CODES, today_str)
+    except Exception as e:
+        print(f"讀取水平資料庫時發生錯誤: {e}")
+        return
     
-    # 獲取前前一個交易日
-    prev_prev_day = get_previous_trading_day(prev_day)
-    prev_prev_day_str = prev_prev_day.strftime("%Y%m%d")
-    prev_prev_file = os.path.join(base_path, f"tvcode_{prev_prev_day_str}.txt")
+    if not trading_days:
+        print("無法找到最近的價格文件")
+        return
+    if trading_days[0] != today_str:
+        print(f"找不到今日的價格文件，使用 {trading_days[0]} 的數據")
+        today_str = trading_days[0]
+    
+    # 前一個交易日 (資料庫中沒有時以日曆推算，只用於顯示與下載股價) 與前前一個交易日
+    if len(trading_days) > 1:
+        prev_day = datetime.strptime(trading_days[1], "%Y%m%d")
+    else:
+        print("無法找到更早的價格文件進行比較")
+        prev_day = get_previous_trading_day(datetime.strptime(today_str, "%Y%m%d"))
+    prev_day_str = prev_day.strftime("%Y%m%d")
+    prev_prev_day_str = trading_days[2] if len(trading_days) > 2 else None
     
     gamma_history_file = os.path.join(base_path, "gamma_environment_history.json")
     gamma_history = {}
@@ -566,73 +542,17 @@ async def send_market_status():
     except Exception as e:
         print(f"讀取Gamma環境歷史數據時發生錯誤: {e}")
     
-    # 檢查今日文件是否存在
-    if not os.path.exists(today_file):
-        print(f"找不到今日的價格文件: {today_file}")
-        # 嘗試找到最近的文件
-        found = False
-        test_date = today
-        for _ in range(5):  # 嘗試往前找5天
-            test_date = get_previous_trading_day(test_date)
-            test_file = os.path.join(base_path, f"tvcode_{test_date.strftime('%Y%m%d')}.txt")
-            if os.path.exists(test_file):
-                today_file = test_file
-                today_str = test_date.strftime("%Y%m%d")
-                # 更新前一個交易日
-                prev_day = get_previous_trading_day(test_date)
-                prev_day_str = prev_day.strftime("%Y%m%d")
-                prev_file = os.path.join(base_path, f"tvcode_{prev_day_str}.txt")
-                # 更新前前一個交易日
-                prev_prev_day = get_previous_trading_day(prev_day)
-                prev_prev_day_str = prev_prev_day.strftime("%Y%m%d")
-                prev_prev_file = os.path.join(base_path, f"tvcode_{prev_prev_day_str}.txt")
-                found = True
-                break
-        if not found:
-            print("無法找到最近的價格文件")
-            return
-    
-    # 檢查前一個交易日文件是否存在
-    if not os.path.exists(prev_file):
-        print(f"找不到前一個交易日的價格文件: {prev_file}")
-        # 嘗試找到更早的文件
-        found = False
-        test_date = prev_day
-        for _ in range(5):  # 嘗試往前找5天
-            test_date = get_previous_trading_day(test_date)
-            test_file = os.path.join(base_path, f"tvcode_{test_date.strftime('%Y%m%d')}.txt")
-            if os.path.exists(test_file):
-                prev_file = test_file
-                prev_day_str = test_date.strftime("%Y%m%d")
-                # 更新前前一個交易日
-                prev_prev_day = get_previous_trading_day(test_date)
-                prev_prev_day_str = prev_prev_day.strftime("%Y%m%d")
-                prev_prev_file = os.path.join(base_path, f"tvcode_{prev_prev_day_str}.txt")
-                found = True
-                break
-        if not found:
-            print("無法找到更早的價格文件進行比較")
-    
     market_data = []
     
     # 讀取昨日數據（如果存在）
     prev_data = {}
-    if os.path.exists(prev_file):
-        try:
-            print(f"正在讀取昨日數據文件: {prev_file}")
-            with open(prev_file, 'r') as f:
-                for line in f:
-                    result = parse_price_levels(line.strip())
-                    if result[0] is not None:  # 確保解析成功
-                        stock, levels = result
-                        prev_data[stock] = {
-                            'gamma_flip': levels.get('Gamma Flip'),
-                            'gamma_flip_ce': levels.get('Gamma Flip CE'),
-                            'put_dominate': levels.get('Put Dominate')
-                        }
-                        print(f"昨日數據 - {stock}: Gamma Flip = {levels.get('Gamma Flip')}")
-        except Exception as e:
-            print(f"讀取昨日數據時發生錯誤: {e}")
+    for stock, levels in day_levels(recent, prev_day_str).items():
+        prev_data[stock] = {
+            'gamma_flip': levels.get('Gamma Flip'),
+            'gamma_flip_ce': levels.get('Gamma Flip CE'),
+            'put_dominate': levels.get('Put Dominate')
+        }
+        print(f"昨日數據 - {stock}: Gamma Flip = {levels.get('Gamma Flip')}")
     
     # 建立昨日數據的映射關係
     prev_gamma_flips = {}
@@ -642,20 +562,12 @@ async def send_market_status():
     
     # 讀取前前日數據（如果存在）
     prev_prev_data = {}
-    if os.path.exists(prev_prev_file):
-        try:
-            with open(prev_prev_file, 'r') as f:
-                for line in f:
-                    result = parse_price_levels(line.strip())
-                    if result[0] is not None:  # 確保解析成功
-                        stock, levels = result
-                        prev_prev_data[stock] = {
-                            'gamma_flip': levels.get('Gamma Flip'),
-                            'gamma_flip_ce': levels.get('Gamma Flip CE'),
-                            'put_dominate': levels.get('Put Dominate')
-                        }
-        except Exception as e:
-            print(f"讀取前前日數據時發生錯誤: {e}")
+    for stock, levels in day_levels(recent, prev_prev_day_str).items():
+        prev_prev_data[stock] = {
+            'gamma_flip': levels.get('Gamma Flip'),
+            'gamma_flip_ce': levels.get('Gamma Flip CE'),
+            'put_dominate': levels.get('Put Dominate')
+        }
     
     # 獲取昨日股價數據 - 使用批量下載提高效率
     stocks = list(set(list(prev_data.keys()) + list(prev_prev_data.keys())))
@@ -692,18 +604,10 @@ async def send_market_status():
     monitored_symbols = ['QQQ', 'SPX', 'VIX', 'IWM', 'SMH']
     
     # 處理每個股票
-    with open(today_file, 'r') as f:
-        today_lines = f.readlines()
+    today_levels = day_levels(recent, today_str)
     
-    for line in today_lines:
+    for stock, levels in today_levels.items():
         try:
-            result = parse_price_levels(line.strip())
-            if result[0] is None:  # 如果解析失敗，跳過此行
-                continue
-                
-            stock = result[0]
-            levels = result[1]
-            
             # 獲取當前價格
             current_price = get_real_time_price(stock)
             
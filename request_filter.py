@@ -0,0 +1,191 @@
+"""
+爬蟲瀏覽器的請求過濾
+
+以 context.route 攔截與圖表數據無關的請求 (字型、圖片、媒體、分析與追蹤服務)，
+縮短每次 page.reload() 與 networkidle 的等待，並統計被攔截的請求數與節省的流量。
+
+注意：啟用 route 後 Chromium 會停用 HTTP 快取，若被攔截的資源很少，
+可以在 config.json 的 request_filter.enabled 設為 false 比較前後差異。
+
+節省的流量以資源大小表 (<download-dir>/trace/request_sizes.json，playwright_record 與 check_auth 共用)
+估計，表中的大小只能從實際下載 (未攔截) 的回應取得。第一次使用前以
+    python playwright_record.py --no-block-requests
+運行一次記錄實際大小；表中沒有的資源以 fallback_sizes 中該資源類型的典型大小估計。
+"""
+
+import os
+import json
+import threading
+from urllib.parse import urlsplit
+
+DEFAULT_REQUEST_FILTER = {
+    "enabled": True,
+    # 依資源類型攔截 (Playwright request.resource_type)
+    "block_resource_types": ["image", "media", "font"],
+    # 依網域攔截，包含子網域
+    "block_domains": [
+        "google-analytics.com",
+        "googletagmanager.com",
+        "doubleclick.net",
+        "facebook.net",
+        "hotjar.com",
+        "clarity.ms",
+        "segment.io",
+        "mixpanel.com",
+        "intercom.io",
+        "sentry.io"
+    ],
+    # 這些網域的資源不依類型攔截 (網域黑名單仍然有效)
+    "allow_domains": [],
+    # 大小表中沒有記錄時，各資源類型的典型大小 (bytes)
+    "fallback_sizes": {
+        "image": 25000,
+        "media": 300000,
+        "font": 40000,
+        "script": 50000,
+        "stylesheet": 20000,
+        "xhr": 2000,
+        "fetch": 2000
+    }
+}
+
+SIZE_TABLE_FILE = "request_sizes.json"
+
+def domain_matches(hostname, domains):
+    """hostname 是否等於清單中的網域或為其子網域"""
+    return any(hostname == domain or hostname.endswith("." + domain) for domain in domains)
+
+def strip_query(url):
+    """去掉查詢字串，作為資源大小表的鍵"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+class RequestFilter:
+    """可在多個瀏覽器上下文 (包含並行模式的工作執行緒) 共用的請求過濾器
+
+    被攔截的資源沒有實際下載，節省的流量以先前未攔截時記錄的大小估計，
+    大小表保存在 size_table_path；未記錄過的資源以該資源類型的 fallback_sizes 估計，
+    類型也沒有預設大小時只計入請求數。
+    """
+
+    def __init__(self, settings=None, size_table_path=None):
+        self.settings = dict(DEFAULT_REQUEST_FILTER)
+        self.settings.update(settings or {})
+        self.block_types = set(self.settings["block_resource_types"])
+        self.block_domains = list(self.settings["block_domains"])
+        self.allow_domains = list(self.settings["allow_domains"])
+        self.fallback_sizes = dict(DEFAULT_REQUEST_FILTER["fallback_sizes"])
+        self.fallback_sizes.update(self.settings.get("fallback_sizes") or {})
+        self.size_table_path = size_table_path
+        self.size_table = {}
+        self.stats = {
+            "allowed_requests": 0,
+            "blocked_requests": 0,
+            "loaded_bytes": 0,
+            "saved_bytes": 0,
+            "blocked_estimated_size": 0,
+            "blocked_unknown_size": 0,
+            "blocked_by_reason": {}
+        }
+        self._lock = threading.Lock()
+
+        if size_table_path and os.path.exists(size_table_path):
+            try:
+                with open(size_table_path, 'r', encoding='utf-8') as f:
+                    self.size_table = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"讀取資源大小表失敗: {str(e)}")
+
+    @property
+    def enabled(self):
+        return bool(self.settings.get("enabled", True))
+
+    def block_reason(self, url, resource_type):
+        """返回攔截原因 (domain:<網域> 或 type:<類型>)，不攔截時返回 None"""
+        hostname = urlsplit(url).hostname or ""
+        if domain_matches(hostname, self.block_domains):
+            return f"domain:{hostname}"
+        if resource_type in self.block_types and not domain_matches(hostname, self.allow_domains):
+            return f"type:{resource_type}"
+        return None
+
+    def _count(self, request):
+        """統計一個請求，返回是否應攔截"""
+        reason = self.block_reason(request.url, request.resource_type)
+        with self._lock:
+            if reason is None:
+                self.stats["allowed_requests"] += 1
+                return False
+            self.stats["blocked_requests"] += 1
+            by_reason = self.stats["blocked_by_reason"]
+            by_reason[reason] = by_reason.get(reason, 0) + 1
+            size = self.size_table.get(strip_query(request.url))
+            if size is None:
+                size = self.fallback_sizes.get(request.resource_type)
+                if size is None:
+                    self.stats["blocked_unknown_size"] += 1
+                    return True
+                self.stats["blocked_estimated_size"] += 1
+            self.stats["saved_bytes"] += size
+            return True
+
+    def _on_response(self, response):
+        """記錄已下載資源的大小，供之後估計節省的流量"""
+        try:
+            length = int(response.headers.get("content-length", ""))
+        except ValueError:
+            return
+        with self._lock:
+            self.stats["loaded_bytes"] += length
+            self.size_table[strip_query(response.url)] = length
+
+    def _handle_route(self, route):
+        if self._count(route.request):
+            route.abort("blockedbyclient")
+        else:
+            route.continue_()
+
+    async def _handle_route_async(self, route):
+        if self._count(route.request):
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    def install(self, context):
+        """在同步 API 的 BrowserContext 上啟用過濾"""
+        context.on("response", self._on_response)
+        if self.enabled:
+            context.route("**/*", self._handle_route)
+
+    async def install_async(self, context):
+        """在非同步 API 的 BrowserContext 上啟用過濾"""
+        context.on("response", self._on_response)
+        if self.enabled:
+            await context.route("**/*", self._handle_route_async)
+
+    def save_size_table(self):
+        """保存資源大小表"""
+        if not self.size_table_path:
+            return
+        with self._lock:
+            table = dict(self.size_table)
+        os.makedirs(os.path.dirname(self.size_table_path) or '.', exist_ok=True)
+        tmp_path = self.size_table_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(table, f)
+        os.replace(tmp_path, self.size_table_path)
+
+    def print_summary(self):
+        """列印攔截統計"""
+        stats = self.stats
+        total = stats["allowed_requests"] + stats["blocked_requests"]
+        print(f"\n請求過濾統計 ({'啟用' if self.enabled else '停用'}):")
+        print(f"  總請求數 {total}，攔截 {stats['blocked_requests']}，放行 {stats['allowed_requests']}")
+        print(f"  已下載 {stats['loaded_bytes'] / 1024 / 1024:.1f} MB，"
+              f"估計節省 {stats['saved_bytes'] / 1024 / 1024:.1f} MB"
+              f" ({stats['blocked_estimated_size']} 個被攔截的資源以類型的典型大小估計，"
+              f"{stats['blocked_unknown_size']} 個沒有大小記錄)")
+        if stats["blocked_estimated_size"] or stats["blocked_unknown_size"]:
+            print("  以 --no-block-requests 運行一次可以記錄這些資源的實際大小")
+        for reason, count in sorted(stats["blocked_by_reason"].items(), key=lambda item: item[1], reverse=True)[:10]:
+            print(f"    {reason:<40} {count:>5}")
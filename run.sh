@@ -32,11 +32,15 @@ sleep 60
 log_info "開始執行數據轉換..."
 /home/ben/.local/bin/uv run python gamma_converter.py --force --overwrite >> "$LOG_FILE" 2>&1;
 
-sleep 150
-
-# 步驟 3: 執行 extract_gamma_from_html.py (提取 gamma 數據)
+# 步驟 3: 提取 gamma 數據
+# gamma_watch.py 常駐時 gammacode 已即時更新，不需要再等待；仍然執行一次批次提取，
+# 補上 watcher 重啟期間或未以 --catch-up 啟動時錯過的文件並寫出提取報告
+# (已提取過的文件直接讀取快取，幾乎沒有成本)
+if pgrep -f "gamma_watch.py" > /dev/null; then
+    log_info "gamma_watch.py 運行中，批次提取只補上錯過的文件"
+fi
 log_info "開始執行 gamma 數據提取..."
-/home/ben/.local/bin/uv run python extract_gamma_from_html.py >> "$LOG_FILE" 2>&1
+/home/ben/.local/bin/uv run python extract_gamma_from_html.py --workers 0 >> "$LOG_FILE" 2>&1
 
 sleep 10
 
@@ -57,7 +61,7 @@ if [[ "${1:-}" == "help" || "${1:-}" == "-h" || "${1:-}" == "--help" ]]; then
     echo "處理流程："
     echo "  1. 數據收集 (playwright_record.py)"
     echo "  2. 數據轉換 (gamma_converter.py)"
-    echo "  3. Gamma 數據提取 (extract_gamma_from_html.py)"
+    echo "  3. Gamma 數據提取 (extract_gamma_from_html.py，或常駐的 gamma_watch.py)"
     echo "  4. 發送到 Discord (sending_discord.py)"
     echo ""
     echo "注意：Gamma 交易功能已移至 /home/ben/code/gex_trade 專案"
@@ -0,0 +1,150 @@
+"""
+爬蟲檢查點清單
+
+每個運行日期一個 manifest_<YYYYMMDD>.json，記錄每個股票已取得的產物
+(gamma_data: JSON/HTML、gamma_png、tvcode、smile_png) 的路徑、大小與 SHA-256，
+供 playwright_record --resume 只補抓缺少的產物。
+
+TV Code 寫入改為以股票代碼取代既有段落，重跑時不會重複附加；文件已被 gamma_converter
+轉為簡化格式時，新段落也先轉為簡化格式再寫入，同一文件不會混合兩種格式。
+"""
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from gamma_cache import file_sha256
+from gamma_converter import convert_to_short
+from level_codes import text_format
+
+ARTIFACTS = ("gamma_data", "gamma_png", "tvcode", "smile_png")
+
+def block_symbol(block):
+    """取得 TV Code 段落的股票代碼 (第一行冒號前的文字)"""
+    first_line = block.strip().split('\n', 1)[0]
+    if ':' not in first_line:
+        return None
+    return first_line.split(':', 1)[0].strip().upper() or None
+
+def read_tvcode_text(path):
+    """讀取 TV Code 文件，不存在時返回空字串"""
+    if not os.path.exists(path):
+        return ''
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def read_tvcode_blocks(path):
+    """讀取 TV Code 文件並拆成段落"""
+    return split_tvcode_blocks(read_tvcode_text(path))
+
+def split_tvcode_blocks(content):
+    """將 TV Code 文字拆成段落
+
+    原始格式以空行分隔每個股票；gamma_converter 轉換後的簡化格式每行一個股票，
+    兩種格式都拆成一個股票一個段落。格式以 level_codes.text_format 判斷，
+    與 write_tvcode_block 判斷文件格式的定義相同。
+    """
+    blocks = []
+    for block in content.split('\n\n'):
+        block = block.strip()
+        if not block:
+            continue
+        if text_format(block) == 'short':
+            blocks.extend(line.strip() for line in block.split('\n') if line.strip())
+        else:
+            blocks.append(block)
+    return blocks
+
+def write_tvcode_block(path, text):
+    """寫入一個股票的 TV Code 段落，已存在相同股票代碼的段落時取代它
+
+    Returns:
+        str: 段落的股票代碼，無法辨識時為 None (此時直接附加)
+    """
+    content = read_tvcode_text(path)
+    blocks = split_tvcode_blocks(content)
+
+    # 文件已是簡化格式時 (gamma_converter 已轉換)，新段落也轉為簡化格式，
+    # 否則混合的文件會被當成原始格式，下次轉換時簡化格式的行全部遺失
+    short_format = text_format(content) == 'short'
+    text = text.strip()
+    if short_format and text_format(text) == 'long':
+        text = convert_to_short(text)
+    symbol = block_symbol(text)
+
+    replaced = False
+    if symbol:
+        for i, block in enumerate(blocks):
+            if block_symbol(block) == symbol:
+                blocks[i] = text
+                replaced = True
+                break
+    if not replaced:
+        blocks.append(text)
+
+    separator = '\n' if short_format else '\n\n'
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(separator.join(blocks) + separator)
+    os.replace(tmp_path, path)
+    return symbol
+
+class ScrapeManifest:
+    """單一運行日期的產物清單，並行模式下多個工作執行緒共用"""
+
+    def __init__(self, path, date=None):
+        self.path = path
+        self.date = date or datetime.today().strftime('%Y%m%d')
+        self._lock = threading.Lock()
+        self.data = {'date': self.date, 'tickers': {}}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"讀取檢查點清單失敗，將重新建立: {str(e)}")
+
+    @classmethod
+    def for_date(cls, download_dir, date=None):
+        """取得下載目錄中指定日期 (預設今天) 的清單"""
+        date = date or datetime.today().strftime('%Y%m%d')
+        return cls(os.path.join(download_dir, "manifest", f"manifest_{date}.json"), date)
+
+    def has(self, ticker, artifact):
+        """產物是否已存在且與記錄的大小一致"""
+        with self._lock:
+            entry = self.data['tickers'].get(ticker, {}).get(artifact)
+        if not entry or not os.path.exists(entry['path']):
+            return False
+
+        if artifact == "tvcode":
+            # tvcode 文件會被 gamma_converter 改寫，只確認段落仍然存在
+            return any(block_symbol(block) == entry.get('symbol')
+                       for block in read_tvcode_blocks(entry['path']))
+        return os.path.getsize(entry['path']) == entry['size']
+
+    def missing(self, ticker):
+        """返回該股票尚未取得的產物"""
+        return [artifact for artifact in ARTIFACTS if not self.has(ticker, artifact)]
+
+    def record(self, ticker, artifact, path, text=None):
+        """記錄一個產物；text 不為 None 時 (tvcode) 以段落內容計算大小與雜湊"""
+        if text is not None:
+            content = text.strip().encode('utf-8')
+            entry = {'path': path, 'size': len(content), 'sha256': hashlib.sha256(content).hexdigest(),
+                     'symbol': block_symbol(text)}
+        else:
+            entry = {'path': path, 'size': os.path.getsize(path), 'sha256': file_sha256(path)}
+        entry['saved_at'] = datetime.now().isoformat(timespec='seconds')
+
+        with self._lock:
+            self.data['tickers'].setdefault(ticker, {})[artifact] = entry
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
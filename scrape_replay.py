@@ -0,0 +1,189 @@
+"""
+爬蟲離線重播
+
+以 Playwright 的 HAR 記錄重播平台頁面，讓 playwright_record 可以在沒有網路的機器上運行，
+用於比較等待方式、並行數與擷取方式的耗時差異。
+
+記錄：python playwright_record.py --record-har har/platform.zip
+重播：python playwright_record.py --replay-har har/platform.zip
+替身伺服器：python scrape_replay.py --har har/platform.zip --port 8765 --latency-ms 50
+
+HAR 路由 (route_from_har) 在瀏覽器內直接回應，沒有網路延遲；
+替身伺服器是真正的 HTTP 伺服器，可以加入固定延遲，較接近實際運行的耗時。
+"""
+
+import os
+import json
+import time
+import base64
+import zipfile
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, quote
+
+# 替身伺服器回應時不轉送的標頭 (內容已解壓縮，長度重新計算)
+SKIPPED_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+def har_context_options(har_settings):
+    """返回 browser.new_context 的 HAR 記錄參數，非記錄模式時為空"""
+    if not har_settings or har_settings.get("mode") != "record":
+        return {}
+    path = har_settings["path"]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # .zip 時回應內容保存為獨立文件，否則內嵌在 HAR 中
+    return {
+        "record_har_path": path,
+        "record_har_content": "attach" if path.endswith(".zip") else "embed"
+    }
+
+def install_har_routing(context, har_settings):
+    """在重播模式下將上下文的請求導向 HAR 或替身伺服器
+
+    必須在 RequestFilter.install 之後呼叫：後註冊的路由先處理，
+    HAR 中找不到的請求才交給請求過濾器。
+    """
+    if not har_settings or har_settings.get("mode") != "replay":
+        return
+    server = har_settings.get("server")
+    if server:
+        def forward(route):
+            response = route.fetch(url=f"{server}/?url={quote(route.request.url, safe='')}")
+            route.fulfill(response=response)
+        context.route("**/*", forward)
+    else:
+        context.route_from_har(har_settings["path"], not_found=har_settings.get("not_found", "abort"))
+
+def load_har_entries(har_path):
+    """讀取 HAR (.har 或 Playwright 的 .zip)，返回 {(method, url): [(post_data, status, headers, body), ...]}"""
+    archive = None
+    if har_path.endswith(".zip"):
+        archive = zipfile.ZipFile(har_path)
+        har_name = next(name for name in archive.namelist() if name.endswith(".har"))
+        har = json.loads(archive.read(har_name))
+    else:
+        with open(har_path, 'r', encoding='utf-8') as f:
+            har = json.load(f)
+
+    entries = {}
+    for entry in har["log"]["entries"]:
+        request, response = entry["request"], entry["response"]
+        if response.get("status", 0) <= 0:
+            # 記錄時被攔截或失敗的請求
+            continue
+        content = response.get("content", {})
+        if "_file" in content and archive is not None:
+            body = archive.read(content["_file"])
+        elif content.get("encoding") == "base64":
+            body = base64.b64decode(content.get("text", ""))
+        else:
+            body = content.get("text", "").encode("utf-8")
+        headers = [(header["name"], header["value"]) for header in response.get("headers", [])
+                   if header["name"].lower() not in SKIPPED_RESPONSE_HEADERS]
+        post_data = (request.get("postData") or {}).get("text", "")
+        key = (request["method"], request["url"].split("#", 1)[0])
+        entries.setdefault(key, []).append((post_data, response["status"], headers, body))
+
+    if archive is not None:
+        archive.close()
+    return entries
+
+class HarServer:
+    """以 HAR 內容回應請求的本機 HTTP 伺服器
+
+    請求格式為 /?url=<原始網址>；同一網址有多筆記錄時優先比對請求內容 (Dash 的回呼都是同一網址的 POST)，
+    否則依序輪流回應。
+    """
+
+    def __init__(self, har_path, host="127.0.0.1", port=0, latency_ms=0):
+        self.entries = load_har_entries(har_path)
+        self.latency = latency_ms / 1000.0
+        self.hits = 0
+        self.misses = 0
+        self._next = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def lookup(self, method, url, post_data):
+        """找出對應的記錄，找不到時返回 None"""
+        candidates = self.entries.get((method, url.split("#", 1)[0]))
+        with self._lock:
+            if not candidates:
+                self.misses += 1
+                return None
+            self.hits += 1
+            for candidate in candidates:
+                if post_data and candidate[0] == post_data:
+                    return candidate
+            index = self._next.get((method, url), 0)
+            self._next[(method, url)] = index + 1
+            return candidates[index % len(candidates)]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                url = parse_qs(urlsplit(self.path).query).get("url", [""])[0]
+                length = int(self.headers.get("Content-Length") or 0)
+                post_data = self.rfile.read(length).decode("utf-8", "replace") if length else ""
+                entry = server.lookup(self.command, url, post_data)
+                if server.latency:
+                    time.sleep(server.latency)
+                if entry is None:
+                    self.send_error(404, "not in HAR")
+                    return
+                _, status, headers, body = entry
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = do_OPTIONS = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """在背景執行緒中啟動伺服器"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="har-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='以 HAR 記錄啟動平台頁面的本機替身伺服器')
+    parser.add_argument('--har', required=True, help='playwright_record --record-har 記錄的 HAR 文件')
+    parser.add_argument('--host', default='127.0.0.1', help='監聽位址 (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='監聽埠 (default: 8765)')
+    parser.add_argument('--latency-ms', type=float, default=0, help='每個回應加入的延遲毫秒數 (default: 0)')
+    args = parser.parse_args()
+
+    server = HarServer(args.har, args.host, args.port, args.latency_ms)
+    print(f"已載入 {sum(len(v) for v in server.entries.values())} 筆記錄，替身伺服器運行於 {server.url}")
+    print(f"重播時使用: python playwright_record.py --replay-har {args.har} --har-server {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(f"命中 {server.hits} 次，未命中 {server.misses} 次")
+
+if __name__ == "__main__":
+    main()
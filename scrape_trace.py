@@ -0,0 +1,175 @@
+"""
+爬蟲步驟計時記錄
+
+記錄 playwright_record 每個股票每個步驟 (reload、選擇模型、HTML 下載、PNG 下載、TV Code、Smile)
+的開始/結束時間、結果與重試次數，每次運行輸出一個 JSONL 文件，
+並可統計最近 N 次運行各步驟的 p50/p95 耗時。
+"""
+
+import os
+import json
+import glob
+import math
+import time
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# 每個執行緒目前進行中的步驟 (巢狀步驟以堆疊保存)，供 note_retry 使用
+_active_steps = threading.local()
+
+def _step_stack():
+    if not hasattr(_active_steps, 'stack'):
+        _active_steps.stack = []
+    return _active_steps.stack
+
+def note_retry():
+    """將目前執行緒最內層進行中的步驟重試次數加一，沒有進行中的步驟時忽略"""
+    stack = _step_stack()
+    if stack:
+        stack[-1]['retries'] += 1
+
+def set_outcome(outcome, error=None):
+    """設定目前執行緒最內層進行中步驟的結果 (例如 timeout、fallback、skipped、avoided)"""
+    stack = _step_stack()
+    if stack:
+        stack[-1]['outcome'] = outcome
+        if error is not None:
+            stack[-1]['error'] = str(error)
+
+class StepTracer:
+    """記錄步驟耗時並寫入 JSONL 文件
+
+    trace_path 為 None 時只保留在記憶體中，不寫入文件。
+    並行模式下多個工作執行緒共用同一個 StepTracer。
+    """
+
+    def __init__(self, trace_path=None, run_id=None):
+        self.trace_path = trace_path
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.records = []
+        self._lock = threading.Lock()
+        self._file = None
+        if trace_path:
+            os.makedirs(os.path.dirname(trace_path) or '.', exist_ok=True)
+            self._file = open(trace_path, 'a', encoding='utf-8')
+
+    @contextmanager
+    def step(self, ticker, step):
+        """記錄一個步驟，步驟內拋出的異常會記錄為 error 並繼續拋出"""
+        record = {
+            'run_id': self.run_id,
+            'ticker': ticker,
+            'step': step,
+            'start': time.time(),
+            'outcome': 'ok',
+            'retries': 0
+        }
+        started = time.monotonic()
+        stack = _step_stack()
+        stack.append(record)
+        try:
+            yield record
+        except Exception as e:
+            record['outcome'] = 'error'
+            record['error'] = str(e)
+            raise
+        finally:
+            stack.pop()
+            record['end'] = time.time()
+            record['duration'] = round(time.monotonic() - started, 3)
+            self._write(record)
+
+    def _write(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self._file:
+                self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+def percentile(values, pct):
+    """以最近排名法計算百分位數"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(records):
+    """依步驟統計次數、p50/p95 耗時、失敗次數與重試次數"""
+    by_step = {}
+    for record in records:
+        by_step.setdefault(record['step'], []).append(record)
+
+    summary = []
+    for step, step_records in by_step.items():
+        durations = [r['duration'] for r in step_records]
+        summary.append({
+            'step': step,
+            'count': len(step_records),
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            'total': sum(durations),
+            'failures': sum(1 for r in step_records if r['outcome'] not in ('ok', 'skipped', 'avoided')),
+            'retries': sum(r.get('retries', 0) for r in step_records)
+        })
+    summary.sort(key=lambda item: item['total'], reverse=True)
+    return summary
+
+def print_summary(records, title="步驟耗時統計"):
+    """列印步驟耗時統計表"""
+    summary = summarize(records)
+    if not summary:
+        print("沒有可統計的步驟記錄")
+        return
+
+    print(f"\n{title}:")
+    print(f"  {'step':<14}{'count':>7}{'p50(s)':>9}{'p95(s)':>9}{'total(s)':>10}{'fail':>6}{'retry':>7}")
+    for item in summary:
+        print(f"  {item['step']:<14}{item['count']:>7}{item['p50']:>9.1f}{item['p95']:>9.1f}"
+              f"{item['total']:>10.1f}{item['failures']:>6}{item['retries']:>7}")
+
+def load_recent_runs(trace_dir, last=10):
+    """讀取最近 last 次運行的 JSONL 記錄"""
+    trace_files = sorted(glob.glob(os.path.join(trace_dir, "scrape_*.jsonl")))[-last:]
+    records = []
+    for trace_file in trace_files:
+        with open(trace_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"略過無法解析的記錄: {trace_file}")
+    return trace_files, records
+
+def main():
+    parser = argparse.ArgumentParser(description='統計 playwright_record 最近 N 次運行的步驟耗時')
+    parser.add_argument('--trace-dir', default='/home/ben/pCloudDrive/stock/GEX/GEX_file/trace',
+                        help='JSONL 記錄目錄 (default: GEX_file/trace)')
+    parser.add_argument('--last', type=int, default=10, help='統計最近幾次運行 (default: 10)')
+    parser.add_argument('--ticker', help='只統計指定的股票')
+    args = parser.parse_args()
+
+    trace_files, records = load_recent_runs(args.trace_dir, args.last)
+    if not trace_files:
+        print(f"在 {args.trace_dir} 中找不到任何記錄")
+        return
+
+    if args.ticker:
+        records = [r for r in records if r['ticker'].lower() == args.ticker.lower()]
+
+    print(f"統計最近 {len(trace_files)} 次運行 ({os.path.basename(trace_files[0])} ~ {os.path.basename(trace_files[-1])})")
+    print_summary(records)
+
+if __name__ == "__main__":
+    main()